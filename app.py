@@ -2,36 +2,158 @@ import gevent.monkey
 gevent.monkey.patch_all()
 import os
 import uuid
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort
+import time
+import math
+import base64
+import hashlib
+import atexit
+import queue
+import shutil
+import mimetypes
+import threading
+import re
+import subprocess
+import sqlite3
+from collections import OrderedDict
+from functools import partial, wraps
+import click
+from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort, g, session, send_file, Response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin, login_user, LoginManager, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from sqlalchemy.sql import func, or_, and_
-from flask_socketio import SocketIO, emit, join_room
+from werkzeug.exceptions import ClientDisconnected
+from sqlalchemy import text, select, update, delete, tuple_, event, type_coerce, String, union_all, cast, literal, create_engine, MetaData
+from sqlalchemy.orm import joinedload, contains_eager, aliased
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import func, or_, and_, case
+from flask_socketio import SocketIO, emit, join_room, leave_room
+try:
+    import numpy as np
+except ImportError:     # optional: trending recompute falls back to a pure-Python loop
+    np = None
+try:
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()     # psycopg2 waits on the gevent hub instead of blocking the whole worker
+except ImportError:
+    pass
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'vetrico-v27-dev')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///vetrico.db'
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///vetrico.db')      # geliştirme: instance/vetrico.db
+for _scheme in ('postgres://', 'postgresql://'):      # Render/Heroku biçimi; sürücü psycogreen'in yamaladığı psycopg2
+    if DATABASE_URL.startswith(_scheme): DATABASE_URL = 'postgresql+psycopg2://' + DATABASE_URL[len(_scheme):]
+DB_POOL_SIZE        = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW     = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT     = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))      # ms
+SQLITE_SYNCHRONOUS  = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')        # WAL ile NORMAL güvenli ve hızlı
+
+def engine_options(url):
+    """Server backends get a pool sized per gevent worker: greenlets queue for a connection (pool_timeout)
+    rather than each opening one. Keep workers × (DB_POOL_SIZE + DB_MAX_OVERFLOW) below the server's
+    max_connections. SQLite keeps SQLAlchemy's default pool and only gets the busy timeout."""
+    if not url.startswith('sqlite'):
+        return {'pool_size': DB_POOL_SIZE, 'max_overflow': DB_MAX_OVERFLOW, 'pool_timeout': DB_POOL_TIMEOUT,
+                'pool_pre_ping': True, 'pool_recycle': 1800}
+    if url in ('sqlite://', 'sqlite:///:memory:'): return {}
+    return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT / 1000}}
+
+app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(DATABASE_URL)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 200 MB
+app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 200 MB (tek istek; parçalı yüklemede tek parça)
+app.config['USE_X_SENDFILE'] = os.environ.get('MEDIA_MODE') == 'x-sendfile'
 
 UPLOAD_FOLDER = os.path.join('static', 'uploads')
 AVATAR_FOLDER = os.path.join('static', 'avatars')
-for _f in [UPLOAD_FOLDER, AVATAR_FOLDER]:
+THUMB_FOLDER  = os.path.join('static', 'thumbs')
+HLS_FOLDER    = os.path.join('static', 'hls')
+for _f in [UPLOAD_FOLDER, AVATAR_FOLDER, THUMB_FOLDER, HLS_FOLDER]:
     os.makedirs(_f, exist_ok=True)
 
 ALLOWED_VIDEO = {'mp4', 'mov', 'webm'}
 ALLOWED_IMG   = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
 BAD_WORDS = []          # istediğin kelimeleri buraya ekle
 
-online_users = {}       # {user_id: set(session_ids)}
+local_sockets = {}      # bu süreçteki bağlantılar {sid: user_id}; ortak durum `presence`ta
+
+VIEW_FLUSH_SECONDS = float(os.environ.get('VIEW_FLUSH_SECONDS', 5))
+VIEW_FLUSH_EVENTS  = int(os.environ.get('VIEW_FLUSH_EVENTS', 500))
+VIEW_DEDUP_SECONDS = int(os.environ.get('VIEW_DEDUP_SECONDS', 60))   # 0 = her oynatma sayılır
+STORIES_LIMIT      = int(os.environ.get('STORIES_LIMIT', 20))
+CHAT_PAGE_SIZE     = 50
+NOTIF_COUNT_TTL    = int(os.environ.get('NOTIF_COUNT_TTL', 300))
+NOTIF_RETENTION_DAYS = int(os.environ.get('NOTIF_RETENTION_DAYS', 30))
+NOTIF_SAMPLE_SIZE    = 3
+NOTIF_ACTOR_CAP      = 100    # distinct actors remembered per round; past it the count reads "99+"
+CACHE_URL          = os.environ.get('CACHE_URL')
+FFMPEG_BIN         = os.environ.get('FFMPEG_BIN') or shutil.which('ffmpeg')
+MEDIA_MODE         = os.environ.get('MEDIA_MODE', 'sendfile')   # sendfile / x-accel / x-sendfile
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/_media/')  # nginx internal location
+MEDIA_MAX_AGE      = 365 * 24 * 3600          # redis://… → paylaşımlı sayaçlar
+STORIES_TTL        = int(os.environ.get('STORIES_TTL', 120))
+IDENTITY_TTL       = int(os.environ.get('IDENTITY_TTL', 30))   # yedek süre; Redis varsa iptal tüm worker'lara anında yayılır
+PAGE_CACHE_TTL     = int(os.environ.get('PAGE_CACHE_TTL', 10))        # anonim sayfa önbelleği; 0 → kapalı
+PAGE_CACHE_BYTES   = int(os.environ.get('PAGE_CACHE_MB', 64)) * 1024 * 1024
+PAGE_CACHE_WAIT    = 5                        # aynı sayfayı çizen isteği en fazla bu kadar sn bekle
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')     # redis://… → worker/sunucular arası yayın
+PRESENCE_URL       = os.environ.get('PRESENCE_URL') or SOCKETIO_MESSAGE_QUEUE or CACHE_URL
+PRESENCE_TTL       = int(os.environ.get('PRESENCE_TTL', 60))          # kalp atışı gelmeyen bağlantı bu sürede düşer
+REACTION_TICK      = float(os.environ.get('REACTION_TICK', 0.1))      # tepkiler bu aralıkla oda başına tek paket
+REACTION_RATE      = (8, 16)                  # bağlantı başına saniyede tepki, patlama sınırı
+TYPING_REFRESH     = 3                        # "yazıyor" en fazla bu kadar saniyede bir iletilir
+CHAT_BATCH_MAX     = 200                      # tek işlemde yazılan en fazla mesaj
+CHAT_BATCH_WAIT    = float(os.environ.get('CHAT_BATCH_WAIT', 0.005))  # ilk mesajdan sonra paket için bekleme
+CHAT_ACK_TIMEOUT   = 10
+CHAT_REPLAY_LIMIT  = 200                      # bağlanınca tekrar gönderilen teslim edilmemiş mesaj
+UPLOAD_MAX_BYTES   = int(os.environ.get('UPLOAD_MAX_BYTES', 200 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE  = 4 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 3600                # yarım kalan yüklemeler bu süreden sonra silinir
+TRANSCODE_WORKERS  = int(os.environ.get('TRANSCODE_WORKERS', 1))   # 0 → sadece `flask transcode-worker` süreçleri
+TRANSCODE_TIMEOUT  = int(os.environ.get('TRANSCODE_TIMEOUT', 1800))
+TRANSCODE_MAX_ATTEMPTS = 3
+# (kısa kenar, video kbps) – kaynaktan büyük basamaklar atlanır
+HLS_LADDER         = [(1080, 5000), (720, 2800), (480, 1400), (360, 800)]
+SEARCH_PAGE_SIZE   = 20
+TRENDING_HALF_LIFE = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 24))
+TRENDING_INTERVAL  = int(os.environ.get('TRENDING_INTERVAL', 60))
+TRENDING_WINDOW_DAYS = 7                      # daha eski videolar artık yükselemez; sadece tam hesaplamada
+TREND_WEIGHTS      = (1.0, 4.0, 6.0, 8.0)     # izlenme, beğeni, yorum, kaydetme
+TREND_EPOCH        = datetime(2020, 1, 1)
+ADMIN_STATS_INTERVAL = int(os.environ.get('ADMIN_STATS_INTERVAL', 60))   # dashboard sayıları bu aralıkla yeniden sayılır
+ADMIN_PAGE_SIZE    = 30
+PURGE_BATCH        = int(os.environ.get('PURGE_BATCH', 500))   # silme işinin tek işlemde kaldırdığı en fazla satır
+PURGE_STALE        = 300                      # bu kadar sn kalp atışı gelmeyen 'running' iş sahipsiz sayılır
+PURGE_LOG_EVERY    = 30                       # AdminLog'a ilerleme satırı aralığı (sn)
+PURGE_MAX_ATTEMPTS = 5
+PASSWORD_METHOD    = os.environ.get('PASSWORD_METHOD', 'scrypt')   # werkzeug yöntemi; eski hash'ler girişte yükseltilir
+HASH_WORKERS       = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 2))   # 0 → istek greenlet'inde hesapla
+HASH_QUEUE         = int(os.environ.get('HASH_QUEUE', 64))        # bekleyen hash işi bundan fazlaysa 503
+HASH_TIMEOUT       = float(os.environ.get('HASH_TIMEOUT', 5))
+LOGIN_WINDOW       = int(os.environ.get('LOGIN_WINDOW', 300))     # deneme sayaçlarının süresi (sn)
+LOGIN_IP_LIMIT     = int(os.environ.get('LOGIN_IP_LIMIT', 60))    # pencere başına IP'den giriş/kayıt denemesi; 0 → sınırsız
+LOGIN_USER_LIMIT   = int(os.environ.get('LOGIN_USER_LIMIT', 5))   # pencere başına kullanıcı adına hatalı şifre
 
 db           = SQLAlchemy(app)
+
+def _sqlite_pragmas(dbapi_conn, _):
+    """WAL lets readers run during a write; busy_timeout makes a second writer wait instead of failing."""
+    if not isinstance(dbapi_conn, sqlite3.Connection): return
+    cur = dbapi_conn.cursor()
+    cur.execute('PRAGMA journal_mode=WAL')
+    cur.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+    cur.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+    cur.close()
+
+with app.app_context():       # only the app's own engine – copy-db's source stays as it is
+    event.listen(db.engine, 'connect', _sqlite_pragmas)
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
-socketio     = SocketIO(app, cors_allowed_origins='*', manage_session=False)
+socketio     = SocketIO(app, cors_allowed_origins='*', manage_session=False,
+                        message_queue=SOCKETIO_MESSAGE_QUEUE)   # None → tek süreç, bellek içi
 
 # ─────────────────────────── BADGES ───────────────────────────
 BADGES = {
@@ -94,6 +216,15 @@ comment_likes = db.Table('comment_likes',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
     db.Column('comment_id', db.Integer, db.ForeignKey('comment.id', ondelete='CASCADE'))
 )
+# viewer-state / toggle lookups are always "this user × these ids"
+db.Index('ix_followers_pair',     followers.c.follower_id, followers.c.followed_id)
+db.Index('ix_likes_user_video',   likes.c.user_id, likes.c.video_id)
+db.Index('ix_bookmarks_user_video', bookmarks.c.user_id, bookmarks.c.video_id)
+db.Index('ix_comment_likes_user', comment_likes.c.user_id, comment_likes.c.comment_id)
+db.Index('ix_followers_followed', followers.c.followed_id, followers.c.follower_id)
+db.Index('ix_likes_video',        likes.c.video_id)
+db.Index('ix_bookmarks_video',    bookmarks.c.video_id)
+db.Index('ix_comment_likes_comment', comment_likes.c.comment_id)
 
 class User(UserMixin, db.Model):
     id                  = db.Column(db.Integer, primary_key=True)
@@ -111,6 +242,12 @@ class User(UserMixin, db.Model):
     perm_delete_video   = db.Column(db.Boolean, default=False)
     perm_verify_user    = db.Column(db.Boolean, default=False)
     created_at          = db.Column(db.DateTime, default=datetime.utcnow)
+    # denormalized counters – see bump() / reconcile-counters
+    follower_count      = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    following_count     = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    video_count         = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    deleted_at          = db.Column(db.DateTime, nullable=True)   # dolu → gizli, PurgeJob arka planda siliyor
+    __table_args__ = (db.Index('ix_user_verification', 'verification_status', 'id'),)
 
     followed = db.relationship(
         'User', secondary=followers,
@@ -126,9 +263,13 @@ class User(UserMixin, db.Model):
     def is_following(self, user):
         return self.followed.filter(followers.c.followed_id == user.id).count() > 0
     def follow(self, user):
-        if not self.is_following(user): self.followed.append(user)
+        if not self.is_following(user):
+            self.followed.append(user)
+            bump(User, self.id, following_count=1); bump(User, user.id, follower_count=1)
     def unfollow(self, user):
-        if self.is_following(user): self.followed.remove(user)
+        if self.is_following(user):
+            self.followed.remove(user)
+            bump(User, self.id, following_count=-1); bump(User, user.id, follower_count=-1)
 
 class Video(db.Model):
     id                = db.Column(db.Integer, primary_key=True)
@@ -139,10 +280,30 @@ class Video(db.Model):
     views             = db.Column(db.Integer, default=0)
     created_at        = db.Column(db.DateTime, default=datetime.utcnow)
     moderation_status = db.Column(db.String(20), default='approved')
+    like_count        = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    comment_count     = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    poster            = db.Column(db.String(300), nullable=True)   # /static/thumbs/<uuid>.jpg
+    preview           = db.Column(db.String(300), nullable=True)   # 3 sn animasyonlu .webp
+    content_hash      = db.Column(db.String(64), nullable=True, index=True)   # sha256, dedup
+    hls               = db.Column(db.String(300), nullable=True)   # /static/hls/<stem>_master.m3u8
+    processing        = db.Column(db.String(20), nullable=True)    # queued / running / ready / failed
+    trend_score       = db.Column(db.Float, default=lambda: trend_base(datetime.utcnow()),
+                                  server_default='0', nullable=False)
     user      = db.relationship('User', backref='videos')
     liked_by  = db.relationship('User', secondary=likes, backref=db.backref('liked_videos', lazy='dynamic'))
     comments  = db.relationship('Comment', backref='video', cascade='all, delete-orphan', lazy='dynamic')
     reports   = db.relationship('Report',  backref='video', cascade='all, delete-orphan', lazy='dynamic')
+    transcode_jobs = db.relationship('TranscodeJob', backref='video', cascade='all, delete-orphan', lazy='dynamic')
+    __table_args__ = (
+        # keyset feed: WHERE status[, category] AND (created_at, id) < cursor ORDER BY created_at, id
+        db.Index('ix_video_feed', 'moderation_status', 'category', 'created_at', 'id'),
+        db.Index('ix_video_feed_all', 'moderation_status', 'created_at', 'id'),
+        # stories: newest approved video of one creator is a single index probe
+        db.Index('ix_video_user_recent', 'user_id', 'moderation_status', 'created_at', 'id'),
+        # trending tab: same keyset shape, ordered by the stored score
+        db.Index('ix_video_trending', 'moderation_status', 'category', 'trend_score', 'id'),
+        db.Index('ix_video_trending_all', 'moderation_status', 'trend_score', 'id'),
+    )
 
 class Comment(db.Model):
     id                  = db.Column(db.Integer, primary_key=True)
@@ -152,12 +313,20 @@ class Comment(db.Model):
     parent_id           = db.Column(db.Integer, db.ForeignKey('comment.id', ondelete='CASCADE'), nullable=True)
     is_liked_by_creator = db.Column(db.Boolean, default=False)
     created_at          = db.Column(db.DateTime, default=datetime.utcnow)
+    like_count          = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    reply_count         = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     user     = db.relationship('User')
     replies  = db.relationship('Comment',
         backref=db.backref('parent', remote_side=[id]),
         cascade='all, delete-orphan', lazy='dynamic')
     liked_by = db.relationship('User', secondary=comment_likes,
         backref=db.backref('liked_comments', lazy='dynamic'))
+    __table_args__ = (
+        # top-level page: WHERE video_id AND parent_id IS NULL AND (created_at, id) < cursor
+        db.Index('ix_comment_thread', 'video_id', 'parent_id', 'created_at', 'id'),
+        db.Index('ix_comment_replies', 'parent_id', 'created_at', 'id'),
+        db.Index('ix_comment_user', 'user_id', 'id'),
+    )
 
 class Notification(db.Model):
     id           = db.Column(db.Integer, primary_key=True)
@@ -168,7 +337,28 @@ class Notification(db.Model):
     amount       = db.Column(db.Integer, nullable=True)
     is_read      = db.Column(db.Boolean, default=False)
     timestamp    = db.Column(db.DateTime, default=datetime.utcnow)
+    # coalesced like/comment/follow: sender_id is the latest actor
+    actor_count  = db.Column(db.Integer, default=1, server_default='1', nullable=False)   # capped at NOTIF_ACTOR_CAP
+    actor_sample = db.Column(db.Text, default='')   # "12,7,3" – newest first, the round's actors up to the cap
     sender       = db.relationship('User', foreign_keys=[sender_id])
+    __table_args__ = (
+        db.Index('ix_notification_inbox', 'recipient_id', 'is_read', 'timestamp'),
+        db.Index('ix_notification_group', 'recipient_id', 'type', 'post_id'),
+        db.Index('ix_notification_sender', 'sender_id'),
+        db.Index('ix_notification_post', 'post_id'),
+    )
+
+    @property
+    def actor_ids(self):
+        return [int(x) for x in (self.actor_sample or '').split(',') if x] or [self.sender_id]
+
+    @property
+    def sample_ids(self):      # avatars stacked behind the latest actor
+        return self.actor_ids[1:NOTIF_SAMPLE_SIZE]
+
+    @property
+    def actors_capped(self):
+        return self.actor_count >= NOTIF_ACTOR_CAP
 
 class Message(db.Model):
     id           = db.Column(db.Integer, primary_key=True)
@@ -177,6 +367,78 @@ class Message(db.Model):
     body         = db.Column(db.String(1000))
     timestamp    = db.Column(db.DateTime, default=datetime.utcnow)
     is_read      = db.Column(db.Boolean, default=False)
+    delivered    = db.Column(db.Boolean, default=False, server_default='1', nullable=False)  # eski mesajlar teslim sayılır
+    __table_args__ = (
+        db.Index('ix_message_pair_time', 'sender_id', 'recipient_id', 'timestamp'),
+        db.Index('ix_message_unread', 'recipient_id', 'sender_id', 'is_read'),
+        db.Index('ix_message_undelivered', 'recipient_id', 'delivered', 'id'),
+    )
+
+class Conversation(db.Model):
+    """Inbox summary for one user pair (user_a_id < user_b_id), kept current on every send."""
+    id              = db.Column(db.Integer, primary_key=True)
+    user_a_id       = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_b_id       = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_sender_id  = db.Column(db.Integer, nullable=True)
+    last_preview    = db.Column(db.String(120), default='')
+    last_at         = db.Column(db.DateTime, default=datetime.utcnow)
+    unread_a        = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    unread_b        = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('user_a_id', 'user_b_id', name='uq_conversation_pair'),
+        db.Index('ix_conversation_a_recent', 'user_a_id', 'last_at'),
+        db.Index('ix_conversation_b_recent', 'user_b_id', 'last_at'),
+    )
+
+class UploadSession(db.Model):
+    """Resumable upload in progress; bytes land in static/uploads/<id>.<ext>.part."""
+    id         = db.Column(db.String(32), primary_key=True)
+    user_id    = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    ext        = db.Column(db.String(8), nullable=False)
+    size       = db.Column(db.BigInteger, nullable=False)
+    received   = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    @property
+    def path(self): return os.path.join(UPLOAD_FOLDER, f'{self.id}.{self.ext}.part')
+
+class TranscodeJob(db.Model):
+    """One HLS encode of a video. Claimed with a conditional UPDATE, so any number of
+    worker greenlets/processes can share the table."""
+    id          = db.Column(db.Integer, primary_key=True)
+    video_id    = db.Column(db.Integer, db.ForeignKey('video.id', ondelete='CASCADE'), nullable=False)
+    state       = db.Column(db.String(10), default='queued', nullable=False)   # queued/running/done/failed
+    attempts    = db.Column(db.Integer, default=0, nullable=False)
+    run_after   = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at  = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at  = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    worker      = db.Column(db.String(64), nullable=True)
+    last_error  = db.Column(db.String(500), nullable=True)
+    __table_args__ = (
+        db.Index('ix_transcode_job_claim', 'state', 'run_after', 'id'),
+        db.Index('ix_transcode_job_video', 'video_id', 'state'),
+    )
+
+class PurgeJob(db.Model):
+    """Background removal of a tombstoned user or video (see PURGE); taken with claim_job like TranscodeJob."""
+    id           = db.Column(db.Integer, primary_key=True)
+    kind         = db.Column(db.String(10), nullable=False)      # user / video
+    target_id    = db.Column(db.Integer, nullable=False)
+    label        = db.Column(db.String(200), default='')        # "@kullanıcı" – satır gidince de loglarda okunur
+    admin_id     = db.Column(db.Integer, nullable=True)          # None → sahibi sildi, AdminLog'a yazılmaz
+    state        = db.Column(db.String(10), default='queued', nullable=False)   # queued/running/done/failed
+    attempts     = db.Column(db.Integer, default=0, nullable=False)
+    run_after    = db.Column(db.DateTime, default=datetime.utcnow)
+    step         = db.Column(db.String(30), nullable=True)
+    removed      = db.Column(db.Integer, default=0, nullable=False)
+    created_at   = db.Column(db.DateTime, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at  = db.Column(db.DateTime, nullable=True)
+    worker       = db.Column(db.String(64), nullable=True)
+    last_error   = db.Column(db.String(500), nullable=True)
+    __table_args__ = (db.Index('ix_purge_job_claim', 'state', 'id'),)
 
 class Report(db.Model):
     id          = db.Column(db.Integer, primary_key=True)
@@ -185,98 +447,1919 @@ class Report(db.Model):
     reason      = db.Column(db.String(200))
     timestamp   = db.Column(db.DateTime, default=datetime.utcnow)
     reporter    = db.relationship('User')
+    __table_args__ = (
+        db.Index('ix_report_video', 'video_id', 'reporter_id'),
+        db.Index('ix_report_time', 'timestamp'),
+        db.Index('ix_report_reporter', 'reporter_id'),
+    )
 
 class AdminLog(db.Model):
     id          = db.Column(db.Integer, primary_key=True)
     admin_id    = db.Column(db.Integer, db.ForeignKey('user.id'))
-    action_type = db.Column(db.String(30))   # ban / verify / delete_video / make_admin / perm_change
+    action_type = db.Column(db.String(30))   # ban / verify / delete_video / make_admin / perm_change / purge
     description = db.Column(db.String(300))
     timestamp   = db.Column(db.DateTime, default=datetime.utcnow)
     admin       = db.relationship('User', foreign_keys=[admin_id])
+    __table_args__ = (db.Index('ix_admin_log_time', 'timestamp'),)
+
+class AdminStat(db.Model):
+    """Dashboard sayıları; admin_stats job'ı yeniden sayar, admin paneli sadece okur."""
+    key        = db.Column(db.String(40), primary_key=True)
+    value      = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 def add_log(action_type, description):
     """Helper – call inside any admin route."""
     db.session.add(AdminLog(admin_id=current_user.id,
                             action_type=action_type, description=description))
 
+class Identity:
+    """Read-only snapshot of the logged-in user – all current_user needs on a page load or socket
+    event, served from identity_cache instead of a User row. Writes and anything else go through
+    db.session.get(User, current_user.id)."""
+    FLAGS = ('is_admin', 'is_super_admin', 'perm_ban_user', 'perm_delete_video', 'perm_verify_user')
+    __slots__ = ('id', 'username', 'avatar', 'badge_key', 'is_verified', 'flags')
+    is_authenticated, is_active, is_anonymous = True, True, False
+
+    def __init__(self, u):
+        for k in self.__slots__[:-1]: object.__setattr__(self, k, getattr(u, k))
+        object.__setattr__(self, 'flags', sum(1 << i for i, f in enumerate(self.FLAGS) if getattr(u, f)))
+    def __setattr__(self, k, v): raise AttributeError(f'Identity salt okunur: {k}')
+    def get_id(self): return str(self.id)
+    def is_following(self, user):
+        return db.session.execute(select(followers.c.followed_id).where(
+            followers.c.follower_id == self.id, followers.c.followed_id == user.id)).first() is not None
+
+for _i, _f in enumerate(Identity.FLAGS):
+    setattr(Identity, _f, property(lambda self, bit=1 << _i: bool(self.flags & bit)))
+
 @login_manager.user_loader
-def load_user(uid): return User.query.get(int(uid))
+def load_user(uid):
+    uid = int(uid)
+    ident = identity_cache.get(uid) if identity_bus.live else None
+    if ident is None:
+        gen = identity_bus.gen
+        u = db.session.get(User, uid)
+        if u is None or u.deleted_at is not None: return None
+        ident = Identity(u)
+        if identity_bus.live and identity_bus.gen == gen: identity_cache.set(uid, ident)
+    return ident
+
+# ─────────────────────────── METRICS ───────────────────────────
+class Metrics:
+    """In-process counters, gauges and timings; read via /admin/api/metrics."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters, self.gauges, self.timings, self.labeled = {}, {}, {}, {}
+    def incr(self, name, n=1):
+        with self._lock: self.counters[name] = self.counters.get(name, 0) + n
+    def incr_labeled(self, name, label, n=1):
+        """Per-key counter (e.g. bytes per video); snapshot shows the top 20."""
+        with self._lock:
+            d = self.labeled.setdefault(name, {}); d[label] = d.get(label, 0) + n
+    def gauge(self, name, value):
+        self.gauges[name] = value
+    def observe(self, name, seconds):
+        with self._lock:
+            t = self.timings.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            ms = seconds * 1000
+            t['count'] += 1; t['total_ms'] += ms; t['max_ms'] = max(t['max_ms'], ms)
+    def snapshot(self):
+        with self._lock:
+            return {'counters': dict(self.counters), 'gauges': dict(self.gauges),
+                    'top': {k: sorted(v.items(), key=lambda kv: -kv[1])[:20] for k, v in self.labeled.items()},
+                    'timings': {k: dict(v, avg_ms=v['total_ms'] / v['count'])
+                                for k, v in self.timings.items()}}
+
+metrics = Metrics()
+
+# ─────────────────────────── CACHE ───────────────────────────
+class TTLCache:
+    """Bounded in-process LRU with per-entry expiry. Values should be plain data, not ORM objects."""
+    def __init__(self, maxsize=10000, ttl=60, name=None):
+        self.maxsize, self.ttl, self.name = maxsize, ttl, name
+        self._lock = threading.Lock()
+        self._data = OrderedDict()   # {key: (expires_at, value)}
+
+    def get(self, key, default=None):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None or hit[0] <= time.monotonic():
+                if hit is not None: del self._data[key]
+                if self.name: metrics.incr(f'{self.name}.miss')
+                return default
+            self._data.move_to_end(key)
+        if self.name: metrics.incr(f'{self.name}.hit')
+        return hit[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def incr(self, key, n=1):
+        """Adjust a cached int in place; a missing/expired key stays missing."""
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None or hit[0] <= time.monotonic(): return None
+            self._data[key] = (hit[0], hit[1] + n)
+            return hit[1] + n
+
+    def delete(self, key):
+        with self._lock: self._data.pop(key, None)
+
+    def delete_where(self, pred):
+        """Drop every entry whose value matches pred(value)."""
+        with self._lock:
+            for k in [k for k, (_, v) in self._data.items() if pred(v)]: del self._data[k]
+
+    def clear(self):
+        with self._lock: self._data.clear()
+
+class RedisCache:
+    """TTLCache-compatible backend on Redis, for counters shared between workers (optional dep)."""
+    def __init__(self, url, ttl=60, prefix='vetrico:'):
+        import redis
+        self.r, self.ttl, self.prefix = redis.Redis.from_url(url), ttl, prefix
+    def get(self, key, default=None):
+        v = self.r.get(f'{self.prefix}{key}')
+        return default if v is None else int(v)
+    def set(self, key, value, ttl=None):
+        self.r.set(f'{self.prefix}{key}', value, ex=ttl or self.ttl)
+    def incr(self, key, n=1):
+        k = f'{self.prefix}{key}'
+        # only bump keys that exist, like TTLCache.incr
+        return self.r.eval("if redis.call('EXISTS', KEYS[1]) == 1 then return redis.call('INCRBY', KEYS[1], ARGV[1]) end",
+                           1, k, n)
+    def delete(self, key):
+        self.r.delete(f'{self.prefix}{key}')
+
+class PageCache:
+    """Rendered responses for anonymous visitors: LRU bounded by body bytes, per-entry TTL, tags
+    for invalidation and single-flight rendering (a burst of misses on one key renders once,
+    the rest wait for it). Per process – other workers only see an invalidation via the TTL."""
+    def __init__(self, max_bytes, name='page_cache'):
+        self.max_bytes, self.name, self.bytes, self.gen = max_bytes, name, 0, 0
+        self._lock = threading.Lock()
+        self._data = OrderedDict()      # {key: (expires_at, tags, (status, headers, body))}
+        self._inflight = {}             # {key: Event}
+
+    def get(self, key):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None: return None
+            if hit[0] <= time.monotonic(): self._drop(key); return None
+            self._data.move_to_end(key)
+            return hit[2]
+
+    def set(self, key, entry, ttl, tags, gen):
+        with self._lock:
+            if gen != self.gen: return      # bir invalidate çizim sırasında geldi; bayat sonucu saklama
+            if key in self._data: self._drop(key)
+            self._data[key] = (time.monotonic() + ttl, frozenset(tags), entry)
+            self.bytes += len(entry[2])
+            while self.bytes > self.max_bytes and self._data:
+                self._drop(next(iter(self._data))); metrics.incr(f'{self.name}.evicted')
+            metrics.gauge(f'{self.name}.bytes', self.bytes); metrics.gauge(f'{self.name}.entries', len(self._data))
+
+    def _drop(self, key):
+        self.bytes -= len(self._data.pop(key)[2][2])
+
+    def invalidate(self, *tags):
+        tags = set(tags)
+        with self._lock:
+            self.gen += 1
+            for k in [k for k, (_, t, _) in self._data.items() if t & tags]: self._drop(k)
+        metrics.incr(f'{self.name}.invalidations')
+
+    def clear(self):
+        with self._lock: self.gen += 1; self._data.clear(); self.bytes = 0
+
+    def fetch(self, key, render, ttl):
+        """→ (response or None, entry, 'HIT'|'MISS'). render() → (response, entry or None if the
+        response must not be shared, tags); on a hit only the stored entry comes back."""
+        entry = self.get(key)
+        if entry: metrics.incr(f'{self.name}.hit'); return None, entry, 'HIT'
+        with self._lock:
+            ev = self._inflight.get(key)
+            leader = ev is None
+            if leader: ev = self._inflight[key] = threading.Event()
+            gen = self.gen
+        if not leader:
+            metrics.incr(f'{self.name}.coalesced')
+            ev.wait(PAGE_CACHE_WAIT)
+            entry = self.get(key)
+            if entry: metrics.incr(f'{self.name}.hit'); return None, entry, 'HIT'
+            return render()[0], None, 'MISS'    # lider çizemedi ya da saklamadı – kendimiz çizeriz
+        metrics.incr(f'{self.name}.miss')
+        try:
+            resp, entry, tags = render()
+            if entry: self.set(key, entry, ttl, tags, gen)
+            return resp, entry, 'MISS'
+        finally:
+            with self._lock: self._inflight.pop(key, None)
+            ev.set()
+
+class LocalPresence:
+    """Single-process presence: {user_id: {sid: expires_at}}."""
+    def __init__(self, ttl):
+        self.ttl, self._lock, self._conns = ttl, threading.Lock(), {}
+    def touch(self, conns):
+        """Mark {user_id: [sid, …]} alive for another `ttl` seconds."""
+        exp = time.time() + self.ttl
+        with self._lock:
+            for uid, sids in conns.items():
+                self._conns.setdefault(uid, {}).update(dict.fromkeys(sids, exp))
+    def drop(self, uid, sid):
+        """Forget one connection; True when the user has no live connection left anywhere."""
+        now = time.time()
+        with self._lock:
+            live = {k: e for k, e in self._conns.get(uid, {}).items() if k != sid and e > now}
+            if live: self._conns[uid] = live
+            else: self._conns.pop(uid, None)
+            return not live
+    def online(self, uids):
+        now = time.time()
+        with self._lock:
+            return {u for u in uids if any(e > now for e in self._conns.get(u, {}).values())}
+
+class RedisPresence:
+    """Presence shared by every worker/node: one sorted set per user, member = sid, score = expiry.
+    A worker that dies stops refreshing its sids and they age out after `ttl`."""
+    def __init__(self, url, ttl, prefix='vetrico:presence:'):
+        import redis
+        self.r, self.ttl, self.prefix = redis.Redis.from_url(url), ttl, prefix
+    def touch(self, conns):
+        exp, p = time.time() + self.ttl, self.r.pipeline(transaction=False)
+        for uid, sids in conns.items():
+            p.zadd(f'{self.prefix}{uid}', dict.fromkeys(sids, exp)); p.expire(f'{self.prefix}{uid}', self.ttl)
+        p.execute()
+    def drop(self, uid, sid):
+        k, p = f'{self.prefix}{uid}', self.r.pipeline()
+        p.zrem(k, sid); p.zremrangebyscore(k, '-inf', time.time()); p.zcard(k)
+        return p.execute()[-1] == 0
+    def online(self, uids):
+        uids, now = list(uids), time.time()
+        p = self.r.pipeline(transaction=False)
+        for u in uids: p.zcount(f'{self.prefix}{u}', now, '+inf')
+        return {u for u, n in zip(uids, p.execute()) if n}
+
+def make_presence():
+    if PRESENCE_URL and PRESENCE_URL.startswith('redis'):
+        return RedisPresence(PRESENCE_URL, PRESENCE_TTL)
+    return LocalPresence(PRESENCE_TTL)
+
+presence = make_presence()
+
+def make_counter_cache(name, ttl):
+    if CACHE_URL and CACHE_URL.startswith('redis'):
+        return RedisCache(CACHE_URL, ttl=ttl, prefix=f'vetrico:{name}:')
+    return TTLCache(maxsize=50000, ttl=ttl, name=name)
 
 # ─────────────────────────── HELPERS ───────────────────────────
 def allowed_video(f): return '.' in f and f.rsplit('.', 1)[1].lower() in ALLOWED_VIDEO
+def media_path(url):
+    """'/static/…' URL → local path, or None for anything not served from static/."""
+    return url.lstrip('/') if url and url.startswith('/static/') else None
+
+MEDIA_KINDS = {'video': ('filename', UPLOAD_FOLDER), 'poster': ('poster', THUMB_FOLDER),
+               'preview': ('preview', THUMB_FOLDER), 'hls': ('hls', HLS_FOLDER)}
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
+
+def media_url(video, kind='video'):
+    """URL of a video's file/poster/preview through the cached, range-aware /media endpoint."""
+    url = getattr(video, MEDIA_KINDS[kind][0])
+    if not media_path(url): return url or ''
+    return url_for('media', vid=video.id, kind=kind, name=os.path.basename(url))
+
+def remove_media(video):
+    # deduplicated uploads share one file (and its thumbnails) between rows; tombstoned rows don't keep it
+    if video.content_hash and Video.query.filter(
+            Video.content_hash == video.content_hash, Video.filename == video.filename, Video.id != video.id,
+            Video.moderation_status != 'deleted').first(): return
+    for url in (video.filename, video.poster, video.preview):
+        p = media_path(url)
+        if p and os.path.exists(p): os.remove(p)
+    remove_hls(video.hls)
+
+def remove_hls(master_url):
+    """Master playlist, variant playlists and segments all share the <stem>_ prefix."""
+    p = media_path(master_url)
+    if not p: return
+    prefix = os.path.basename(p)[:-len('master.m3u8')]
+    for name in os.listdir(HLS_FOLDER):
+        if name.startswith(prefix): os.remove(os.path.join(HLS_FOLDER, name))
+
+def ffmpeg(*args, timeout=300):
+    """Run ffmpeg quietly; (ok, stderr tail)."""
+    if not FFMPEG_BIN: return False, 'ffmpeg bulunamadı'
+    try:
+        r = subprocess.run([FFMPEG_BIN, '-hide_banner', '-loglevel', 'error', '-y', *args],
+                           capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return False, f'timeout ({timeout}s)'
+    except OSError as e:
+        return False, str(e)
+    return r.returncode == 0, r.stderr.decode(errors='replace')[-500:]
+
+def run_ffmpeg(*args, timeout=300):
+    return ffmpeg(*args, timeout=timeout)[0]
+
+def probe_video(src):
+    """(short side in px or None, has audio) from ffmpeg's input banner – no ffprobe needed."""
+    try:
+        r = subprocess.run([FFMPEG_BIN, '-hide_banner', '-i', src], capture_output=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return None, False
+    info = r.stderr.decode(errors='replace')
+    m = re.search(r'Stream #\S+.*?: Video: .*?, (\d{2,5})x(\d{2,5})', info)
+    return (min(int(m.group(1)), int(m.group(2))) if m else None), ' Audio: ' in info
+
+def transcode_hls(video):
+    """Encode an HLS ladder next to the upload; sets video.hls on success. (ok, error)."""
+    src = media_path(video.filename)
+    if not src or not os.path.exists(src): return False, 'kaynak dosya yok'
+    short, audio = probe_video(src)
+    rungs = [r for r in HLS_LADDER if short is None or r[0] <= short] or [(short - short % 2, HLS_LADDER[-1][1])]
+    if short is None: rungs = rungs[1:]      # çözünürlük bilinmiyor: 720p ve altı
+    stem  = f"{os.path.splitext(os.path.basename(src))[0]}_{uuid.uuid4().hex[:8]}"
+    split = f"[0:v]split={len(rungs)}" + ''.join(f'[s{i}]' for i in range(len(rungs)))
+    # short side → `size`, whichever orientation the clip has (9:16 çoğunlukta)
+    scale = ';'.join(f"[s{i}]scale='if(gt(iw,ih),-2,{size})':'if(gt(iw,ih),{size},-2)'[o{i}]"
+                     for i, (size, _) in enumerate(rungs))
+    args = ['-i', src, '-filter_complex', f'{split};{scale}']
+    for i, (_, kbps) in enumerate(rungs):
+        args += ['-map', f'[o{i}]', f'-c:v:{i}', 'libx264', f'-b:v:{i}', f'{kbps}k',
+                 f'-maxrate:v:{i}', f'{kbps * 107 // 100}k', f'-bufsize:v:{i}', f'{kbps * 3 // 2}k']
+        if audio: args += ['-map', '0:a:0']
+    if audio: args += ['-c:a', 'aac', '-b:a', '128k', '-ac', '2']
+    args += ['-preset', 'veryfast', '-profile:v', 'main', '-g', '48', '-keyint_min', '48', '-sc_threshold', '0',
+             '-f', 'hls', '-hls_time', '4', '-hls_playlist_type', 'vod', '-hls_flags', 'independent_segments',
+             '-hls_segment_filename', os.path.join(HLS_FOLDER, f'{stem}_%v_%03d.ts'),
+             '-master_pl_name', f'{stem}_master.m3u8',
+             '-var_stream_map', ' '.join(f'v:{i},a:{i}' if audio else f'v:{i}' for i in range(len(rungs))),
+             os.path.join(HLS_FOLDER, f'{stem}_%v.m3u8')]
+    ok, err = ffmpeg(*args, timeout=TRANSCODE_TIMEOUT)
+    master = os.path.join(HLS_FOLDER, f'{stem}_master.m3u8')
+    if not ok or not os.path.exists(master):
+        remove_hls('/' + master.replace(os.sep, '/'))
+        return False, err or 'master playlist yok'
+    old, video.hls = video.hls, '/' + master.replace(os.sep, '/')
+    if old: remove_hls(old)
+    return True, None
+
+def make_thumbnails(video):
+    """Poster JPEG + short animated WebP for one video. Sets the columns; caller commits."""
+    src = media_path(video.filename)
+    if not src or not os.path.exists(src): return False
+    stem    = os.path.splitext(os.path.basename(src))[0]
+    poster  = os.path.join(THUMB_FOLDER, f'{stem}.jpg')
+    preview = os.path.join(THUMB_FOLDER, f'{stem}.webp')
+    for seek in ('1', '0'):   # clips shorter than 1 s have no frame at 00:01
+        if run_ffmpeg('-ss', seek, '-i', src, '-frames:v', '1', '-vf', 'scale=360:-2', '-q:v', '4', poster) \
+                and os.path.exists(poster): break
+    else:
+        return False
+    video.poster = '/' + poster.replace(os.sep, '/')
+    if run_ffmpeg('-t', '3', '-i', src, '-vf', 'fps=8,scale=240:-2', '-an', '-loop', '0',
+                  '-c:v', 'libwebp', '-q:v', '40', preview) and os.path.exists(preview):
+        video.preview = '/' + preview.replace(os.sep, '/')
+    return True
+
+VIDEO_MAGIC = {'mp4': 'isobmff', 'mov': 'isobmff', 'webm': 'ebml'}
+ISOBMFF_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'}   # QuickTime dosyaları ftyp'siz başlayabilir
+
+def sniff_video(head):
+    """Container family from the first 12 bytes – 'isobmff' (MP4/MOV), 'ebml' (WEBM) or None."""
+    if head[:4] == b'\x1a\x45\xdf\xa3': return 'ebml'
+    if len(head) >= 12 and head[4:8] in ISOBMFF_BOXES: return 'isobmff'
+    return None
+
+def read_exact(stream, n):
+    buf = b''
+    while len(buf) < n:
+        block = stream.read(n - len(buf))
+        if not block: break
+        buf += block
+    return buf
+
+def copy_stream(src, dst, hasher, limit):
+    """Copy src → dst in 64 KiB blocks, hashing on the way; -1 once more than `limit` bytes arrive."""
+    n = 0
+    while True:
+        block = src.read(65536)
+        if not block: return n
+        n += len(block)
+        if n > limit: return -1
+        hasher.update(block); dst.write(block)
+
+def publish_video(user_id, src, digest, caption, category):
+    """Move a fully received .part file into place and add its Video row (caller commits).
+
+    Same content is kept once: the same uploader gets their existing video back,
+    anyone else gets a new row sharing the file and thumbnails. Returns (video, created).
+    """
+    # silinmiş (PurgeJob bekleyen) satırın dosyaları birazdan gidecek – onlarla eşleşme
+    same = Video.query.filter(Video.content_hash == digest,
+                              Video.moderation_status != 'deleted').order_by(Video.id).first()
+    if same:
+        os.remove(src)
+        if same.user_id == user_id: return same, False
+        filename, poster, preview, hls = same.filename, same.poster, same.preview, same.hls
+    else:
+        name = os.path.basename(src)[:-len('.part')]
+        os.replace(src, os.path.join(UPLOAD_FOLDER, name))
+        filename, poster, preview, hls = f'/static/uploads/{name}', None, None, None
+    v = Video(filename=filename, poster=poster, preview=preview, hls=hls, content_hash=digest,
+              user_id=user_id, caption=caption, category=category or 'Genel',
+              processing='ready' if hls else None)
+    db.session.add(v); bump(User, user_id, video_count=1)
+    if not hls: enqueue_transcode(v)
+    return v, True
+
+def enqueue_transcode(video):
+    """Queue an HLS encode (caller commits); the original file keeps playing until it is ready."""
+    video.transcode_jobs.append(TranscodeJob())
+    if not video.hls: video.processing = 'queued'
+
+upload_hashers = TTLCache(maxsize=1024, ttl=UPLOAD_SESSION_TTL)   # {upload id: (offset, sha256)}
+
+def upload_hasher(s):
+    """Running sha256 of s's first `received` bytes; rebuilt from disk after a restart/other worker."""
+    hit = upload_hashers.get(s.id)
+    if hit and hit[0] == s.received: return hit[1]
+    h, left = hashlib.sha256(), s.received
+    with open(s.path, 'rb') as fh:
+        while left > 0:
+            block = fh.read(min(left, 1 << 20))
+            if not block: break
+            h.update(block); left -= len(block)
+    if s.received: metrics.incr('uploads.rehash')
+    return h
+
 def allowed_img(f):   return '.' in f and f.rsplit('.', 1)[1].lower() in ALLOWED_IMG
 def contains_bad_words(t):
     if not t: return False
     return any(w in t.lower() for w in BAD_WORDS)
 
+def live_video_or_404(vid):
+    """get_or_404 that also hides tombstoned videos (see PURGE)."""
+    return Video.query.filter(Video.id == vid, Video.moderation_status != 'deleted').first_or_404()
+
+def live_user_or_404(uid):
+    """Same for users: a tombstoned account can't be messaged, followed, verified or promoted."""
+    return User.query.filter_by(id=uid, deleted_at=None).first_or_404()
+
+def bump(model, pk, **deltas):
+    """Atomic `col = col + n` on one row; keeps the denormalized counters race-free."""
+    if pk is None: return
+    model.query.filter_by(id=pk).update(
+        {getattr(model, k): getattr(model, k) + n for k, n in deltas.items()},
+        synchronize_session=False)
+
+def toggle_link(table, **keys):
+    """Insert or delete one association row. Returns True if the link now exists."""
+    cond = and_(*[table.c[k] == v for k, v in keys.items()])
+    if db.session.execute(select(table.c[next(iter(keys))]).where(cond).limit(1)).first():
+        db.session.execute(table.delete().where(cond)); return False
+    db.session.execute(table.insert().values(**keys)); return True
+
+def reconcile_counters():
+    """Rebuild every denormalized counter from the association tables."""
+    def n(q): return q.scalar_subquery()
+    db.session.execute(update(Video).values(
+        like_count=n(select(func.count()).select_from(likes).where(likes.c.video_id == Video.id)),
+        comment_count=n(select(func.count(Comment.id)).where(Comment.video_id == Video.id))))
+    R = aliased(Comment)
+    db.session.execute(update(Comment).values(
+        like_count=n(select(func.count()).select_from(comment_likes)
+                     .where(comment_likes.c.comment_id == Comment.id)),
+        reply_count=n(select(func.count(R.id)).where(R.parent_id == Comment.id))))
+    db.session.execute(update(User).values(
+        follower_count=n(select(func.count()).select_from(followers)
+                         .where(followers.c.followed_id == User.id)),
+        following_count=n(select(func.count()).select_from(followers)
+                          .where(followers.c.follower_id == User.id)),
+        video_count=n(select(func.count(Video.id)).where(Video.user_id == User.id,
+                                                         Video.moderation_status != 'deleted'))))
+    db.session.commit()
+
+class ViewerState:
+    """What the current user has liked / bookmarked / followed among the videos on a page."""
+    __slots__ = ('liked', 'bookmarked', 'following')
+    def __init__(self, liked=(), bookmarked=(), following=()):
+        self.liked      = frozenset(liked)       # video ids
+        self.bookmarked = frozenset(bookmarked)  # video ids
+        self.following  = frozenset(following)   # user ids
+
+NO_VIEWER_STATE = ViewerState()
+
+def load_viewer_state(videos, users=()):
+    """One set-based query per relation for everything a page is about to render."""
+    if not current_user.is_authenticated: return NO_VIEWER_STATE
+    me   = current_user.id
+    vids = {v.id for v in videos}
+    uids = {v.user_id for v in videos} | {u.id for u in users}
+    def ids(col, *cond): return db.session.execute(select(col).where(*cond)).scalars().all()
+    g.viewer = ViewerState(
+        liked=ids(likes.c.video_id, likes.c.user_id == me, likes.c.video_id.in_(vids)) if vids else (),
+        bookmarked=ids(bookmarks.c.video_id, bookmarks.c.user_id == me,
+                       bookmarks.c.video_id.in_(vids)) if vids else (),
+        following=ids(followers.c.followed_id, followers.c.follower_id == me,
+                      followers.c.followed_id.in_(uids)) if uids else ())
+    return g.viewer
+
+FEED_PAGE_SIZE = 30
+COMMENT_PAGE_SIZE = 20
+REPLY_PREVIEW     = 3       # yanıtlar her yorumun altında ilk bu kadar gelir, kalanı sayfalı
+
+FEED_SORTS = {'new': ('created_at', datetime.fromisoformat), 'trending': ('trend_score', float)}
+
+def encode_cursor(v, sort='new'):
+    key = getattr(v, FEED_SORTS[sort][0])
+    raw = f"{key.isoformat() if sort == 'new' else repr(key)}|{v.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token, sort='new'):
+    """Opaque cursor → (sort key, id); None on a malformed token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        key, vid = raw.split('|')
+        return FEED_SORTS[sort][1](key), int(vid)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def feed_page(category=None, status='approved', cursor=None, limit=FEED_PAGE_SIZE, exclude_id=None, sort='new'):
+    """One keyset page, newest (or highest trend_score) first. Returns (videos, next_cursor)."""
+    key = getattr(Video, FEED_SORTS[sort][0])
+    q = Video.query.options(joinedload(Video.user)).filter(Video.moderation_status == status)
+    if category:   q = q.filter(Video.category == category)
+    if exclude_id: q = q.filter(Video.id != exclude_id)
+    if cursor:     q = q.filter(tuple_(key, Video.id) < tuple_(*cursor))
+    rows = q.order_by(key.desc(), Video.id.desc()).limit(limit + 1).all()
+    return rows[:limit], (encode_cursor(rows[limit - 1], sort) if len(rows) > limit else None)
+
+def video_json(v, viewer=NO_VIEWER_STATE):
+    u = v.user
+    return {
+        'id': v.id, 'src': media_url(v), 'hls': media_url(v, 'hls'), 'poster': media_url(v, 'poster'),
+        'preview': media_url(v, 'preview'),
+        'caption': v.caption or '', 'category': v.category or '',
+        'views': v.views, 'like_count': v.like_count, 'comment_count': v.comment_count,
+        'liked': v.id in viewer.liked, 'bookmarked': v.id in viewer.bookmarked,
+        'user': {'id': u.id, 'username': u.username, 'avatar': u.avatar or '',
+                 'is_verified': u.is_verified, 'following': u.id in viewer.following,
+                 'badge': BADGES[u.badge_key]['svg'] if u.is_verified and u.badge_key in BADGES else ''},
+    }
+
+stories_cache = TTLCache(maxsize=20000, ttl=STORIES_TTL, name='stories')
+
+def comment_json(c, owner_id, liked):
+    u = c.user
+    return {
+        'id': c.id, 'username': u.username, 'text': c.text, 'avatar': u.avatar or '',
+        'is_video_owner': owner_id == c.user_id, 'liked_by_creator': c.is_liked_by_creator,
+        'like_count': c.like_count, 'user_liked': c.id in liked, 'reply_count': c.reply_count,
+        'is_verified': u.is_verified, 'badge': BADGES[u.badge_key]['svg'] if u.badge_key in BADGES else '',
+    }
+
+def liked_comment_ids(ids):
+    if not ids or not current_user.is_authenticated: return frozenset()
+    return frozenset(db.session.scalars(select(comment_likes.c.comment_id).where(
+        comment_likes.c.user_id == current_user.id, comment_likes.c.comment_id.in_(ids))))
+
+def live_comments():
+    """Comments with their author loaded; a tombstoned author's comments vanish until the purge deletes them."""
+    return Comment.query.join(Comment.user).options(contains_eager(Comment.user)).filter(User.deleted_at.is_(None))
+
+def reply_page(parent_id, cursor=None, limit=COMMENT_PAGE_SIZE):
+    """Oldest-first replies of one comment after `cursor`. Returns (replies, next_cursor)."""
+    q = live_comments().filter(Comment.parent_id == parent_id)
+    if cursor: q = q.filter(tuple_(Comment.created_at, Comment.id) > tuple_(*cursor))
+    rows = q.order_by(Comment.created_at, Comment.id).limit(limit + 1).all()
+    return rows[:limit], (encode_cursor(rows[limit - 1]) if len(rows) > limit else None)
+
+def comment_tree(video, cursor=None, limit=COMMENT_PAGE_SIZE):
+    """A page of top-level comments (newest first) with their first REPLY_PREVIEW replies,
+    authors and the viewer's likes – three queries however long the threads are."""
+    q = live_comments().filter(Comment.video_id == video.id, Comment.parent_id.is_(None))
+    if cursor: q = q.filter(tuple_(Comment.created_at, Comment.id) < tuple_(*cursor))
+    rows = q.order_by(Comment.created_at.desc(), Comment.id.desc()).limit(limit + 1).all()
+    top, next_cursor = rows[:limit], (encode_cursor(rows[limit - 1]) if len(rows) > limit else None)
+    replies = {}
+    threads = [c.id for c in top if c.reply_count]
+    if threads:
+        # one LIMIT-n index probe per thread, glued into a single statement
+        heads = union_all(*(select(s.c.id) for s in (
+            select(Comment.id).join(Comment.user).where(Comment.parent_id == pid, User.deleted_at.is_(None))
+            .order_by(Comment.created_at, Comment.id).limit(REPLY_PREVIEW).subquery() for pid in threads)))
+        for r in live_comments().filter(Comment.id.in_(heads)).order_by(Comment.created_at, Comment.id):
+            replies.setdefault(r.parent_id, []).append(r)
+    liked = liked_comment_ids([c.id for c in top] + [r.id for rs in replies.values() for r in rs])
+    items = []
+    for c in top:
+        shown = replies.get(c.id, [])
+        d = comment_json(c, video.user_id, liked)
+        d['replies'] = [comment_json(r, video.user_id, liked) for r in shown]
+        d['replies_cursor'] = encode_cursor(shown[-1]) if shown and c.reply_count > len(shown) else None
+        items.append(d)
+    return items, next_cursor
+
+def query_stories(uid, limit=STORIES_LIMIT):
+    """Latest approved video of each creator `uid` follows, newest first.
+
+    The per-creator pick is a correlated LIMIT 1 on ix_video_user_recent, so the
+    cost grows with the number of followed creators, not with their history.
+    """
+    latest = (select(Video.id)
+              .where(Video.user_id == followers.c.followed_id, Video.moderation_status == 'approved')
+              .order_by(Video.created_at.desc(), Video.id.desc()).limit(1)
+              .correlate(followers).scalar_subquery())
+    return (Video.query.options(joinedload(Video.user))
+            .join(followers, Video.id == latest)
+            .filter(followers.c.follower_id == uid)
+            .order_by(Video.created_at.desc()).limit(limit).all())
+
+def get_stories(uid):
+    """Cached stories rail: [{'id', 'user_id', 'user': {'username', 'avatar'}}]."""
+    entry = stories_cache.get(uid)
+    if entry is None:
+        items = [{'id': v.id, 'user_id': v.user_id,
+                  'user': {'username': v.user.username, 'avatar': v.user.avatar}}
+                 for v in query_stories(uid)]
+        followed_ids = set(db.session.execute(
+            select(followers.c.followed_id).where(followers.c.follower_id == uid)).scalars())
+        entry = {'items': items, 'creators': frozenset(followed_ids)}
+        stories_cache.set(uid, entry)
+    return entry['items']
+
+def invalidate_stories(creator_id=None, follower_id=None):
+    """A creator's rail slot changed (upload/delete) or a user's follow list changed."""
+    if follower_id is not None: stories_cache.delete(follower_id)
+    if creator_id is not None: stories_cache.delete_where(lambda e: creator_id in e['creators'])
+
+identity_cache = TTLCache(maxsize=50000, ttl=IDENTITY_TTL, name='identity')   # {user_id: Identity}
+
+class IdentityBus:
+    """Keeps every worker's identity_cache honest. invalidate() drops the local entry and, with
+    Redis configured, publishes the uid so the other workers drop theirs too. Snapshots are only
+    cached while this worker's subscriber is connected: a worker that can't hear invalidations
+    reads the row on every request rather than trust a permission that may have been revoked."""
+    CHANNEL = 'vetrico:identity'
+
+    def __init__(self, url):
+        self.url, self.gen, self.live = url, 0, not url
+        self._pub = None
+
+    def drop(self, uid=None):
+        self.gen += 1       # load_user'da çekilmekte olan eski satır önbelleğe yazılmasın
+        if uid is None: identity_cache.clear()
+        else: identity_cache.delete(uid)
+
+    def invalidate(self, uid):
+        self.drop(uid)
+        if not self.url: return
+        try:
+            if self._pub is None:
+                import redis
+                self._pub = redis.Redis.from_url(self.url)
+            self._pub.publish(self.CHANNEL, uid)
+        except Exception:
+            metrics.incr('identity.publish_errors'); app.logger.exception('identity invalidation not published')
+
+    def listen(self):
+        import redis
+        while True:
+            try:
+                ps = redis.Redis.from_url(self.url).pubsub(); ps.subscribe(self.CHANNEL)
+                for m in ps.listen():
+                    if m['type'] == 'subscribe':
+                        self.drop(); self.live = True     # kopukken kaçırılanlar: hepsini unut
+                    elif m['type'] == 'message':
+                        self.drop(int(m['data']))
+            except Exception:
+                metrics.incr('identity.bus_errors'); app.logger.exception('identity bus disconnected')
+            finally:
+                self.live = False
+            socketio.sleep(1)
+
+identity_bus = IdentityBus(next((u for u in (CACHE_URL, SOCKETIO_MESSAGE_QUEUE) if u and u.startswith('redis')), None))
+
+def invalidate_identity(uid):
+    """Call after the commit that changed the user's name, avatar, badge, permissions or deleted it."""
+    identity_bus.invalidate(uid)
+
+page_cache = PageCache(PAGE_CACHE_BYTES)
+
+def tag_page(*tags):
+    """Invalidation tags of the page being rendered: 'feed', 'video:<id>', 'user:<id>'."""
+    g.setdefault('page_tags', set()).update(tags)
+
+def invalidate_pages(*tags):
+    """Call after the commit – a render racing the write is not stored (PageCache.gen)."""
+    if PAGE_CACHE_TTL: page_cache.invalidate(*tags)
+
+def page_cache_key():
+    """Route + sorted query args + viewer class; only 'anon' is cached so far."""
+    args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+    return f'{request.endpoint}|{request.path}?{args}|anon'
+
+def cached_page(ttl=None):
+    """Serve logged-out GETs from page_cache; anyone with a session user or pending flash bypasses it."""
+    def deco(view):
+        @wraps(view)
+        def wrapper(**kw):
+            if not PAGE_CACHE_TTL or request.method != 'GET' or current_user.is_authenticated \
+                    or '_flashes' in session:
+                metrics.incr('page_cache.bypass'); return view(**kw)
+
+            def render():
+                resp = app.make_response(view(**kw))
+                shareable = resp.status_code == 200 and not resp.is_streamed and not session.modified \
+                    and 'Set-Cookie' not in resp.headers
+                entry = (resp.status_code, [(k, v) for k, v in resp.headers.items()
+                                            if k not in ('Set-Cookie', 'Content-Length')],
+                         resp.get_data()) if shareable else None
+                return resp, entry, g.pop('page_tags', ())
+
+            resp, entry, state = page_cache.fetch(page_cache_key(), render, ttl or PAGE_CACHE_TTL)
+            if resp is None: resp = Response(entry[2], status=entry[0], headers=entry[1])
+            resp.headers['X-Cache'] = state
+            return resp
+        return wrapper
+    return deco
+
+class UnreadNotifications:
+    """Unread-badge count per user: cache-aside over an index-only COUNT, pushed live over Socket.IO."""
+    def __init__(self, backend): self.backend = backend
+
+    def get(self, uid):
+        n = self.backend.get(uid)
+        if n is None:
+            n = Notification.query.filter_by(recipient_id=uid, is_read=False).count()
+            self.backend.set(uid, n)
+        return n
+
+    def incr(self, uid, n=1):
+        # runs from after_commit, where no SQL may be issued: an uncached user is
+        # simply counted on their next page render
+        value = self.backend.incr(uid, n)
+        if value is not None: socketio.emit('notif_count', {'count': value}, to=f'user_{uid}')
+
+    def reset(self, uid):
+        """Re-seed from the table (after a mark-read) and push the new value."""
+        self.backend.delete(uid)
+        socketio.emit('notif_count', {'count': self.get(uid)}, to=f'user_{uid}')
+
+unread_notifs = UnreadNotifications(make_counter_cache('notif_unread', NOTIF_COUNT_TTL))
+
+COALESCED_NOTIFS = {'like', 'comment', 'follow'}
+
 def push_notif(recipient_id, sender_id, type_, post_id=None, amount=None):
+    """Likes/comments/follows fold into one rolling row per (recipient, type, post_id)."""
     if recipient_id == sender_id: return
-    db.session.add(Notification(
-        recipient_id=recipient_id, sender_id=sender_id,
-        type=type_, post_id=post_id, amount=amount
-    ))
+    n = None
+    if type_ in COALESCED_NOTIFS:
+        n = Notification.query.filter_by(recipient_id=recipient_id, type=type_, post_id=post_id
+                                         ).order_by(Notification.id.desc()).first()
+    if n is None:
+        db.session.add(Notification(
+            recipient_id=recipient_id, sender_id=sender_id,
+            type=type_, post_id=post_id, amount=amount,
+            actor_count=1, actor_sample=str(sender_id)
+        ))
+    else:
+        was_read, actors = n.is_read, n.actor_ids
+        if was_read:                       # seen already → start a fresh round
+            n.actor_count, actors = 1, []
+        elif sender_id not in actors and n.actor_count < NOTIF_ACTOR_CAP:
+            n.actor_count = Notification.actor_count + 1
+        # the sample is the round's whole actor set until the cap, so repeat actors are never recounted
+        actors = [sender_id] + [a for a in actors if a != sender_id]
+        n.sender_id, n.actor_sample = sender_id, ','.join(map(str, actors[:NOTIF_ACTOR_CAP]))
+        n.is_read, n.timestamp = False, datetime.utcnow()
+        if not was_read: return            # already counted in the badge
+    db.session.info.setdefault('notif_recipients', []).append(recipient_id)
+
+def compact_notifications(max_age_days=NOTIF_RETENTION_DAYS, batch=5000):
+    """Retention: merge duplicate groups left from before coalescing, prune old read rows."""
+    N = Notification
+    dupes = db.session.execute(
+        select(N.recipient_id, N.type, N.post_id, func.max(N.id).label('keep'),
+               func.sum(N.actor_count).label('total'),
+               func.min(case((N.is_read.is_(True), 1), else_=0)).label('all_read'))
+        .where(N.type.in_(COALESCED_NOTIFS))
+        .group_by(N.recipient_id, N.type, N.post_id).having(func.count() > 1).limit(batch)).all()
+    for d in dupes:
+        grp = and_(N.recipient_id == d.recipient_id, N.type == d.type,
+                   N.post_id.is_(None) if d.post_id is None else N.post_id == d.post_id)
+        N.query.filter(grp, N.id != d.keep).delete(synchronize_session=False)
+        N.query.filter_by(id=d.keep).update({'actor_count': min(d.total, NOTIF_ACTOR_CAP), 'is_read': bool(d.all_read)},
+                                            synchronize_session=False)
+    db.session.commit()
+    cutoff, pruned = datetime.utcnow() - timedelta(days=max_age_days), 0
+    while True:   # bounded batches keep the write lock short
+        ids = select(N.id).where(N.is_read.is_(True), N.timestamp < cutoff).limit(batch)
+        n = N.query.filter(N.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit(); pruned += n
+        if n < batch: break
+        socketio.sleep(0)
+    metrics.incr('notif.compacted_groups', len(dupes)); metrics.incr('notif.pruned', pruned)
+    return len(dupes), pruned
+
+@event.listens_for(db.session, 'after_commit')
+def _flush_notif_counts(sess):
+    for uid in sess.info.pop('notif_recipients', ()): unread_notifs.incr(uid)
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_notif_counts(sess):
+    sess.info.pop('notif_recipients', None)
+
+def touch_conversation(msg):
+    """Fold a freshly added Message into its pair's Conversation row (same transaction)."""
+    a, b = sorted((msg.sender_id, msg.recipient_id))
+    conv = Conversation.query.filter_by(user_a_id=a, user_b_id=b).first()
+    if conv is None:
+        try:
+            with db.session.begin_nested():
+                conv = Conversation(user_a_id=a, user_b_id=b, unread_a=0, unread_b=0)
+                db.session.add(conv)
+        except IntegrityError:   # another greenlet created the pair first
+            conv = Conversation.query.filter_by(user_a_id=a, user_b_id=b).one()
+    conv.last_message_id = msg.id
+    conv.last_sender_id  = msg.sender_id
+    conv.last_preview    = (msg.body or '')[:120]
+    conv.last_at         = msg.timestamp
+    if msg.recipient_id == a: conv.unread_a = Conversation.unread_a + 1
+    else:                     conv.unread_b = Conversation.unread_b + 1
+
+def touch_conversations(msgs):
+    """touch_conversation for a flushed batch (id order): one SELECT for all pairs, missing
+    rows inserted together, one UPDATE per existing pair however many messages it got."""
+    latest, unread = {}, {}
+    for m in msgs:
+        pair = tuple(sorted((m.sender_id, m.recipient_id)))
+        latest[pair] = m
+        side = 'unread_a' if m.recipient_id == pair[0] else 'unread_b'
+        unread.setdefault(pair, {'unread_a': 0, 'unread_b': 0})[side] += 1
+    have = {(c.user_a_id, c.user_b_id): c for c in Conversation.query.filter(
+        tuple_(Conversation.user_a_id, Conversation.user_b_id).in_(list(latest)))}
+    last = lambda m: {'last_message_id': m.id, 'last_sender_id': m.sender_id,
+                      'last_preview': (m.body or '')[:120], 'last_at': m.timestamp}
+    new = [Conversation(user_a_id=a, user_b_id=b, **unread[a, b], **last(m))
+           for (a, b), m in latest.items() if (a, b) not in have]
+    if new:
+        try:
+            with db.session.begin_nested(): db.session.add_all(new)
+        except IntegrityError:   # another process created one of the pairs – take the slow path
+            for m in msgs: touch_conversation(m)
+            return
+    for pair, conv in have.items():
+        for k, v in last(latest[pair]).items(): setattr(conv, k, v)
+        for side, n in unread[pair].items():
+            if n: setattr(conv, side, getattr(Conversation, side) + n)
+
+def mark_conversation_read(me, other_id):
+    """Set-based read receipt for everything `other_id` sent to `me`; notifies the sender."""
+    n = Message.query.filter_by(sender_id=other_id, recipient_id=me, is_read=False
+                                ).update({'is_read': True, 'delivered': True}, synchronize_session=False)
+    a, b = sorted((me, other_id))
+    Conversation.query.filter_by(user_a_id=a, user_b_id=b).update(
+        {'unread_a' if me == a else 'unread_b': 0}, synchronize_session=False)
+    db.session.commit()
+    if n: socketio.emit('messages_read', {'reader_id': me, 'count': n}, to=f'user_{other_id}')
+    return n
+
+def chat_page(me, other_id, before_id=None, limit=CHAT_PAGE_SIZE):
+    """`limit` newest messages of a pair older than `before_id`, oldest first → (msgs, has_more).
+
+    Each direction is its own LIMITed walk down ix_message_pair_time; merging two
+    short lists keeps the cost independent of how long the conversation is.
+    """
+    bound = None
+    if before_id:
+        m = db.session.get(Message, before_id)
+        if m is None or {m.sender_id, m.recipient_id} != {me, other_id}: return [], False
+        bound = tuple_(m.timestamp, m.id)
+    def side(s, r):
+        q = Message.query.filter(Message.sender_id == s, Message.recipient_id == r)
+        if bound is not None: q = q.filter(tuple_(Message.timestamp, Message.id) < bound)
+        return q.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    rows = sorted(side(me, other_id) + side(other_id, me), key=lambda m: (m.timestamp, m.id), reverse=True)
+    return rows[:limit][::-1], len(rows) > limit
+
+def rebuild_conversations():
+    """Recreate every Conversation row from the Message table in one grouped pass."""
+    lo = case((Message.sender_id < Message.recipient_id, Message.sender_id), else_=Message.recipient_id)
+    hi = case((Message.sender_id < Message.recipient_id, Message.recipient_id), else_=Message.sender_id)
+    unread = lambda side: func.sum(case((and_(Message.recipient_id == side,
+                                              Message.is_read.is_not(True)), 1), else_=0))
+    grouped = (select(lo.label('a'), hi.label('b'), func.max(Message.id).label('last_id'),
+                      unread(lo).label('unread_a'), unread(hi).label('unread_b'))
+               .where(Message.sender_id != Message.recipient_id)
+               .group_by(lo, hi).subquery())
+    rows = db.session.execute(
+        select(grouped, Message.sender_id, Message.body, Message.timestamp)
+        .join(Message, Message.id == grouped.c.last_id)).all()
+    Conversation.query.delete()
+    if rows:
+        db.session.execute(Conversation.__table__.insert(), [
+            {'user_a_id': r.a, 'user_b_id': r.b, 'last_message_id': r.last_id,
+             'last_sender_id': r.sender_id, 'last_preview': (r.body or '')[:120],
+             'last_at': r.timestamp, 'unread_a': r.unread_a or 0, 'unread_b': r.unread_b or 0}
+            for r in rows])
+    db.session.commit()
+    return len(rows)
 
 @app.context_processor
 def inject_globals():
-    notif_count = 0
-    if current_user.is_authenticated:
-        notif_count = Notification.query.filter_by(
-            recipient_id=current_user.id, is_read=False).count()
-    return {'unread_notifications': notif_count, 'BADGES': BADGES}
+    notif_count = unread_notifs.get(current_user.id) if current_user.is_authenticated else 0
+    return {'unread_notifications': notif_count, 'BADGES': BADGES, 'media_url': media_url,
+            'viewer': g.get('viewer', NO_VIEWER_STATE)}
+
+# ─────────────────────────── BACKGROUND LOOPS ───────────────────────────
+class BackgroundLoop:
+    """One greenlet per instance, started on first use, calling tick() forever. A failing tick is
+    counted under ERRORS, logged and retried after ERROR_BACKOFF; it never ends the loop."""
+    ERRORS        = 'loop.errors'
+    ERROR_BACKOFF = 1.0
+
+    def __init__(self):
+        self._started = False
+
+    def tick(self):
+        raise NotImplementedError
+
+    def _run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception:
+                metrics.incr(self.ERRORS); app.logger.exception('%s failed', type(self).__name__)
+                socketio.sleep(self.ERROR_BACKOFF)
+
+    def _ensure_started(self):
+        if self._started: return
+        self._started = True
+        socketio.start_background_task(self._run)
+
+# ─────────────────────────── VIEW BUFFER ───────────────────────────
+class ViewBuffer(BackgroundLoop):
+    """Write-behind play counter.
+
+    /api/view only bumps an in-memory dict; a background greenlet folds the
+    pending increments into a single UPDATE every VIEW_FLUSH_SECONDS (or
+    sooner once VIEW_FLUSH_EVENTS plays are queued). threading.Lock is
+    greenlet-aware under gevent.monkey.patch_all().
+    """
+    CHUNK  = 500   # ids per UPDATE … CASE statement
+    ERRORS = 'views.flush_errors'
+
+    def __init__(self, interval, max_events, dedup_seconds):
+        super().__init__()
+        self.interval, self.max_events, self.dedup_seconds = interval, max_events, dedup_seconds
+        self._lock    = threading.Lock()
+        self._pending = {}     # {video_id: n}
+        self._events  = 0
+        self._seen    = {}     # {(viewer_key, video_id): expires_at}
+
+    def add(self, video_id, viewer_key=None):
+        now = time.monotonic()
+        with self._lock:
+            if viewer_key and self.dedup_seconds:
+                k = (viewer_key, video_id)
+                if self._seen.get(k, 0) > now:
+                    metrics.incr('views.deduped'); return False
+                self._seen[k] = now + self.dedup_seconds
+            self._pending[video_id] = self._pending.get(video_id, 0) + 1
+            self._events += 1
+            full = self._events >= self.max_events
+            metrics.gauge('views.buffer_depth', len(self._pending))
+        metrics.incr('views.accepted')
+        self._ensure_started()
+        if full: socketio.start_background_task(self.flush)
+        return True
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending, self._events = self._pending, {}, 0
+            now = time.monotonic()
+            self._seen = {k: t for k, t in self._seen.items() if t > now}
+            metrics.gauge('views.buffer_depth', 0)
+        if not pending: return 0
+        t0 = time.perf_counter()
+        items = list(pending.items())
+        try:
+            with app.app_context():
+                for i in range(0, len(items), self.CHUNK):
+                    chunk = dict(items[i:i + self.CHUNK])
+                    db.session.execute(update(Video.__table__)
+                        .where(Video.__table__.c.id.in_(chunk))
+                        .values(views=Video.__table__.c.views + case(chunk, value=Video.__table__.c.id, else_=0)))
+                db.session.commit()
+        except Exception:
+            with self._lock:   # put the increments back, next tick retries
+                for vid, n in pending.items(): self._pending[vid] = self._pending.get(vid, 0) + n
+            metrics.incr(self.ERRORS); app.logger.exception('view flush failed')
+            return 0
+        metrics.observe('views.flush', time.perf_counter() - t0)
+        metrics.incr('views.flushed_rows', len(items))
+        return len(items)
+
+    def tick(self):
+        socketio.sleep(self.interval)
+        self.flush()
+
+view_buffer = ViewBuffer(VIEW_FLUSH_SECONDS, VIEW_FLUSH_EVENTS, VIEW_DEDUP_SECONDS)
+atexit.register(view_buffer.flush)
+
+# ─────────────────────────── LIVE REACTIONS ───────────────────────────
+REACTION_EMOJIS = {'🔥', '😂', '❤️'}
+
+def local_room_size(room=None):
+    """Sockets of *this* worker in `room` (None = every connection); other workers count their own."""
+    return len(socketio.server.manager.rooms.get('/', {}).get(room) or ())
+
+def count_frames(event, room):
+    n = local_room_size(room)
+    metrics.incr('socket.frames', n); metrics.incr(f'socket.frames.{event}', n)
+
+class ReactionBatcher(BackgroundLoop):
+    """Emoji taps folded into one `reaction_batch` frame per video room per tick.
+
+    A tap only bumps {video_id: {emoji: n}}; every REACTION_TICK a greenlet emits
+    the tallies to `video_<id>` (sockets that sent watch_video), so a burst of N
+    taps costs one frame per viewer instead of N frames per connected socket.
+    """
+    ERRORS = 'reactions.flush_errors'
+
+    def __init__(self, interval, rate, burst):
+        super().__init__()
+        self.interval, self.rate, self.burst = interval, rate, burst
+        self._lock    = threading.Lock()
+        self._pending = {}     # {video_id: {emoji: n}}
+        self._buckets = {}     # {sid: (tokens, last_refill)}
+
+    def allow(self, sid):
+        """Token bucket per connection: `rate` taps/s, bursts of up to `burst`."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(sid, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            ok = tokens >= 1
+            self._buckets[sid] = (tokens - ok, now)
+        return ok
+
+    def forget(self, sid):
+        with self._lock: self._buckets.pop(sid, None)
+
+    def add(self, video_id, emoji):
+        with self._lock:
+            room = self._pending.setdefault(video_id, {})
+            room[emoji] = room.get(emoji, 0) + 1
+        self._ensure_started()
+
+    def flush(self):
+        with self._lock: pending, self._pending = self._pending, {}
+        for vid, counts in pending.items():
+            socketio.emit('reaction_batch', {'video_id': vid, 'counts': counts}, to=f'video_{vid}')
+            count_frames('reaction_batch', f'video_{vid}')
+        return len(pending)
+
+    def tick(self):
+        socketio.sleep(self.interval)
+        self.flush()
+
+reactions   = ReactionBatcher(REACTION_TICK, *REACTION_RATE)
+watching    = {}        # {sid: video_id} – the one video room a socket sits in
+typing_sent = {}        # {(sender_id, recipient_id): monotonic time display_typing last went out}
+
+# ─────────────────────────── CHAT PIPELINE ───────────────────────────
+class OutgoingMessage:
+    __slots__ = ('sender_id', 'recipient_id', 'body', 'timestamp', 'client_id', 'ack', 'done')
+    def __init__(self, sender_id, recipient_id, body, client_id=None):
+        self.sender_id, self.recipient_id, self.body, self.client_id = sender_id, recipient_id, body, client_id
+        self.timestamp, self.ack, self.done = datetime.utcnow(), None, threading.Event()
+
+def message_json(m, **extra):
+    return dict({'id': m.id, 'sender_id': m.sender_id, 'body': m.body,
+                 'timestamp': m.timestamp.strftime('%H:%M')}, **extra)
+
+class ChatWriter(BackgroundLoop):
+    """Group commit for chat messages.
+
+    Socket handlers only validate and queue an OutgoingMessage, then wait for its
+    ack. One greenlet drains whatever arrived within CHAT_BATCH_WAIT (up to
+    CHAT_BATCH_MAX), checks the recipients with one query, inserts the batch and
+    its Conversation updates in one transaction, then pushes receive_message to
+    the recipients and releases the senders with the server ids. Delivery
+    receipts ride the same queue, so they share the commits too.
+    """
+    ERRORS = 'chat.write_errors'
+
+    def __init__(self, max_batch, wait):
+        super().__init__()
+        self.max_batch, self.wait = max_batch, wait
+        self._queue   = queue.Queue()
+
+    def submit(self, msg):
+        self._ensure_started(); self._queue.put(msg)
+        metrics.gauge('chat.queue_depth', self._queue.qsize())
+        return msg
+
+    def mark_delivered(self, uid, ids):
+        self._ensure_started(); self._queue.put((uid, ids))
+
+    def _take(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.wait
+        while len(batch) < self.max_batch:
+            try: batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty: break
+        return batch
+
+    def write(self, batch):
+        msgs = [m for m in batch if isinstance(m, OutgoingMessage)]
+        receipts = [r for r in batch if isinstance(r, tuple)]
+        t0 = time.perf_counter()
+        known = set(db.session.scalars(select(User.id).where(User.id.in_({m.recipient_id for m in msgs})))) \
+            if msgs else set()
+        rows = []
+        for m in msgs:
+            if m.recipient_id not in known:
+                m.ack = {'error': 'recipient', 'client_id': m.client_id}; continue
+            row = Message(sender_id=m.sender_id, recipient_id=m.recipient_id, body=m.body, timestamp=m.timestamp)
+            db.session.add(row); rows.append((m, row))
+        try:
+            db.session.flush()
+            if rows: touch_conversations([row for _, row in rows])
+            for uid, ids in receipts:
+                db.session.execute(update(Message).where(Message.recipient_id == uid, Message.id.in_(ids),
+                                                         Message.delivered.is_(False)).values(delivered=True))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for m, _ in rows: m.ack = {'error': 'retry', 'client_id': m.client_id}
+            metrics.incr(self.ERRORS); app.logger.exception('chat batch failed')
+            rows = []
+        for m, row in rows:
+            payload = message_json(row)
+            socketio.emit('receive_message', payload, to=f'user_{m.recipient_id}')
+            m.ack = dict(payload, client_id=m.client_id)
+        for m in msgs: m.done.set()
+        metrics.observe('chat.batch', time.perf_counter() - t0)
+        metrics.incr('chat.messages', len(rows)); metrics.incr('chat.batches')
+        metrics.incr('chat.receipts', len(receipts))
+
+    def tick(self):
+        batch = self._take()
+        try:
+            with app.app_context(): self.write(batch)
+        finally:                   # a sender never waits on a batch that blew up
+            for m in batch:
+                if isinstance(m, OutgoingMessage): m.done.set()
+
+chat_writer = ChatWriter(CHAT_BATCH_MAX, CHAT_BATCH_WAIT)
+
+def undelivered_messages(uid, limit=CHAT_REPLAY_LIMIT):
+    """Oldest-first backlog a user missed while offline (ix_message_undelivered)."""
+    return Message.query.filter(Message.recipient_id == uid, Message.delivered.is_(False)) \
+                        .order_by(Message.id).limit(limit).all()
+
+# ─────────────────────────── SEARCH ───────────────────────────
+class SearchIndex:
+    """Substring scan over the base tables – any database, no ranking. Fallback backend."""
+    def setup(self, conn): pass
+    def add_video(self, conn, v): pass
+    def remove_video(self, conn, vid): pass
+    def add_user(self, conn, u): pass
+    def remove_user(self, conn, uid): pass
+    def rebuild(self): return 0
+
+    def user_ids(self, q, limit, offset=0):
+        return db.session.scalars(select(User.id).where(func.lower(User.username).contains(q.lower(), autoescape=True),
+                                                        User.deleted_at.is_(None))
+                                  .order_by(User.follower_count.desc(), User.id).limit(limit).offset(offset)).all()
+
+    def video_ids(self, q, limit, offset=0):
+        return db.session.scalars(select(Video.id).where(func.lower(Video.caption).contains(q.lower(), autoescape=True),
+                                                         Video.moderation_status == 'approved')
+                                  .order_by(Video.id.desc()).limit(limit).offset(offset)).all()
+
+class FTS5Search(SearchIndex):
+    """SQLite FTS5 shadow tables keyed by rowid = video.id / user.id, bm25-ranked prefix search.
+
+    Kept in sync from ORM flush events (so every upload/edit/delete/register path is covered);
+    bulk Core deletes must call remove_* themselves.
+    """
+    TOKENIZE = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+    WEIGHTS  = '2.0, 0.5, 1.5'     # caption, category, username
+    RANK_WINDOW = 5000
+
+    def __init__(self): self.ready = False
+
+    def setup(self, conn):
+        if self.ready: return
+        have = {r[0] for r in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE name IN ('video_fts', 'user_fts')"))}
+        conn.execute(text(f'CREATE VIRTUAL TABLE IF NOT EXISTS video_fts USING fts5(caption, category, username, {self.TOKENIZE})'))
+        conn.execute(text(f'CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(username, {self.TOKENIZE})'))
+        if 'video_fts' not in have: self._fill(conn)
+        self.ready = True
+
+    def _fill(self, conn):
+        conn.execute(text('DELETE FROM video_fts')); conn.execute(text('DELETE FROM user_fts'))
+        conn.execute(text('INSERT INTO video_fts(rowid, caption, category, username) '
+                          'SELECT v.id, v.caption, v.category, u.username FROM video v LEFT JOIN "user" u ON u.id = v.user_id'))
+        conn.execute(text('INSERT INTO user_fts(rowid, username) SELECT id, username FROM "user"'))
+        conn.execute(text("INSERT INTO video_fts(video_fts) VALUES ('optimize')"))
+        return conn.execute(text('SELECT count(*) FROM video_fts')).scalar()
+
+    def add_video(self, conn, v):
+        self.setup(conn); self.remove_video(conn, v.id)
+        conn.execute(text('INSERT INTO video_fts(rowid, caption, category, username) '
+                          'VALUES (:id, :caption, :category, (SELECT username FROM "user" WHERE id = :uid))'),
+                     {'id': v.id, 'caption': v.caption, 'category': v.category, 'uid': v.user_id})
+
+    def remove_video(self, conn, vid):
+        self.setup(conn); conn.execute(text('DELETE FROM video_fts WHERE rowid = :id'), {'id': vid})
+
+    def add_user(self, conn, u):
+        self.setup(conn); self.remove_user(conn, u.id)
+        conn.execute(text('INSERT INTO user_fts(rowid, username) VALUES (:id, :name)'), {'id': u.id, 'name': u.username})
+
+    def remove_user(self, conn, uid):
+        self.setup(conn); conn.execute(text('DELETE FROM user_fts WHERE rowid = :id'), {'id': uid})
+
+    def rebuild(self):
+        conn = db.session.connection(); self.setup(conn)
+        n = self._fill(conn); db.session.commit(); return n
+
+    @staticmethod
+    def match(q):
+        """User text → FTS5 query: every word must match, each as a prefix (typeahead)."""
+        return ' '.join(f'"{t}"*' for t in re.findall(r'[^\W_]+', q.lower())[:8])
+
+    def user_ids(self, q, limit, offset=0):
+        m = self.match(q)
+        if not m: return []
+        conn = db.session.connection(); self.setup(conn)
+        return conn.execute(text('SELECT f.rowid FROM user_fts f JOIN "user" u ON u.id = f.rowid WHERE user_fts MATCH :m '
+                                 'ORDER BY f.rank, u.follower_count DESC LIMIT :l OFFSET :o'),
+                            {'m': m, 'l': limit, 'o': offset}).scalars().all()
+
+    def video_ids(self, q, limit, offset=0):
+        m = self.match(q)
+        if not m: return []
+        conn = db.session.connection(); self.setup(conn)
+        # bm25 has to score every hit, so broad terms ("kedi") only rank the newest
+        # RANK_WINDOW matches – a rowid range FTS5 resolves from the doclist directly;
+        # older matches follow the ranked ones newest-first
+        cut = conn.execute(text('SELECT rowid FROM video_fts WHERE video_fts MATCH :m '
+                                'ORDER BY rowid DESC LIMIT 1 OFFSET :w'), {'m': m, 'w': self.RANK_WINDOW - 1}).scalar() or 0
+        live = "FROM video_fts f JOIN video v ON v.id = f.rowid WHERE video_fts MATCH :m AND v.moderation_status = 'approved' "
+        ids = conn.execute(text(f'SELECT f.rowid {live} AND f.rowid >= :c '
+                                f'ORDER BY bm25(video_fts, {self.WEIGHTS}), v.id DESC LIMIT :l OFFSET :o'),
+                           {'m': m, 'c': cut, 'l': limit, 'o': offset}).scalars().all()
+        if len(ids) == limit or not cut: return ids
+        ranked = conn.execute(text(f'SELECT count(*) {live} AND f.rowid >= :c'), {'m': m, 'c': cut}).scalar()
+        return ids + conn.execute(text(f'SELECT f.rowid {live} AND f.rowid < :c ORDER BY f.rowid DESC LIMIT :l OFFSET :o'),
+                                  {'m': m, 'c': cut, 'l': limit - len(ids), 'o': max(0, offset - ranked)}).scalars().all()
+
+def make_search_index():
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'): return SearchIndex()
+    import sqlite3
+    try:
+        sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE t USING fts5(x)')
+    except sqlite3.OperationalError:
+        return SearchIndex()       # sqlite built without FTS5
+    return FTS5Search()
+
+search_index = make_search_index()
+
+@event.listens_for(Video, 'after_insert')
+def _index_new_video(mapper, conn, v): search_index.add_video(conn, v)
+
+@event.listens_for(Video, 'after_update')
+def _index_edited_video(mapper, conn, v):
+    st = db.inspect(v)
+    if st.attrs.caption.history.has_changes() or st.attrs.category.history.has_changes():
+        search_index.add_video(conn, v)
+
+@event.listens_for(Video, 'after_delete')
+def _unindex_video(mapper, conn, v): search_index.remove_video(conn, v.id)
+
+@event.listens_for(User, 'after_insert')
+def _index_new_user(mapper, conn, u): search_index.add_user(conn, u)
+
+@event.listens_for(User, 'after_delete')
+def _unindex_user(mapper, conn, u): search_index.remove_user(conn, u.id)
+
+def run_search(q, page=1, per_page=SEARCH_PAGE_SIZE, with_users=True):
+    """(users, videos, has_more) in rank order; users only on the first page."""
+    t0 = time.perf_counter()
+    offset = (page - 1) * per_page
+    ids = search_index.video_ids(q, per_page + 1, offset)
+    by_id = {v.id: v for v in Video.query.options(joinedload(Video.user)).filter(Video.id.in_(ids[:per_page]))}
+    videos = [by_id[i] for i in ids[:per_page] if i in by_id]
+    users = []
+    if with_users and page == 1:
+        uids = search_index.user_ids(q, per_page)
+        by_uid = {u.id: u for u in User.query.filter(User.id.in_(uids))}
+        users = [by_uid[i] for i in uids if i in by_uid]
+    metrics.observe('search.query', time.perf_counter() - t0)
+    return users, videos, len(ids) > per_page
+
+# ─────────────────────────── TRENDING ───────────────────────────
+# score = log2(1 + weighted engagement) + hours_since_epoch / half_life
+#       = log2(engagement × 2^(age / half_life)) + const  → ordering is the same as decaying
+# every score over time, but a stored score only changes when its engagement does.
+def trend_base(created_at):
+    """Score of a video with no engagement yet – newer is higher."""
+    return (created_at - TREND_EPOCH).total_seconds() / 3600 / TRENDING_HALF_LIFE
+
+def trend_scores(views, likes_, comments, saves, created):
+    """Column-wise score for a whole batch (numpy when available)."""
+    w = TREND_WEIGHTS
+    if np is None:
+        return [math.log2(1 + w[0] * (a or 0) + w[1] * (b or 0) + w[2] * (c or 0) + w[3] * d)
+                + trend_base(t if isinstance(t, datetime) else datetime.fromisoformat(t))
+                for a, b, c, d, t in zip(views, likes_, comments, saves, created)]
+    col = lambda xs: np.fromiter((x or 0 for x in xs), np.float64, len(xs))
+    engagement = w[0] * col(views) + w[1] * col(likes_) + w[2] * col(comments) + w[3] * col(saves)
+    hours = (np.array(created, dtype='datetime64[us]') - np.datetime64(TREND_EPOCH, 'us')) / np.timedelta64(1, 'h')
+    return (np.log2(1 + engagement) + hours / TRENDING_HALF_LIFE).tolist()
+
+def recompute_trending(full=False, batch=50000):
+    """Rescore the whole catalog (full) or only videos young enough to still trend.
+    Writes back only scores that moved; returns how many."""
+    t0 = time.perf_counter()
+    V = Video.__table__.c
+    # created_at stays the driver's raw value (ISO text on SQLite) – numpy parses it in one go
+    q  = select(V.id, V.views, V.like_count, V.comment_count, type_coerce(V.created_at, String), V.trend_score)
+    bq = select(bookmarks.c.video_id, func.count()).group_by(bookmarks.c.video_id)
+    if not full:
+        since = datetime.utcnow() - timedelta(days=TRENDING_WINDOW_DAYS)
+        q  = q.where(V.created_at >= since)
+        bq = bq.where(bookmarks.c.video_id.in_(select(V.id).where(V.created_at >= since)))
+    rows = db.session.execute(q).all()
+    if not rows: return 0
+    saves = dict(db.session.execute(bq).all())
+    ids, views, likes_, comments, created, old = zip(*rows)
+    new = trend_scores(views, likes_, comments, [saves.get(i, 0) for i in ids], created)
+    changed = [(s, i) for i, s, o in zip(ids, new, old) if o is None or abs(s - o) > 1e-9]
+    # plain DB-API executemany: per-row statement compilation would cost more than the UPDATE
+    ph = '?' if db.engine.dialect.paramstyle == 'qmark' else '%s'
+    sql = f'UPDATE video SET trend_score = {ph} WHERE id = {ph}'
+    for k in range(0, len(changed), batch):
+        conn = db.session.connection()
+        if conn.dialect.driver == 'psycopg2':    # its executemany is a loop of round trips
+            from psycopg2.extras import execute_values
+            with conn.connection.cursor() as cur:
+                execute_values(cur, 'UPDATE video SET trend_score = v.s FROM (VALUES %s) AS v(s, id) '
+                                    'WHERE video.id = v.id', changed[k:k + batch], page_size=5000)
+        else:
+            conn.exec_driver_sql(sql, changed[k:k + batch])
+        db.session.commit()
+    metrics.observe('trending.recompute_full' if full else 'trending.recompute', time.perf_counter() - t0)
+    metrics.gauge('trending.rows_changed', len(changed))
+    return len(changed)
+
+# ─────────────────────────── BACKGROUND JOBS ───────────────────────────
+PERIODIC_JOBS = []      # (name, seconds, fn)
+
+def periodic(name, seconds):
+    """Register fn to run every `seconds` in its own greenlet, inside an app context."""
+    def deco(fn):
+        PERIODIC_JOBS.append((name, seconds, fn)); return fn
+    return deco
+
+def _job_loop(name, seconds, fn):
+    while True:
+        socketio.sleep(seconds)
+        t0 = time.perf_counter()
+        try:
+            with app.app_context(): fn()
+        except Exception:
+            metrics.incr(f'job.{name}.errors'); app.logger.exception('job %s failed', name)
+        metrics.observe(f'job.{name}', time.perf_counter() - t0)
+
+WORKERS = []            # long-running loops, one greenlet each
+
+def worker(fn):
+    WORKERS.append(fn); return fn
+
+_jobs_started = False
+
+@app.before_request
+def start_background_jobs():
+    global _jobs_started
+    if _jobs_started or app.config.get('TESTING'): return
+    _jobs_started = True
+    for name, seconds, fn in PERIODIC_JOBS:
+        socketio.start_background_task(_job_loop, name, seconds, fn)
+    for fn in WORKERS:
+        socketio.start_background_task(fn)
+
+@worker
+def identity_listener():
+    if identity_bus.url: identity_bus.listen()
+
+thumb_queue = queue.Queue()     # video ids; gevent-cooperative after patch_all()
+
+@worker
+def thumbnail_worker():
+    while True:
+        vid = thumb_queue.get()
+        metrics.gauge('thumbs.queue_depth', thumb_queue.qsize())
+        t0 = time.perf_counter()
+        try:
+            with app.app_context():
+                v = db.session.get(Video, vid)
+                if v and make_thumbnails(v):
+                    db.session.commit(); metrics.incr('thumbs.done')
+                    invalidate_pages(f'video:{v.id}', f'user:{v.user_id}', 'feed')
+                else:
+                    metrics.incr('thumbs.skipped')
+        except Exception:
+            metrics.incr('thumbs.errors'); app.logger.exception('thumbnail %s failed', vid)
+        metrics.observe('thumbs.job', time.perf_counter() - t0)
+
+def claim_job(model, worker_id, alive, stale_after):
+    """Take the oldest runnable job of a queue table (TranscodeJob, PurgeJob). A 'running' job whose
+    `alive` column is older than stale_after seconds is presumed dead and retaken; the conditional
+    UPDATE is the lock, so two workers never win the same job."""
+    now   = datetime.utcnow()
+    alive = getattr(model, alive)
+    runnable = or_(and_(model.state == 'queued', model.run_after <= now),
+                   and_(model.state == 'running', alive < now - timedelta(seconds=stale_after)))
+    for jid in db.session.scalars(select(model.id).where(runnable).order_by(model.id).limit(5)):
+        won = db.session.execute(update(model).where(model.id == jid, runnable)
+                                 .values({alive: now, model.state: 'running', model.worker: worker_id,
+                                          model.attempts: model.attempts + 1})).rowcount
+        db.session.commit()
+        if won: return db.session.get(model, jid)
+    return None
+
+def retry_job(model, jid, max_attempts, delay, error):
+    """After a crash mid-job (session already rolled back): requeue in `delay` s, or 'failed' once out of attempts."""
+    db.session.execute(update(model).where(model.id == jid).values(
+        state=case((model.attempts >= max_attempts, 'failed'), else_='queued'),
+        run_after=datetime.utcnow() + timedelta(seconds=delay), last_error=str(error)[:500]))
+    db.session.commit()
+
+def run_transcode_job(job):
+    v, t0 = job.video, time.perf_counter()
+    if v is None or v.moderation_status == 'deleted':
+        job.state = 'done'; db.session.commit(); return
+    if not v.hls: v.processing = 'running'
+    db.session.commit()
+    ok, err = transcode_hls(v)
+    job.finished_at, job.last_error = datetime.utcnow(), err
+    if ok:
+        job.state, v.processing = 'done', 'ready'; metrics.incr('transcode.done')
+    elif job.attempts >= TRANSCODE_MAX_ATTEMPTS:
+        job.state = 'failed'; metrics.incr('transcode.failed')
+        if not v.hls: v.processing = 'failed'
+    else:
+        job.state = 'queued'; metrics.incr('transcode.retries')
+        job.run_after = datetime.utcnow() + timedelta(seconds=60 * 2 ** job.attempts)
+        if not v.hls: v.processing = 'queued'
+    db.session.commit()
+    if ok: invalidate_pages(f'video:{v.id}')
+    metrics.observe('transcode.job', time.perf_counter() - t0)
+    app.logger.info('transcode job %s video %s: %s', job.id, v.id, job.state)
+
+def transcode_loop(worker_id, poll=2.0, once=False):
+    """Claim/run jobs until the queue is empty (once=True) or forever. Needs an app context."""
+    while True:
+        metrics.gauge('transcode.queue_depth',
+                      TranscodeJob.query.filter_by(state='queued').count())
+        job = claim_job(TranscodeJob, worker_id, 'started_at', TRANSCODE_TIMEOUT + 300)
+        if job:
+            jid = job.id
+            try:
+                run_transcode_job(job)
+            except Exception as e:
+                db.session.rollback(); metrics.incr('transcode.errors')
+                app.logger.exception('transcode job %s failed', jid)
+                retry_job(TranscodeJob, jid, TRANSCODE_MAX_ATTEMPTS, 300, e)
+            continue
+        db.session.remove()
+        if once: return
+        socketio.sleep(poll)
+
+def transcode_worker(n):
+    with app.app_context(): transcode_loop(f'{os.getpid()}:{n}')
+
+WORKERS.extend(partial(transcode_worker, i) for i in range(TRANSCODE_WORKERS))
+
+_trending_backfilled = False
+
+@periodic('trending', TRENDING_INTERVAL)
+def trending_job():
+    # rows that predate the column (score 0) need one full pass; after that the window is enough
+    global _trending_backfilled
+    full = not _trending_backfilled and Video.query.filter(Video.trend_score == 0).first() is not None
+    recompute_trending(full=full); _trending_backfilled = True
+
+@periodic('presence_heartbeat', max(PRESENCE_TTL // 3, 1))
+def presence_heartbeat():
+    """Refresh this worker's connections in the shared store; a dead worker's entries expire."""
+    conns = {}
+    for sid, uid in list(local_sockets.items()): conns.setdefault(uid, []).append(sid)
+    if conns: presence.touch(conns)
+    metrics.gauge('presence.local_sockets', len(local_sockets))
+
+_rate_base = {}
+
+@periodic('socket_rates', 5)
+def socket_rates():
+    """Per-second gauges for outbound frames; reactions.broadcast_equivalent_per_sec is what
+    the old one-broadcast-per-tap relay would have sent for the same taps."""
+    now, counters = time.monotonic(), metrics.snapshot()['counters']
+    names = [k for k in counters if k.startswith('socket.frames')] + \
+            ['reactions.taps', 'reactions.throttled', 'reactions.broadcast_equivalent', 'typing.events']
+    then, last = _rate_base.get('t'), _rate_base.get('c', {})
+    if then:
+        for k in names:
+            metrics.gauge(f'{k}_per_sec', round((counters.get(k, 0) - last.get(k, 0)) / (now - then), 1))
+    _rate_base.update(t=now, c=counters)
+    stale = now - TYPING_REFRESH * 3
+    for k, t in list(typing_sent.items()):
+        if t < stale: typing_sent.pop(k, None)
+    metrics.gauge('socket.local_connections', local_room_size())
+
+@periodic('admin_stats', ADMIN_STATS_INTERVAL)
+def admin_stats_job():
+    refresh_admin_stats()
+
+@periodic('upload_gc', 3600)
+def upload_gc_job():
+    cutoff = datetime.utcnow() - timedelta(seconds=UPLOAD_SESSION_TTL)
+    for s in UploadSession.query.filter(UploadSession.created_at < cutoff).limit(500).all():
+        if os.path.exists(s.path): os.remove(s.path)
+        upload_hashers.delete(s.id); db.session.delete(s)
+    db.session.commit()
+
+@periodic('notif_retention', int(os.environ.get('NOTIF_RETENTION_INTERVAL', 3600)))
+def notif_retention_job():
+    compact_notifications()
+
+# ─────────────────────────── PURGE ───────────────────────────
+# Deleting a user or video is two phases. The request only tombstones it (video status
+# 'deleted', user.deleted_at) and queues a PurgeJob; everything reading videos/users already
+# skips those. The purge worker then removes dependent rows PURGE_BATCH at a time, one short
+# transaction each, releasing the counters they fed, and finally the files and the row itself.
+VIDEO_NOTIFS = ('like', 'comment')
+
+def tombstone_video(v, admin_id=None):
+    """Hide now, purge later. Caller commits."""
+    if v.moderation_status == 'deleted': return
+    v.moderation_status = 'deleted'
+    bump(User, v.user_id, video_count=-1)
+    db.session.add(PurgeJob(kind='video', target_id=v.id, admin_id=admin_id,
+                            label=f"video #{v.id} (@{v.user.username if v.user else '?'})"))
+
+def tombstone_user(u, admin_id=None):
+    """Log-in, profile, search and all of the user's videos go dark at once. Caller commits."""
+    if u.deleted_at: return
+    u.deleted_at = datetime.utcnow()
+    Video.query.filter_by(user_id=u.id).update({'moderation_status': 'deleted'}, synchronize_session=False)
+    search_index.remove_user(db.session.connection(), u.id)
+    db.session.add(PurgeJob(kind='user', target_id=u.id, admin_id=admin_id, label=f'@{u.username}'))
+
+def release_counts(model, col, counts):
+    """{pk: n} → `col = col - n`, one UPDATE per distinct n."""
+    by_n = {}
+    for pk, n in counts.items(): by_n.setdefault(n, []).append(pk)
+    for n, ids in by_n.items():
+        db.session.execute(update(model).where(model.id.in_(ids)).values({col: getattr(model, col) - n}))
+
+def purge_links(table, col, value, other, release=None):
+    """One batch of `table` rows with col == value. Association tables have no key, so the batch is
+    PURGE_BATCH distinct values of the other column; `release` (model, counter) decrements them first."""
+    ids = db.session.scalars(select(table.c[other]).where(table.c[col] == value)
+                             .distinct().limit(PURGE_BATCH)).all()
+    if not ids: return 0
+    if release: release_counts(*release, dict.fromkeys(ids, 1))
+    return db.session.execute(table.delete().where(table.c[col] == value, table.c[other].in_(ids))).rowcount
+
+def purge_rows(model, *where):
+    ids = db.session.scalars(select(model.id).where(*where).order_by(model.id).limit(PURGE_BATCH)).all()
+    if not ids: return 0
+    return db.session.execute(delete(model).where(model.id.in_(ids))).rowcount
+
+def purge_comments(where, release=False):
+    """Newest first, so replies (always younger than their parent) go before it; with release the
+    surviving videos' comment_count and parents' reply_count are decremented."""
+    rows = db.session.execute(select(Comment.id, Comment.video_id, Comment.parent_id).where(where)
+                              .order_by(Comment.id.desc()).limit(PURGE_BATCH)).all()
+    if not rows: return 0
+    ids = [r.id for r in rows]
+    db.session.execute(comment_likes.delete().where(comment_likes.c.comment_id.in_(ids)))
+    if release:
+        per_video, per_parent, gone = {}, {}, set(ids)
+        for r in rows:
+            per_video[r.video_id] = per_video.get(r.video_id, 0) + 1
+            if r.parent_id and r.parent_id not in gone: per_parent[r.parent_id] = per_parent.get(r.parent_id, 0) + 1
+        release_counts(Video, 'comment_count', per_video); release_counts(Comment, 'reply_count', per_parent)
+    db.session.execute(delete(Comment).where(Comment.id.in_(ids)))
+    return len(rows)
+
+def video_purge_steps(vid):
+    return [
+        ('yorumlar',  lambda: purge_comments(Comment.video_id == vid)),
+        ('beğeniler', lambda: purge_links(likes, 'video_id', vid, 'user_id')),
+        ('kaydetmeler', lambda: purge_links(bookmarks, 'video_id', vid, 'user_id')),
+        ('şikayetler', lambda: purge_rows(Report, Report.video_id == vid)),
+        ('transcode', lambda: purge_rows(TranscodeJob, TranscodeJob.video_id == vid)),
+        ('bildirimler', lambda: purge_rows(Notification, Notification.post_id == vid,
+                                           Notification.type.in_(VIDEO_NOTIFS))),
+    ]
+
+def purge_video_batch(v):
+    """One batch of v's dependents; once none are left the files and the row → (step, rows), 0 rows when gone."""
+    if v is None: return None, 0
+    for step, fn in video_purge_steps(v.id):
+        n = fn()
+        if n: return step, n
+    remove_media(v)
+    search_index.remove_video(db.session.connection(), v.id)
+    db.session.execute(delete(Video).where(Video.id == v.id))
+    return 'dosyalar', 1
+
+def purge_uploads(uid):
+    sessions = UploadSession.query.filter_by(user_id=uid).limit(PURGE_BATCH).all()
+    for s in sessions:
+        if os.path.exists(s.path): os.remove(s.path)
+        upload_hashers.delete(s.id)
+    return purge_rows(UploadSession, UploadSession.id.in_([s.id for s in sessions])) if sessions else 0
+
+def user_purge_steps(uid):
+    C = aliased(Comment)
+    mine = or_(Comment.user_id == uid, Comment.parent_id.in_(select(C.id).where(C.user_id == uid)))
+    return [
+        ('takip edilenler', lambda: purge_links(followers, 'follower_id', uid, 'followed_id', (User, 'follower_count'))),
+        ('takipçiler',  lambda: purge_links(followers, 'followed_id', uid, 'follower_id', (User, 'following_count'))),
+        ('beğeniler',   lambda: purge_links(likes, 'user_id', uid, 'video_id', (Video, 'like_count'))),
+        ('yorum beğenileri', lambda: purge_links(comment_likes, 'user_id', uid, 'comment_id', (Comment, 'like_count'))),
+        ('kaydetmeler', lambda: purge_links(bookmarks, 'user_id', uid, 'video_id')),
+        ('yorumlar',    lambda: purge_comments(mine, release=True)),
+        ('videolar',    lambda: purge_video_batch(Video.query.filter_by(user_id=uid).order_by(Video.id).first())[1]),
+        ('mesajlar',    lambda: purge_rows(Message, or_(Message.sender_id == uid, Message.recipient_id == uid))),
+        ('sohbetler',   lambda: purge_rows(Conversation, or_(Conversation.user_a_id == uid, Conversation.user_b_id == uid))),
+        ('bildirimler', lambda: purge_rows(Notification, or_(Notification.recipient_id == uid, Notification.sender_id == uid))),
+        ('şikayetler',  lambda: purge_rows(Report, Report.reporter_id == uid)),
+        ('yüklemeler',  lambda: purge_uploads(uid)),
+    ]
+
+def purge_user_batch(u):
+    if u is None: return None, 0
+    for step, fn in user_purge_steps(u.id):
+        n = fn()
+        if n: return step, n
+    p = media_path(u.avatar)
+    if p and os.path.exists(p): os.remove(p)
+    db.session.execute(delete(User).where(User.id == u.id))
+    return 'hesap', 1
+
+def purge_log(job, text):
+    if job.admin_id:
+        db.session.add(AdminLog(admin_id=job.admin_id, action_type='purge', description=text[:300]))
+
+def run_purge_job(job):
+    """Batch until the target is gone; each batch commits on its own so the write lock is never held long."""
+    t0 = last_log = time.monotonic()
+    model, batch = (Video, purge_video_batch) if job.kind == 'video' else (User, purge_user_batch)
+    if job.attempts == 1: purge_log(job, f"Silme başladı: {job.label}")
+    while True:
+        step, n = batch(db.session.get(model, job.target_id))
+        if not n: break
+        job.step, job.removed, job.heartbeat_at = step, job.removed + n, datetime.utcnow()
+        if time.monotonic() - last_log >= PURGE_LOG_EVERY:
+            purge_log(job, f"Siliniyor: {job.label} – {job.removed} satır, şu an {step}"); last_log = time.monotonic()
+        db.session.commit(); db.session.expire_all()
+        metrics.incr('purge.rows', n)
+        socketio.sleep(0)           # batch'ler arasında diğer istekler de yazabilsin
+    job.state, job.finished_at, job.step = 'done', datetime.utcnow(), None
+    purge_log(job, f"Silme tamamlandı: {job.label} – {job.removed} satır, {time.monotonic() - t0:.1f} sn")
+    db.session.commit()
+    metrics.incr('purge.done'); metrics.observe('purge.job', time.monotonic() - t0)
+
+def purge_loop(worker_id, poll=5.0, once=False):
+    """Claim/run purge jobs until the queue is empty (once=True) or forever. Needs an app context."""
+    while True:
+        job = claim_job(PurgeJob, worker_id, 'heartbeat_at', PURGE_STALE)
+        if job:
+            jid = job.id
+            try:
+                run_purge_job(job)
+            except Exception as e:
+                db.session.rollback(); metrics.incr('purge.errors')
+                app.logger.exception('purge job %s failed', jid)
+                retry_job(PurgeJob, jid, PURGE_MAX_ATTEMPTS, 60, e)
+            continue
+        metrics.gauge('purge.queue_depth', PurgeJob.query.filter_by(state='queued').count())
+        db.session.remove()
+        if once: return
+        socketio.sleep(poll)
+
+@worker
+def purge_worker():
+    with app.app_context(): purge_loop(f'{os.getpid()}:purge')
 
 # ─────────────────────────── SOCKET.IO ───────────────────────────
+# With SOCKETIO_MESSAGE_QUEUE set, every emit below (rooms, broadcast) fans out to all workers.
+def is_id(v): return isinstance(v, int) and not isinstance(v, bool)
+
 @socketio.on('connect')
 def on_connect():
+    start_background_jobs()     # a worker may only ever see socket traffic – heartbeats must still run
     if current_user.is_authenticated:
         join_room(f'user_{current_user.id}')
-        online_users.setdefault(current_user.id, set()).add(request.sid)
-        emit('user_status', {'user_id': current_user.id, 'status': 'online'}, broadcast=True)
+        local_sockets[request.sid] = current_user.id
+        presence.touch({current_user.id: [request.sid]})
+        emit('user_status', {'user_id': current_user.id, 'status': 'online'}, room=f'presence_{current_user.id}')
+        for m in undelivered_messages(current_user.id):     # client acks with `delivered`
+            emit('receive_message', message_json(m, replayed=True))
 
 @socketio.on('disconnect')
 def on_disconnect():
-    if current_user.is_authenticated and current_user.id in online_users:
-        online_users[current_user.id].discard(request.sid)
-        if not online_users[current_user.id]:
-            del online_users[current_user.id]
-            emit('user_status', {'user_id': current_user.id, 'status': 'offline'}, broadcast=True)
+    watching.pop(request.sid, None); reactions.forget(request.sid)
+    uid = local_sockets.pop(request.sid, None)
+    if uid is not None and presence.drop(uid, request.sid):
+        emit('user_status', {'user_id': uid, 'status': 'offline'}, room=f'presence_{uid}')
+
+@socketio.on('watch_presence')
+def on_watch_presence(data):
+    """Subscribe to user_status of a few users – a broadcast per connect would be O(sockets²)."""
+    uids = data.get('user_ids') if isinstance(data, dict) else None
+    if not isinstance(uids, list): return
+    for uid in filter(is_id, uids[:100]):
+        join_room(f'presence_{uid}')
 
 @socketio.on('send_message')
 def on_send_message(data):
-    body = data.get('body', '').strip()
-    if not body or contains_bad_words(body): return
-    msg = Message(sender_id=current_user.id, recipient_id=data['recipient_id'], body=body)
-    db.session.add(msg); db.session.commit()
-    ts = msg.timestamp.strftime('%H:%M')
-    emit('receive_message', {'sender_id': current_user.id, 'body': body, 'timestamp': ts},
-         room=f"user_{data['recipient_id']}")
-    emit('message_sent', {'body': body, 'timestamp': ts})
+    """Validate and hand over to chat_writer; the return value is the Socket.IO ack."""
+    if not isinstance(data, dict): return
+    client_id = data.get('client_id')
+    if not current_user.is_authenticated: return {'error': 'auth', 'client_id': client_id}
+    body, rid = data.get('body'), data.get('recipient_id')
+    if not is_id(rid) or rid == current_user.id: return {'error': 'recipient', 'client_id': client_id}
+    body = body.strip() if isinstance(body, str) else ''
+    if not body or len(body) > 1000 or contains_bad_words(body): return {'error': 'body', 'client_id': client_id}
+    msg = chat_writer.submit(OutgoingMessage(current_user.id, rid, body, client_id))
+    db.session.close()          # don't sit on a pooled connection while the batch commits
+    if not msg.done.wait(CHAT_ACK_TIMEOUT):
+        metrics.incr('chat.ack_timeouts'); return {'error': 'timeout', 'client_id': client_id}
+    return msg.ack
+
+@socketio.on('delivered')
+def on_delivered(data):
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list): return
+    ids = [i for i in ids[:CHAT_REPLAY_LIMIT] if is_id(i)]
+    if current_user.is_authenticated and ids: chat_writer.mark_delivered(current_user.id, ids)
+
+@socketio.on('mark_read')
+def on_mark_read(data):
+    sid = data.get('sender_id') if isinstance(data, dict) else None
+    if current_user.is_authenticated and is_id(sid):
+        mark_conversation_read(current_user.id, sid)
 
 @socketio.on('typing')
 def on_typing(data):
-    emit('display_typing', {'sender_id': current_user.id}, room=f"user_{data['recipient_id']}")
+    """Clients fire this per keystroke; forward at most once per TYPING_REFRESH, the receiver
+    hides the indicator by itself if neither a refresh nor stop_typing follows."""
+    rid = data.get('recipient_id') if isinstance(data, dict) else None
+    if not current_user.is_authenticated or not is_id(rid): return
+    key, now = (current_user.id, rid), time.monotonic()
+    metrics.incr('typing.events')
+    if key in typing_sent and now - typing_sent[key] < TYPING_REFRESH: return
+    typing_sent[key] = now
+    emit('display_typing', {'sender_id': key[0]}, room=f'user_{key[1]}')
+    count_frames('display_typing', f'user_{key[1]}')
 
 @socketio.on('stop_typing')
 def on_stop_typing(data):
-    emit('hide_typing', {'sender_id': current_user.id}, room=f"user_{data['recipient_id']}")
+    rid = data.get('recipient_id') if isinstance(data, dict) else None
+    if not current_user.is_authenticated or not is_id(rid): return
+    key = (current_user.id, rid)
+    if typing_sent.pop(key, None) is None: return      # nothing shown on the other side
+    emit('hide_typing', {'sender_id': key[0]}, room=f'user_{key[1]}')
+    count_frames('hide_typing', f'user_{key[1]}')
+
+@socketio.on('watch_video')
+def on_watch_video(data):
+    """The feed reports the video on screen; reactions only go to that video's room."""
+    if not isinstance(data, dict): return
+    vid, old = data.get('video_id'), watching.pop(request.sid, None)
+    if old is not None and old != vid: leave_room(f'video_{old}')
+    if is_id(vid):
+        join_room(f'video_{vid}'); watching[request.sid] = vid
 
 @socketio.on('send_reaction')
 def on_reaction(data):
-    emit('animate_reaction', {'emoji': data['emoji']}, broadcast=True)
+    if not isinstance(data, dict): return
+    emoji, vid = data.get('emoji'), data.get('video_id')
+    if not isinstance(emoji, str) or emoji not in REACTION_EMOJIS or not is_id(vid): return
+    if not reactions.allow(request.sid):
+        metrics.incr('reactions.throttled'); return
+    metrics.incr('reactions.taps'); metrics.incr('reactions.broadcast_equivalent', local_room_size())
+    reactions.add(vid, emoji)
+
+# ─────────────────────────── PASSWORDS ───────────────────────────
+class HashBusy(Exception):
+    """Hash havuzu dolu ya da iş HASH_TIMEOUT içinde bitmedi."""
+
+class HashPool:
+    """pbkdf2/scrypt on native threads (hashlib releases the GIL), so a login burst no longer
+    freezes every greenlet in the worker. At most `queue` jobs wait behind the `workers`
+    running ones; past that, or when a job overruns `timeout`, HashBusy is raised instead of
+    letting requests pile up. workers=0 hashes inline as before."""
+    def __init__(self, workers, queue, timeout, name='pw_pool'):
+        self.workers, self.queue, self.timeout, self.name = workers, queue, timeout, name
+        self.pending, self._pool = 0, None
+
+    def run(self, fn, *args):
+        if not self.workers: return fn(*args)
+        if self.pending >= self.workers + self.queue:
+            metrics.incr(f'{self.name}.rejected'); raise HashBusy()
+        if self._pool is None:
+            from gevent.threadpool import ThreadPool
+            self._pool = ThreadPool(self.workers)
+        self.pending += 1; metrics.gauge(f'{self.name}.pending', self.pending)
+        t, res = time.perf_counter(), self._pool.spawn(fn, *args)
+        res.rawlink(self._done)     # zaman aşımında da iş, thread gerçekten bitene kadar sayılır
+        try:
+            return res.get(timeout=self.timeout)
+        except gevent.Timeout:
+            metrics.incr(f'{self.name}.timeout'); raise HashBusy()
+        finally:
+            metrics.observe(self.name, time.perf_counter() - t)
+
+    def _done(self, _):
+        self.pending -= 1; metrics.gauge(f'{self.name}.pending', self.pending)
+
+hash_pool      = HashPool(HASH_WORKERS, HASH_QUEUE, HASH_TIMEOUT)
+login_attempts = make_counter_cache('login_attempts', LOGIN_WINDOW)   # {'ip:…' | 'user:…': n}
+# 'scrypt' → 'scrypt:32768:8:1': the prefix werkzeug actually writes; hashed once at import, not on the hub later
+PASSWORD_SPEC  = generate_password_hash('', PASSWORD_METHOD).split('$', 1)[0]
+
+def _check_and_upgrade(stored, password):
+    if not check_password_hash(stored, password): return False, None
+    return True, None if stored.split('$', 1)[0] == PASSWORD_SPEC else generate_password_hash(password, PASSWORD_METHOD)
+
+def hash_password(password):
+    return hash_pool.run(generate_password_hash, password, PASSWORD_METHOD)
+
+def verify_password(user, password):
+    """Check off the hub; a match stored with older settings gets a PASSWORD_METHOD hash (caller commits)."""
+    ok, new = hash_pool.run(_check_and_upgrade, user.password, password)
+    if new: user.password = new; metrics.incr('auth.rehashed')
+    return ok
+
+def note_attempt(key):
+    if login_attempts.incr(key) is None: login_attempts.set(key, 1)
+
+def login_throttled(ip, username=None):
+    """LOGIN_IP_LIMIT attempts from one IP, or LOGIN_USER_LIMIT wrong passwords for one name, per LOGIN_WINDOW."""
+    hit = lambda key, limit: limit and (login_attempts.get(key) or 0) >= limit
+    if hit(f'ip:{ip}', LOGIN_IP_LIMIT) or (username and hit(f'user:{username}', LOGIN_USER_LIMIT)):
+        metrics.incr('auth.throttled'); return True
+    return False
+
+def auth_refused(template, status):
+    flash('Çok fazla deneme! Biraz sonra tekrar dene.' if status == 429 else
+          'Sunucu şu an çok yoğun, birkaç saniye sonra tekrar dene.')
+    return render_template(template), status, {'Retry-After': str(LOGIN_WINDOW if status == 429 else 5)}
 
 # ─────────────────────────── AUTH ───────────────────────────
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated: return redirect(url_for('index'))
     if request.method == 'POST':
-        user = User.query.filter_by(username=request.form.get('username', '')).first()
-        if user and check_password_hash(user.password, request.form.get('password', '')):
+        username = request.form.get('username', '')
+        if login_throttled(request.remote_addr, username): return auth_refused('login.html', 429)
+        note_attempt(f'ip:{request.remote_addr}')
+        user = User.query.filter_by(username=username, deleted_at=None).first()
+        try:
+            ok = user is not None and verify_password(user, request.form.get('password', ''))
+        except HashBusy:
+            return auth_refused('login.html', 503)
+        if ok:
+            login_attempts.delete(f'user:{username}')
             if user.username == 'tavugeymosu' and not user.is_super_admin:
                 user.is_super_admin = user.is_admin = True
                 user.perm_ban_user = user.perm_delete_video = user.perm_verify_user = True
                 user.is_verified = True; user.badge_key = 'king'
-                db.session.commit()
+            if db.session.is_modified(user): db.session.commit(); invalidate_identity(user.id)
             login_user(user)
             return redirect(url_for('index'))
+        note_attempt(f'user:{username}')
         flash('Kullanıcı adı veya şifre hatalı!')
     return render_template('login.html')
 
@@ -289,16 +2372,26 @@ def register():
         if not username or not password:
             flash('Kullanıcı adı ve şifre zorunlu!')
             return render_template('register.html')
+        if login_throttled(request.remote_addr): return auth_refused('register.html', 429)
+        note_attempt(f'ip:{request.remote_addr}')
         if User.query.filter_by(username=username).first():
             flash('Bu kullanıcı adı zaten alınmış!')
             return render_template('register.html')
+        try:
+            hashed = hash_password(password)
+        except HashBusy:
+            return auth_refused('register.html', 503)
         is_super = (username == 'tavugeymosu')
-        u = User(username=username,
-                 password=generate_password_hash(password, method='pbkdf2:sha256'),
+        u = User(username=username, password=hashed,
                  is_admin=is_super, is_super_admin=is_super,
                  perm_ban_user=is_super, perm_delete_video=is_super, perm_verify_user=is_super,
                  is_verified=is_super, badge_key='king' if is_super else None)
-        db.session.add(u); db.session.commit()
+        db.session.add(u)
+        try:
+            db.session.commit()
+        except IntegrityError:      # hash beklenirken aynı adı başka biri aldı
+            db.session.rollback(); flash('Bu kullanıcı adı zaten alınmış!')
+            return render_template('register.html')
         login_user(u)
         return redirect(url_for('index'))
     return render_template('register.html')
@@ -310,33 +2403,29 @@ def logout():
 
 # ─────────────────────────── MAIN PAGES ───────────────────────────
 @app.route('/')
+@cached_page()
 def index():
+    tag_page('feed')
     category = request.args.get('category')
-    q = Video.query.filter_by(moderation_status='approved')
-    if category: q = q.filter_by(category=category)
-    videos = q.order_by(Video.created_at.desc()).limit(30).all()
+    sort = 'trending' if request.args.get('sort') == 'trending' else 'new'
+    videos, next_cursor = feed_page(category, sort=sort)
 
-    stories = []
-    if current_user.is_authenticated:
-        followed_ids = [u.id for u in current_user.followed]
-        if followed_ids:
-            seen = set()
-            for v in Video.query.filter(Video.user_id.in_(followed_ids),
-                                        Video.moderation_status == 'approved'
-                                        ).order_by(Video.created_at.desc()).all():
-                if v.user_id not in seen:
-                    stories.append(v); seen.add(v.user_id)
-    return render_template('home.html', videos=videos, stories=stories, active_category=category)
+    stories = get_stories(current_user.id) if current_user.is_authenticated else []
+    load_viewer_state(videos)
+    return render_template('home.html', videos=videos, stories=stories, active_category=category,
+                           next_cursor=next_cursor, sort=sort)
 
 @app.route('/watch/<int:video_id>')
+@cached_page()
 def watch(video_id):
-    target = Video.query.get_or_404(video_id)
+    tag_page('feed', f'video:{video_id}')
+    target = live_video_or_404(video_id)
     if target.moderation_status != 'approved':
         if not (current_user.is_authenticated and current_user.is_admin): abort(404)
-    others = Video.query.filter(Video.id != video_id,
-                                Video.moderation_status == 'approved'
-                               ).order_by(Video.created_at.desc()).limit(15).all()
-    return render_template('feed.html', videos=[target] + others)
+    others, next_cursor = feed_page(limit=15, exclude_id=video_id)
+    videos = [target] + others
+    load_viewer_state(videos)
+    return render_template('feed.html', videos=videos, next_cursor=next_cursor)
 
 @app.route('/upload', methods=['GET', 'POST'])
 @login_required
@@ -352,12 +2441,27 @@ def upload():
         if contains_bad_words(caption):
             flash('Açıklamada uygunsuz kelime!'); return render_template('upload.html')
         ext  = file.filename.rsplit('.', 1)[1].lower()
-        name = f"{uuid.uuid4().hex}.{ext}"
-        file.save(os.path.join(UPLOAD_FOLDER, name))
-        v = Video(filename=f'/static/uploads/{name}', user_id=current_user.id,
-                  caption=caption, category=request.form.get('category', 'Genel'))
-        db.session.add(v); db.session.commit()
-        flash('✅ Video yüklendi!')
+        head = read_exact(file.stream, 12)
+        if sniff_video(head) != VIDEO_MAGIC[ext]:
+            flash('Dosya geçerli bir video değil!'); return render_template('upload.html')
+        part = os.path.join(UPLOAD_FOLDER, f'{uuid.uuid4().hex}.{ext}.part')
+        h = hashlib.sha256(head)
+        try:
+            with open(part, 'wb') as fh:
+                fh.write(head); n = copy_stream(file.stream, fh, h, UPLOAD_MAX_BYTES - len(head))
+        except BaseException:           # istemci koptu / disk hatası: yarım dosya kalmasın
+            if os.path.exists(part): os.remove(part)
+            raise
+        if n == -1:
+            os.remove(part)
+            flash(f'Dosya çok büyük! En fazla {UPLOAD_MAX_BYTES // (1024 * 1024)} MB.')
+            return render_template('upload.html'), 413
+        v, created = publish_video(current_user.id, part, h.hexdigest(), caption,
+                                   request.form.get('category', 'Genel'))
+        db.session.commit(); invalidate_stories(creator_id=current_user.id)
+        invalidate_pages('feed', f'user:{current_user.id}')
+        if created and not v.poster: thumb_queue.put(v.id)
+        flash('✅ Video yüklendi!' if created else 'Bu videoyu zaten yüklemişsin.')
         return redirect(url_for('profile', username=current_user.username))
     return render_template('upload.html')
 
@@ -370,15 +2474,15 @@ def upload_avatar():
     ext  = file.filename.rsplit('.', 1)[1].lower()
     name = f"av_{current_user.id}_{uuid.uuid4().hex[:8]}.{ext}"
     file.save(os.path.join(AVATAR_FOLDER, name))
-    current_user.avatar = f'/static/avatars/{name}'
-    db.session.commit()
+    db.session.get(User, current_user.id).avatar = f'/static/avatars/{name}'
+    db.session.commit(); invalidate_identity(current_user.id); invalidate_pages('feed', f'user:{current_user.id}')
     flash('Profil fotoğrafı güncellendi!')
     return redirect(url_for('profile', username=current_user.username))
 
 @app.route('/edit/<int:video_id>', methods=['GET', 'POST'])
 @login_required
 def edit_video(video_id):
-    video = Video.query.get_or_404(video_id)
+    video = live_video_or_404(video_id)
     if video.user_id != current_user.id and not current_user.is_admin: abort(403)
     if request.method == 'POST':
         caption = request.form.get('caption', '').strip()
@@ -386,143 +2490,270 @@ def edit_video(video_id):
             flash('Uygunsuz kelime!'); return render_template('edit_video.html', video=video)
         video.caption  = caption
         video.category = request.form.get('category', video.category)
-        db.session.commit(); flash('Güncellendi!')
+        db.session.commit(); invalidate_pages('feed', f'video:{video.id}', f'user:{video.user_id}')
+        flash('Güncellendi!')
         return redirect(url_for('profile', username=current_user.username))
     return render_template('edit_video.html', video=video)
 
 @app.route('/delete_video/<int:video_id>', methods=['POST'])
 @login_required
 def delete_video(video_id):
-    video = Video.query.get_or_404(video_id)
+    video = live_video_or_404(video_id)
     if video.user_id != current_user.id and not current_user.is_admin: abort(403)
-    if video.filename.startswith('/static/'):
-        p = video.filename.lstrip('/')
-        if os.path.exists(p): os.remove(p)
-    db.session.delete(video); db.session.commit()
+    tombstone_video(video, admin_id=current_user.id if video.user_id != current_user.id else None)
+    db.session.commit(); invalidate_stories(creator_id=video.user_id)
+    invalidate_pages('feed', f'video:{video.id}', f'user:{video.user_id}')
     flash('Video silindi.')
     return redirect(url_for('profile', username=current_user.username))
 
 @app.route('/apply_verification', methods=['POST'])
 @login_required
 def apply_verification():
-    if current_user.verification_status not in ['none', 'rejected']:
+    me = db.session.get(User, current_user.id)
+    if me.verification_status not in ['none', 'rejected']:
         flash('Zaten başvurdunuz.')
     else:
-        current_user.verification_status = 'pending'; db.session.commit()
+        me.verification_status = 'pending'; db.session.commit()
         flash('Başvurunuz alındı!')
     return redirect(url_for('profile', username=current_user.username))
 
 @app.route('/profile/<username>')
+@cached_page()
 def profile(username):
-    user       = User.query.filter_by(username=username).first_or_404()
-    videos     = Video.query.filter_by(user_id=user.id).order_by(Video.created_at.desc()).all()
+    user       = User.query.filter_by(username=username, deleted_at=None).first_or_404()
+    tag_page(f'user:{user.id}')
+    videos     = Video.query.filter(Video.user_id == user.id, Video.moderation_status != 'deleted'
+                                    ).order_by(Video.created_at.desc()).all()
     is_following = current_user.is_authenticated and current_user.is_following(user)
-    return render_template('profile.html', user=user, videos=videos,
-                           bookmarked=user.bookmarked_videos, is_following=is_following)
+    return render_template('profile.html', user=user, videos=videos, is_following=is_following,
+                           bookmarked=[v for v in user.bookmarked_videos if v.moderation_status != 'deleted'])
 
 @app.route('/search')
+@cached_page()
 def search():
+    tag_page('feed')
     q = request.args.get('q', '').strip()
-    users, videos = [], []
+    page = max(request.args.get('page', 1, type=int), 1)
+    users, videos, has_more = [], [], False
     if q:
-        users  = User.query.filter(User.username.ilike(f'%{q}%')).limit(20).all()
-        videos = Video.query.filter(Video.caption.ilike(f'%{q}%'),
-                                    Video.moderation_status == 'approved').limit(20).all()
-    return render_template('search.html', users=users, videos=videos, query=q)
+        users, videos, has_more = run_search(q, page)
+        load_viewer_state(videos, users)
+    return render_template('search.html', users=users, videos=videos, query=q, page=page, has_more=has_more)
 
 @app.route('/notifications')
 @login_required
 def notifications():
-    notifs = Notification.query.filter_by(
-        recipient_id=current_user.id).order_by(Notification.timestamp.desc()).limit(50).all()
-    for n in notifs: n.is_read = True
-    db.session.commit()
-    return render_template('notifications.html', notifications=notifs)
+    N = Notification
+    unread_ids = set(db.session.execute(
+        update(N).where(N.recipient_id == current_user.id, N.is_read.is_not(True))
+        .values(is_read=True).returning(N.id), execution_options={'synchronize_session': False}
+    ).scalars())
+    db.session.commit(); unread_notifs.reset(current_user.id)
+    notifs = N.query.options(joinedload(N.sender)).filter_by(
+        recipient_id=current_user.id).order_by(N.timestamp.desc()).limit(50).all()
+    sample_ids = {a for n in notifs for a in n.sample_ids}
+    actors = {u.id: u for u in User.query.filter(User.id.in_(sample_ids))} if sample_ids else {}
+    return render_template('notifications.html', notifications=notifs, actors=actors,
+                           unread_ids=unread_ids)
 
 @app.route('/messages')
 @login_required
 def messages():
-    all_msgs = Message.query.filter(
-        or_(Message.sender_id == current_user.id, Message.recipient_id == current_user.id)
-    ).order_by(Message.timestamp.desc()).all()
-    convos = {}
-    for m in all_msgs:
-        oid = m.recipient_id if m.sender_id == current_user.id else m.sender_id
-        if oid not in convos:
-            ou = User.query.get(oid)
-            if ou:
-                unread = Message.query.filter_by(sender_id=oid,
-                    recipient_id=current_user.id, is_read=False).count()
-                convos[oid] = {'user': ou, 'last_msg': m, 'unread': unread,
-                               'is_online': oid in online_users}
-    return render_template('chat_list.html', conversations=list(convos.values()))
+    me, C = current_user.id, Conversation
+    other = aliased(User)
+    rows = (db.session.query(C, other)
+            .join(other, other.id == case((C.user_a_id == me, C.user_b_id), else_=C.user_a_id))
+            .filter(or_(C.user_a_id == me, C.user_b_id == me))
+            .order_by(C.last_at.desc()).limit(100).all())
+    online = presence.online({ou.id for _, ou in rows})
+    convos = [{'user': ou, 'preview': c.last_preview, 'last_at': c.last_at,
+               'from_me': c.last_sender_id == me,
+               'unread': c.unread_a if c.user_a_id == me else c.unread_b,
+               'is_online': ou.id in online} for c, ou in rows]
+    return render_template('chat_list.html', conversations=convos)
 
 @app.route('/messages/<int:user_id>')
 @login_required
 def chat_detail(user_id):
-    other = User.query.get_or_404(user_id)
-    msgs  = Message.query.filter(
-        or_(and_(Message.sender_id == current_user.id, Message.recipient_id == user_id),
-            and_(Message.sender_id == user_id, Message.recipient_id == current_user.id))
-    ).order_by(Message.timestamp.asc()).all()
-    for m in msgs:
-        if m.recipient_id == current_user.id: m.is_read = True
-    db.session.commit()
-    return render_template('chat_detail.html', other_user=other, messages=msgs,
-                           is_online=user_id in online_users)
+    other = live_user_or_404(user_id)
+    msgs, has_more = chat_page(current_user.id, user_id)
+    mark_conversation_read(current_user.id, user_id)
+    return render_template('chat_detail.html', other_user=other, messages=msgs, has_more=has_more,
+                           is_online=bool(presence.online([user_id])))
+
+@app.route('/api/messages/<int:user_id>')
+@login_required
+def api_chat_history(user_id):
+    msgs, has_more = chat_page(current_user.id, user_id, request.args.get('before', type=int))
+    return jsonify({'has_more': has_more, 'items': [
+        {'id': m.id, 'sender_id': m.sender_id, 'body': m.body, 'is_read': bool(m.is_read),
+         'timestamp': m.timestamp.strftime('%H:%M')} for m in msgs]})
 
 # ─────────────────────────── ADMIN ───────────────────────────
+def admin_stat_queries():
+    n = func.count()
+    return {
+        'users':          select(n).select_from(User).where(User.deleted_at.is_(None)),
+        'admins':         select(n).select_from(User).where(User.is_admin == True, User.deleted_at.is_(None)),
+        'videos':         select(n).select_from(Video).where(Video.moderation_status != 'deleted'),
+        'pending_videos': select(n).select_from(Video).where(Video.moderation_status == 'pending'),
+        'likes':          select(n).select_from(likes),
+        'reports':        select(n).select_from(Report),
+        'reported_videos': select(func.count(func.distinct(Report.video_id))),
+        'pending_verifications': select(n).select_from(User).where(User.verification_status == 'pending',
+                                                                    User.deleted_at.is_(None)),
+    }
+
+def refresh_admin_stats():
+    """Recount every dashboard number into admin_stat. Returns ({key: value}, updated_at)."""
+    values = {k: db.session.execute(q).scalar() or 0 for k, q in admin_stat_queries().items()}
+    now, rows = datetime.utcnow(), {r.key: r for r in AdminStat.query.all()}
+    for k, v in values.items():
+        if k in rows: rows[k].value, rows[k].updated_at = v, now
+        else: db.session.add(AdminStat(key=k, value=v, updated_at=now))
+    try:
+        db.session.commit()
+    except IntegrityError:      # başka bir worker aynı anda ilk satırları ekledi
+        db.session.rollback()
+    return values, now
+
+def admin_stats():
+    """Dashboard snapshot in one SELECT; recounts inline only when the job hasn't run lately
+    (first start, TESTING, a new key)."""
+    rows = AdminStat.query.all()
+    stats = {r.key: r.value for r in rows}
+    at = min((r.updated_at for r in rows), default=None)
+    if at is None or stats.keys() < admin_stat_queries().keys() or \
+            at < datetime.utcnow() - timedelta(seconds=ADMIN_STATS_INTERVAL * 3):
+        return refresh_admin_stats()
+    return stats, at
+
+def page_of(rows, limit, key=lambda r: r.id):
+    """limit+1 rows from a keyset query → (page, next_cursor)."""
+    return rows[:limit], (key(rows[limit - 1]) if len(rows) > limit else None)
+
+def admin_user_json(u):
+    return {
+        'id': u.id, 'username': u.username, 'avatar': u.avatar or '',
+        'is_admin': bool(u.is_admin), 'is_super_admin': bool(u.is_super_admin),
+        'is_verified': bool(u.is_verified),
+        'badge': BADGES[u.badge_key]['svg'] if u.is_verified and u.badge_key in BADGES else '',
+        'badge_label': BADGES[u.badge_key]['label'] if u.is_verified and u.badge_key in BADGES else '',
+        'created_at': u.created_at.strftime('%d.%m.%Y') if u.created_at else '',
+        'video_count': u.video_count, 'follower_count': u.follower_count,
+        'perm_ban': bool(u.perm_ban_user), 'perm_delete': bool(u.perm_delete_video),
+        'perm_verify': bool(u.perm_verify_user),
+    }
+
+def report_groups(cursor=None, limit=ADMIN_PAGE_SIZE):
+    """Open reports folded per video, most recently reported first → (items, next_cursor).
+
+    Keyset on max(report.id); reasons come back as {reason, count} so a video reported by
+    five hundred people is still one card. Three queries whatever the queue length."""
+    last = func.max(Report.id)
+    q = (db.session.query(Report.video_id, func.count().label('n'),
+                          func.max(Report.timestamp).label('latest'), last.label('last_id'))
+         .group_by(Report.video_id).order_by(last.desc()))
+    if cursor: q = q.having(last < cursor)
+    rows, next_cursor = page_of(q.limit(limit + 1).all(), limit, key=lambda r: r.last_id)
+    vids = [r.video_id for r in rows]
+    if not vids: return [], None
+    videos = {v.id: v for v in Video.query.options(joinedload(Video.user)).filter(Video.id.in_(vids))}
+    reasons = {}
+    for vid, reason, n in (db.session.query(Report.video_id, Report.reason, func.count())
+                           .filter(Report.video_id.in_(vids)).group_by(Report.video_id, Report.reason)):
+        reasons.setdefault(vid, []).append({'reason': reason or '', 'count': n})
+    items = []
+    for r in rows:
+        v = videos.get(r.video_id)
+        if v is None or v.moderation_status == 'deleted': continue     # silme kuyruğunda, şikayetleri de gidecek
+        items.append({
+            'video_id': v.id, 'count': r.n, 'latest': r.latest.strftime('%d.%m.%Y %H:%M') if r.latest else '',
+            'reasons': sorted(reasons.get(v.id, []), key=lambda x: -x['count']),
+            'caption': (v.caption or '')[:80], 'poster': media_url(v, 'poster'), 'src': media_url(v),
+            'owner': {'id': v.user_id, 'username': v.user.username if v.user else ''},
+        })
+    return items, next_cursor
+
 @app.route('/admin')
 @login_required
 def admin_panel():
+    """Stats come from the admin_stat snapshot; reports / verifications / users load as paged JSON
+    (see /admin/api/*) when their tab is opened."""
     if not current_user.is_admin: abort(403)
-    from sqlalchemy import text
-    stats = {
-        'users':         User.query.count(),
-        'admins':        User.query.filter_by(is_admin=True).count(),
-        'videos':        Video.query.count(),
-        'pending_videos': Video.query.filter_by(moderation_status='pending').count(),
-        'likes':         db.session.execute(text('SELECT COUNT(*) FROM likes')).scalar() or 0,
-        'reports':       Report.query.count()
-    }
-    pending      = User.query.filter_by(verification_status='pending').all()
-    reports      = Report.query.order_by(Report.timestamp.desc()).all()
-    all_users    = User.query.order_by(User.created_at.desc()).limit(200).all() if current_user.is_super_admin else User.query.order_by(User.created_at.desc()).limit(200).all()
-    admins       = User.query.filter_by(is_admin=True).all()
-    videos       = Video.query.order_by(Video.id.desc()).limit(40).all()
-    recent_users = User.query.order_by(User.created_at.desc()).limit(8).all()
-    logs         = AdminLog.query.order_by(AdminLog.timestamp.desc()).limit(80).all() if current_user.is_super_admin else []
-    return render_template('admin.html', stats=stats, users=all_users, admins=admins,
-                           videos=videos, pending_verifications=pending, reports=reports,
-                           recent_users=recent_users, logs=logs)
+    stats, stats_at = admin_stats()
+    admins       = User.query.filter_by(is_admin=True, deleted_at=None).all() if current_user.is_super_admin else []
+    videos       = (Video.query.options(joinedload(Video.user)).filter(Video.moderation_status != 'deleted')
+                    .order_by(Video.id.desc()).limit(40).all())
+    recent_users = User.query.filter_by(deleted_at=None).order_by(User.id.desc()).limit(8).all()
+    logs         = (AdminLog.query.options(joinedload(AdminLog.admin)).order_by(AdminLog.timestamp.desc())
+                    .limit(80).all() if current_user.is_super_admin else [])
+    return render_template('admin.html', stats=stats, stats_at=stats_at, admins=admins,
+                           videos=videos, recent_users=recent_users, logs=logs)
+
+@app.route('/admin/api/reports')
+@login_required
+def api_admin_reports():
+    if not current_user.is_admin: return jsonify({'error': 'Yetkisiz'}), 403
+    items, next_cursor = report_groups(request.args.get('cursor', type=int))
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+@app.route('/admin/api/verifications')
+@login_required
+def api_admin_verifications():
+    if not current_user.is_admin: return jsonify({'error': 'Yetkisiz'}), 403
+    q = User.query.filter_by(verification_status='pending', deleted_at=None)
+    cursor = request.args.get('cursor', type=int)
+    if cursor: q = q.filter(User.id > cursor)
+    rows, next_cursor = page_of(q.order_by(User.id).limit(ADMIN_PAGE_SIZE + 1).all(), ADMIN_PAGE_SIZE)
+    return jsonify({'items': [admin_user_json(u) for u in rows], 'next_cursor': next_cursor})
+
+@app.route('/admin/api/users')
+@login_required
+def api_admin_users():
+    """Newest first; ?q= username prefix, ?filter=admin|verified|normal."""
+    if not current_user.is_admin: return jsonify({'error': 'Yetkisiz'}), 403
+    q, term = User.query.filter(User.deleted_at.is_(None)), request.args.get('q', '').strip().lstrip('@').lower()
+    if term: q = q.filter(func.lower(User.username).startswith(term, autoescape=True))
+    f = request.args.get('filter', 'all')
+    if f == 'admin':      q = q.filter(User.is_admin == True)
+    elif f == 'verified': q = q.filter(User.is_verified == True)
+    elif f == 'normal':   q = q.filter(or_(User.is_admin == False, User.is_admin.is_(None)))
+    cursor = request.args.get('cursor', type=int)
+    if cursor: q = q.filter(User.id < cursor)
+    rows, next_cursor = page_of(q.order_by(User.id.desc()).limit(ADMIN_PAGE_SIZE + 1).all(), ADMIN_PAGE_SIZE)
+    return jsonify({'items': [admin_user_json(u) for u in rows], 'next_cursor': next_cursor})
 
 @app.route('/admin/delete_video/<int:vid>')
 @login_required
 def admin_delete_video(vid):
     if not current_user.is_admin or not current_user.perm_delete_video: abort(403)
-    v = Video.query.get_or_404(vid)
-    if v.filename.startswith('/static/'):
-        p = v.filename.lstrip('/')
-        if os.path.exists(p): os.remove(p)
+    v = live_video_or_404(vid)
     add_log('delete_video', f"Video silindi: #{vid} (@{v.user.username})")
-    db.session.delete(v); db.session.commit(); flash('Video silindi.')
+    tombstone_video(v, admin_id=current_user.id)
+    db.session.commit(); invalidate_stories(creator_id=v.user_id)
+    invalidate_pages('feed', f'video:{v.id}', f'user:{v.user_id}')
+    flash('Video silindi.')
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/delete_user/<int:uid>')
 @login_required
 def admin_delete_user(uid):
     if not current_user.is_admin or not current_user.perm_ban_user: abort(403)
-    u = User.query.get_or_404(uid)
+    u = User.query.filter_by(id=uid, deleted_at=None).first_or_404()
     if u.username == 'tavugeymosu': abort(403)
     add_log('ban', f"Kullanıcı banlandı: @{u.username}")
-    db.session.delete(u); db.session.commit(); flash('Kullanıcı silindi.')
+    tombstone_user(u, admin_id=current_user.id)
+    db.session.commit(); invalidate_identity(uid); invalidate_stories(creator_id=uid, follower_id=uid)
+    invalidate_pages('feed', f'user:{uid}')
+    flash('Kullanıcı kaldırıldı; verileri arka planda siliniyor.')
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/force_verify/<int:uid>', methods=['POST'])
 @login_required
 def force_verify(uid):
     if not current_user.is_admin or not current_user.perm_verify_user: abort(403)
-    u = User.query.get_or_404(uid); badge = request.form.get('badge', '')
+    u = live_user_or_404(uid); badge = request.form.get('badge', '')
     if badge and badge in BADGES:
         u.is_verified = True; u.badge_key = badge; u.verification_status = 'approved'
         push_notif(u.id, current_user.id, 'system_approve')
@@ -532,69 +2763,73 @@ def force_verify(uid):
         u.is_verified = False; u.badge_key = None; u.verification_status = 'none'
         add_log('verify', f"Rozet kaldırıldı: @{u.username}")
         db.session.commit(); flash('Rozet alındı.')
+    invalidate_identity(u.id); invalidate_pages('feed', f'user:{u.id}')
     return redirect(url_for('profile', username=u.username))
 
 @app.route('/admin/approve_verification/<int:uid>', methods=['POST'])
 @login_required
 def approve_verification(uid):
     if not current_user.is_admin or not current_user.perm_verify_user: abort(403)
-    u = User.query.get_or_404(uid)
+    u = live_user_or_404(uid)
     bk = request.form.get('badge', 'verified')
     if bk not in BADGES: bk = 'verified'
     u.is_verified = True; u.verification_status = 'approved'; u.badge_key = bk
     push_notif(u.id, current_user.id, 'system_approve')
     add_log('verify', f"Başvuru onaylandı: @{u.username} → {BADGES[bk]['label']}")
-    db.session.commit(); flash('Onaylandı!')
-    return redirect(url_for('admin_panel'))
+    db.session.commit(); invalidate_identity(u.id); invalidate_pages('feed', f'user:{u.id}'); flash('Onaylandı!')
+    return redirect(url_for('admin_panel', _anchor='verify'))
 
 @app.route('/admin/reject_verification/<int:uid>')
 @login_required
 def reject_verification(uid):
     if not current_user.is_admin or not current_user.perm_verify_user: abort(403)
-    u = User.query.get_or_404(uid)
+    u = live_user_or_404(uid)
     u.is_verified = False; u.verification_status = 'rejected'; u.badge_key = None
     add_log('verify', f"Başvuru reddedildi: @{u.username}")
-    db.session.commit()
-    return redirect(url_for('admin_panel'))
+    db.session.commit(); invalidate_identity(u.id)
+    return redirect(url_for('admin_panel', _anchor='verify'))
 
 @app.route('/admin/manage_role/<int:uid>', methods=['POST'])
 @login_required
 def manage_role(uid):
     if not current_user.is_super_admin: abort(403)
-    t = User.query.get_or_404(uid)
+    t = live_user_or_404(uid)
     if t.username == 'tavugeymosu': abort(403)
     t.is_admin = True
     t.perm_ban_user     = 'perm_ban'    in request.form
     t.perm_delete_video = 'perm_delete' in request.form
     t.perm_verify_user  = 'perm_verify' in request.form
     add_log('perm_change', f"Yetkiler güncellendi: @{t.username}")
-    db.session.commit(); flash('Yetkiler güncellendi.')
+    db.session.commit(); invalidate_identity(t.id); flash('Yetkiler güncellendi.')
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/remove_admin/<int:uid>')
 @login_required
 def remove_admin(uid):
     if not current_user.is_super_admin: abort(403)
-    t = User.query.get_or_404(uid)
+    t = live_user_or_404(uid)
     if t.username == 'tavugeymosu': abort(403)
     add_log('perm_change', f"Admin yetkisi alındı: @{t.username}")
     t.is_admin = t.perm_ban_user = t.perm_delete_video = t.perm_verify_user = False
-    db.session.commit(); flash('Admin yetkisi alındı.')
+    db.session.commit(); invalidate_identity(t.id); flash('Admin yetkisi alındı.')
     return redirect(url_for('admin_panel'))
 
-@app.route('/admin/dismiss_report/<int:rid>')
+@app.route('/admin/api/dismiss_reports/<int:vid>', methods=['POST'])
 @login_required
-def dismiss_report(rid):
-    if not current_user.is_admin: abort(403)
-    r = Report.query.get_or_404(rid); db.session.delete(r); db.session.commit()
-    return redirect(url_for('admin_panel'))
+def dismiss_reports(vid):
+    """Yoksay: every open report on the video goes at once (the queue is per video)."""
+    if not current_user.is_admin: return jsonify({'error': 'Yetkisiz'}), 403
+    n = Report.query.filter_by(video_id=vid).delete(synchronize_session=False)
+    if n: add_log('dismiss_report', f"Şikayetler yoksayıldı: video #{vid} ({n} şikayet)")
+    db.session.commit()
+    return jsonify({'ok': True, 'dismissed': n})
 
 @app.route('/admin/make_admin_by_name', methods=['POST'])
 @login_required
 def make_admin_by_name():
     if not current_user.is_super_admin: abort(403)
     data = request.get_json() or {}
-    u = User.query.filter_by(username=data.get('username', '')).first()
+    u = User.query.filter_by(username=data.get('username', ''), deleted_at=None).first()
     if not u: return jsonify({'error': 'Kullanıcı bulunamadı!'})
     if u.username == 'tavugeymosu': return jsonify({'error': 'Bu kullanıcıya dokunulamaz.'})
     u.is_admin          = True
@@ -602,14 +2837,14 @@ def make_admin_by_name():
     u.perm_delete_video = bool(data.get('perm_delete', False))
     u.perm_verify_user  = bool(data.get('perm_verify', False))
     add_log('make_admin', f"Admin yapıldı: @{u.username} (ban={u.perm_ban_user}, del={u.perm_delete_video}, ver={u.perm_verify_user})")
-    db.session.commit()
+    db.session.commit(); invalidate_identity(u.id)
     return jsonify({'message': f'@{u.username} admin yapıldı!'})
 
 @app.route('/admin/api/toggle_perm/<int:uid>', methods=['POST'])
 @login_required
 def api_toggle_perm(uid):
     if not current_user.is_super_admin: return jsonify({'error': 'Yetkisiz'}), 403
-    u = User.query.get_or_404(uid)
+    u = live_user_or_404(uid)
     if u.username == 'tavugeymosu': return jsonify({'error': 'Korumalı kullanıcı'}), 403
     data = request.get_json() or {}
     ptype = data.get('type'); val = bool(data.get('value'))
@@ -618,14 +2853,14 @@ def api_toggle_perm(uid):
     elif ptype == 'verify': u.perm_verify_user  = val
     else: return jsonify({'error': 'Geçersiz tür'}), 400
     add_log('perm_change', f"Yetki toggle: @{u.username} {ptype}={val}")
-    db.session.commit()
+    db.session.commit(); invalidate_identity(u.id)
     return jsonify({'ok': True, 'message': 'Kaydedildi'})
 
 @app.route('/admin/api/set_perms/<int:uid>', methods=['POST'])
 @login_required
 def api_set_perms(uid):
     if not current_user.is_super_admin: return jsonify({'error': 'Yetkisiz'}), 403
-    u = User.query.get_or_404(uid)
+    u = live_user_or_404(uid)
     if u.username == 'tavugeymosu': return jsonify({'error': 'Korumalı kullanıcı'}), 403
     data = request.get_json() or {}
     u.is_admin          = bool(data.get('is_admin', u.is_admin))
@@ -633,63 +2868,224 @@ def api_set_perms(uid):
     u.perm_delete_video = bool(data.get('perm_delete', u.perm_delete_video))
     u.perm_verify_user  = bool(data.get('perm_verify', u.perm_verify_user))
     add_log('perm_change', f"Yetkiler ayarlandı: @{u.username}")
-    db.session.commit()
+    db.session.commit(); invalidate_identity(u.id)
     return jsonify({'message': '✓ Kaydedildi'})
 
+@app.route('/admin/api/metrics')
+@login_required
+def api_metrics():
+    if not current_user.is_admin: return jsonify({'error': 'Yetkisiz'}), 403
+    return jsonify(metrics.snapshot())
+
 @app.route('/admin/api/assign_badge', methods=['POST'])
 @login_required
 def api_assign_badge():
     if not current_user.is_admin or not current_user.perm_verify_user:
         return jsonify({'error': 'Yetkisiz'}), 403
     data = request.get_json() or {}
-    u = User.query.filter_by(username=data.get('username', '').replace('@', '')).first()
+    u = User.query.filter_by(username=data.get('username', '').replace('@', ''), deleted_at=None).first()
     if not u: return jsonify({'error': 'Kullanıcı bulunamadı!'})
     badge = data.get('badge', '')
     if badge and badge in BADGES:
         u.is_verified = True; u.badge_key = badge; u.verification_status = 'approved'
         push_notif(u.id, current_user.id, 'system_approve')
         add_log('verify', f"Manuel rozet: @{u.username} → {BADGES[badge]['label']}")
-        db.session.commit()
+        db.session.commit(); invalidate_identity(u.id); invalidate_pages('feed', f'user:{u.id}')
         return jsonify({'message': f'@{u.username} → {BADGES[badge]["label"]} rozeti verildi!'})
     else:
         u.is_verified = False; u.badge_key = None; u.verification_status = 'none'
         add_log('verify', f"Rozet kaldırıldı: @{u.username}")
-        db.session.commit()
+        db.session.commit(); invalidate_identity(u.id); invalidate_pages('feed', f'user:{u.id}')
         return jsonify({'message': f'@{u.username} rozeti kaldırıldı.'})
 
-# ─────────────────────────── RUN ───────────────────────────@app.route('/api/like/<int:vid>', methods=['POST'])
+# ─────────────────────────── MEDIA ───────────────────────────
+@app.route('/media/<int:vid>/<kind>/<name>')
+def media(vid, kind, name):
+    """Uploads and thumbnails of live videos: Range/If-Range/ETag aware, immutable (names are UUIDs).
+    `name` must be the file of video `vid`; unapproved videos only for their owner and admins.
+
+    MEDIA_MODE=sendfile streams through wsgi.file_wrapper (sendfile under gunicorn);
+    x-accel / x-sendfile hand the body to a front proxy and keep the worker free.
+    """
+    if kind not in MEDIA_KINDS or name != secure_filename(name): abort(404)
+    col, folder = MEDIA_KINDS[kind]
+    v = db.session.get(Video, vid)
+    own = os.path.basename(media_path(getattr(v, col, None)) or '')
+    # hls: master + variant playlists + segments share the master's <stem>_ prefix
+    if not own or not (name.startswith(own[:-len('master.m3u8')]) if kind == 'hls' else name == own): abort(404)
+    public = v.moderation_status == 'approved'
+    if not public and (v.moderation_status == 'deleted' or not current_user.is_authenticated
+                       or (current_user.id != v.user_id and not current_user.is_admin)): abort(404)
+    path = os.path.join(folder, name)
+    if not os.path.isfile(path): abort(404)
+    metrics.incr('media.requests')
+    if MEDIA_MODE == 'x-accel':
+        resp = Response(mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+        resp.headers['X-Accel-Redirect'] = f"{MEDIA_ACCEL_PREFIX}{os.path.basename(folder)}/{name}"
+    else:
+        resp = send_file(os.path.abspath(path), conditional=True, etag=True, max_age=MEDIA_MAX_AGE)
+    # onaysız video sadece sahibine/admine – paylaşılan önbelleklere girmesin
+    resp.headers['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}, immutable' if public else 'private, no-store'
+    resp.headers['Accept-Ranges'] = 'bytes'
+    if resp.status_code in (200, 206) and resp.content_length and MEDIA_MODE == 'sendfile':
+        metrics.incr('media.bytes', resp.content_length)
+        metrics.incr_labeled('media.bytes_by_video', vid, resp.content_length)
+    return resp
+
+# ─────────────────────────── UPLOADS ───────────────────────────
+# POST /api/upload {filename, size} → PUT /api/upload/<id>?offset=N (raw body, ≤ chunk_size)
+# … → POST /api/upload/<id>/finalize {caption, category}. GET /api/upload/<id> tells where to resume.
+def own_upload(upload_id):
+    s = db.session.get(UploadSession, upload_id)
+    if not s or s.user_id != current_user.id: abort(404)
+    return s
+
+@app.route('/api/upload', methods=['POST'])
+@login_required
+def api_upload_init():
+    d = request.get_json(silent=True) or {}
+    name, size = d.get('filename') or '', d.get('size')
+    if not allowed_video(name):
+        return jsonify(error='Desteklenmeyen format! MP4, MOV veya WEBM kullanın.'), 415
+    if not isinstance(size, int) or not 12 <= size <= UPLOAD_MAX_BYTES:
+        return jsonify(error='Dosya boyutu geçersiz veya çok büyük.'), 413
+    s = UploadSession(id=uuid.uuid4().hex, user_id=current_user.id,
+                      ext=name.rsplit('.', 1)[1].lower(), size=size)
+    open(s.path, 'wb').close()
+    db.session.add(s); db.session.commit(); metrics.incr('uploads.started')
+    return jsonify(id=s.id, offset=0, size=size, chunk_size=UPLOAD_CHUNK_SIZE)
+
+@app.route('/api/upload/<upload_id>')
+@login_required
+def api_upload_status(upload_id):
+    s = own_upload(upload_id)
+    return jsonify(id=s.id, offset=s.received, size=s.size, chunk_size=UPLOAD_CHUNK_SIZE)
+
+@app.route('/api/upload/<upload_id>', methods=['PUT'])
+@login_required
+def api_upload_chunk(upload_id):
+    """Append one chunk at `offset`, streamed straight into the .part file (no temp spool)."""
+    s = own_upload(upload_id)
+    offset = request.args.get('offset', type=int)
+    if offset != s.received: return jsonify(error='offset', offset=s.received), 409
+    h = upload_hasher(s).copy()
+    limit = min(UPLOAD_CHUNK_SIZE, s.size - offset)
+    head = b''
+    if offset == 0:
+        head = read_exact(request.stream, 12)
+        if sniff_video(head) != VIDEO_MAGIC[s.ext]:
+            return jsonify(error='Dosya geçerli bir video değil!'), 415
+        h.update(head)
+    try:
+        with open(s.path, 'r+b') as fh:
+            fh.seek(offset); fh.write(head)
+            n = copy_stream(request.stream, fh, h, limit - len(head))
+    except (OSError, ClientDisconnected):     # client went away mid-chunk: offset stays, the client resends
+        return jsonify(error='interrupted', offset=s.received), 400
+    if n < 0: return jsonify(error='Parça çok büyük.', offset=s.received), 413
+    n += len(head)
+    # conditional advance: of two racing PUTs for the same offset only one moves it
+    won = db.session.execute(update(UploadSession)
+                             .where(UploadSession.id == s.id, UploadSession.received == offset)
+                             .values(received=offset + n)).rowcount
+    db.session.commit()
+    if not won: return jsonify(error='offset', offset=db.session.get(UploadSession, s.id).received), 409
+    upload_hashers.set(s.id, (offset + n, h))
+    metrics.incr('uploads.bytes', n)
+    return jsonify(offset=offset + n, size=s.size)
+
+@app.route('/api/upload/<upload_id>/finalize', methods=['POST'])
+@login_required
+def api_upload_finalize(upload_id):
+    s = own_upload(upload_id)
+    d = request.get_json(silent=True) or request.form
+    caption = (d.get('caption') or '').strip()[:500]
+    if contains_bad_words(caption): return jsonify(error='Açıklamada uygunsuz kelime!'), 400
+    if s.received != s.size: return jsonify(error='incomplete', offset=s.received), 409
+    digest = upload_hasher(s).hexdigest()
+    if not db.session.execute(delete(UploadSession).where(UploadSession.id == s.id)).rowcount:
+        return jsonify(error='offset', offset=0), 409      # finalized concurrently
+    path = s.path
+    os.truncate(path, s.size)
+    v, created = publish_video(current_user.id, path, digest, caption, d.get('category') or 'Genel')
+    db.session.commit(); upload_hashers.delete(upload_id)
+    invalidate_stories(creator_id=current_user.id); invalidate_pages('feed', f'user:{current_user.id}')
+    if created and not v.poster: thumb_queue.put(v.id)
+    metrics.incr('uploads.finished' if created else 'uploads.dedup')
+    return jsonify(ok=True, id=v.id, duplicate=not created,
+                   redirect=url_for('profile', username=current_user.username))
+
+# ─────────────────────────── API ───────────────────────────
+@app.route('/api/online')
+@login_required
+def api_online():
+    """?ids=1,2,3 → ids that have a live socket on any worker."""
+    try:
+        ids = {int(i) for i in request.args.get('ids', '').split(',') if i}
+    except ValueError:
+        return jsonify({'error': 'Geçersiz id'}), 400
+    return jsonify({'online': sorted(presence.online(list(ids)[:200]))})
+
+@app.route('/api/search')
+def api_search():
+    """Live search / typeahead: ?q=&page=&limit= (limit ≤ SEARCH_PAGE_SIZE)."""
+    q = request.args.get('q', '').strip()[:100]
+    page  = max(request.args.get('page', 1, type=int), 1)
+    limit = min(max(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_PAGE_SIZE)
+    if not q: return jsonify(users=[], videos=[], page=page, has_more=False)
+    users, videos, has_more = run_search(q, page, limit)
+    viewer = load_viewer_state(videos, users)
+    return jsonify(users=[{'id': u.id, 'username': u.username, 'avatar': u.avatar or '',
+                           'is_verified': u.is_verified, 'follower_count': u.follower_count} for u in users],
+                   videos=[video_json(v, viewer) for v in videos], page=page, has_more=has_more)
+
+@app.route('/api/like/<int:vid>', methods=['POST'])
 @login_required
 def like_video(vid):
-    video = Video.query.get_or_404(vid)
-    if current_user in video.liked_by:
-        video.liked_by.remove(current_user); action = 'unliked'
-    else:
-        video.liked_by.append(current_user)
+    video = live_video_or_404(vid)
+    if toggle_link(likes, user_id=current_user.id, video_id=vid):
+        bump(Video, vid, like_count=1)
         push_notif(video.user_id, current_user.id, 'like', vid)
         action = 'liked'
+    else:
+        bump(Video, vid, like_count=-1); action = 'unliked'
     db.session.commit()
-    return jsonify({'action': action, 'count': len(video.liked_by)})
+    return jsonify({'action': action, 'count': video.like_count})
 
 @app.route('/api/view/<int:vid>', methods=['POST'])
 def view_video(vid):
-    v = Video.query.get(vid)
-    if v: v.views += 1; db.session.commit()
+    if current_user.is_authenticated: key = f'u{current_user.id}'
+    else: key = session.setdefault('vsid', uuid.uuid4().hex[:16])
+    view_buffer.add(vid, key)
     return jsonify({'ok': True})
 
+@app.route('/api/feed')
+def api_feed():
+    status = request.args.get('status', 'approved')
+    if status != 'approved' and not (current_user.is_authenticated and current_user.is_admin):
+        return jsonify({'error': 'Yetkisiz'}), 403
+    sort = 'trending' if request.args.get('sort') == 'trending' else 'new'
+    cursor = None
+    if request.args.get('cursor'):
+        cursor = decode_cursor(request.args['cursor'], sort)
+        if cursor is None: return jsonify({'error': 'Geçersiz cursor'}), 400
+    limit = max(1, min(request.args.get('limit', FEED_PAGE_SIZE, type=int), 50))
+    videos, next_cursor = feed_page(request.args.get('category') or None, status, cursor, limit, sort=sort)
+    viewer = load_viewer_state(videos)
+    return jsonify({'items': [video_json(v, viewer) for v in videos], 'next_cursor': next_cursor})
+
 @app.route('/api/bookmark/<int:vid>', methods=['POST'])
 @login_required
 def bookmark_video(vid):
-    video = Video.query.get_or_404(vid)
-    if video in current_user.bookmarked_videos:
-        current_user.bookmarked_videos.remove(video); action = 'removed'
-    else:
-        current_user.bookmarked_videos.append(video); action = 'added'
+    live_video_or_404(vid)
+    action = 'added' if toggle_link(bookmarks, user_id=current_user.id, video_id=vid) else 'removed'
     db.session.commit()
     return jsonify({'action': action})
 
 @app.route('/api/report/<int:vid>', methods=['POST'])
 @login_required
 def report_video(vid):
+    live_video_or_404(vid)
     if not Report.query.filter_by(reporter_id=current_user.id, video_id=vid).first():
         data   = request.get_json() or {}
         reason = data.get('reason', 'Belirtilmedi')[:200]
@@ -700,15 +3096,16 @@ def report_video(vid):
 @app.route('/api/follow/<int:uid>', methods=['POST'])
 @login_required
 def follow_user(uid):
-    user = User.query.get_or_404(uid)
+    user = live_user_or_404(uid)
     if user.id == current_user.id: return jsonify({'error': 'Kendini takip edemezsin'}), 400
-    if current_user.is_following(user):
-        current_user.unfollow(user); action = 'unfollowed'
+    me = db.session.get(User, current_user.id)
+    if me.is_following(user):
+        me.unfollow(user); action = 'unfollowed'
     else:
-        current_user.follow(user)
+        me.follow(user)
         push_notif(user.id, current_user.id, 'follow')
         action = 'followed'
-    db.session.commit()
+    db.session.commit(); invalidate_stories(follower_id=current_user.id)
     return jsonify({'action': action})
 
 @app.route('/api/comment/<int:vid>', methods=['GET', 'POST'])
@@ -720,55 +3117,430 @@ def comment_video(vid):
         text = data.get('text', '').strip()
         if not text: return jsonify({'error': 'Boş yorum!'}), 400
         if contains_bad_words(text): return jsonify({'error': 'Uygunsuz içerik!'}), 400
-        pid = data.get('parent_id')
-        c   = Comment(text=text, user_id=current_user.id, video_id=vid, parent_id=pid)
+        video = Video.query.filter(Video.id == vid, Video.moderation_status != 'deleted').first()
+        if not video: return jsonify({'error': 'Video bulunamadı'}), 404
+        parent = None
+        if data.get('parent_id'):
+            parent = db.session.get(Comment, data['parent_id'])
+            if not parent or parent.video_id != vid: return jsonify({'error': 'Yorum bulunamadı'}), 404
+            if parent.parent_id: parent = db.session.get(Comment, parent.parent_id)  # iki seviye: yanıtın yanıtı köke bağlanır
+        c = Comment(text=text, user_id=current_user.id, video_id=vid, parent_id=parent.id if parent else None)
         db.session.add(c)
-        video = Video.query.get(vid)
-        if video:
-            if pid:
-                parent = Comment.query.get(pid)
-                if parent: push_notif(parent.user_id, current_user.id, 'comment', vid)
-            else:
-                push_notif(video.user_id, current_user.id, 'comment', vid)
+        bump(Video, vid, comment_count=1)
+        if parent:
+            bump(Comment, parent.id, reply_count=1)
+            push_notif(parent.user_id, current_user.id, 'comment', vid)
+        else:
+            push_notif(video.user_id, current_user.id, 'comment', vid)
         db.session.commit()
         return jsonify({'status': 'success'})
 
-    # GET
-    video    = Video.query.get_or_404(vid)
-    comments = Comment.query.filter_by(video_id=vid, parent_id=None
-               ).order_by(Comment.created_at.desc()).all()
-
-    def serialize(c):
-        user_liked = current_user.is_authenticated and current_user in c.liked_by
-        badge_svg  = BADGES[c.user.badge_key]['svg'] if c.user.badge_key and c.user.badge_key in BADGES else ''
-        return {
-            'id': c.id, 'username': c.user.username, 'text': c.text,
-            'avatar': c.user.avatar or '',
-            'is_video_owner': video.user_id == c.user_id,
-            'liked_by_creator': c.is_liked_by_creator,
-            'like_count': len(c.liked_by), 'user_liked': user_liked,
-            'is_verified': c.user.is_verified, 'badge': badge_svg,
-            'replies': [serialize(r) for r in c.replies.order_by(Comment.created_at.asc()).all()]
-        }
-    return jsonify([serialize(c) for c in comments])
+    # GET – ?cursor= pages the top level
+    video  = live_video_or_404(vid)
+    cursor = None
+    if request.args.get('cursor'):
+        cursor = decode_cursor(request.args['cursor'])
+        if cursor is None: return jsonify({'error': 'Geçersiz cursor'}), 400
+    items, next_cursor = comment_tree(video, cursor)
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+@app.route('/api/comment/<int:vid>/replies/<int:cid>')
+def comment_replies(vid, cid):
+    parent = Comment.query.filter_by(id=cid, video_id=vid).first_or_404()
+    cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    if request.args.get('cursor') and cursor is None: return jsonify({'error': 'Geçersiz cursor'}), 400
+    rows, next_cursor = reply_page(parent.id, cursor)
+    owner = db.session.scalar(select(Video.user_id).where(Video.id == vid))
+    liked = liked_comment_ids([r.id for r in rows])
+    return jsonify({'items': [comment_json(r, owner, liked) for r in rows], 'next_cursor': next_cursor})
 
 @app.route('/api/like_comment/<int:cid>', methods=['POST'])
 @login_required
 def like_comment(cid):
-    c = Comment.query.get_or_404(cid)
-    if c.video and current_user.id == c.video.user_id:
+    c = live_comments().filter(Comment.id == cid).first_or_404()
+    if current_user.id == live_video_or_404(c.video_id).user_id:
         c.is_liked_by_creator = not c.is_liked_by_creator
-    if current_user in c.liked_by:
-        c.liked_by.remove(current_user); action = 'unliked'
+    if toggle_link(comment_likes, user_id=current_user.id, comment_id=cid):
+        bump(Comment, cid, like_count=1); action = 'liked'
     else:
-        c.liked_by.append(current_user); action = 'liked'
+        bump(Comment, cid, like_count=-1); action = 'unliked'
     db.session.commit()
-    return jsonify({'action': action, 'likes': len(c.liked_by), 'creator_liked': c.is_liked_by_creator})
+    return jsonify({'action': action, 'likes': c.like_count, 'creator_liked': c.is_liked_by_creator})
+
+# ─────────────────────────── MIGRATIONS ───────────────────────────
+# Numbered steps, each applied once in its own transaction and recorded in schema_migrations;
+# `flask migrate` (also run by `python app.py`) applies the pending ones. Never edit a step that
+# shipped – append a new one. Every step spells out its own DDL instead of reading the models, so
+# a fresh database replays the same history as an old one; steps stay idempotent (IF NOT EXISTS /
+# checkfirst) because databases made by db.create_all() already have some of it.
+MIGRATIONS = []         # (version, name, fn(conn))
+schema_migrations = db.Table('schema_migrations', MetaData(),
+    db.Column('version',    db.Integer, primary_key=True, autoincrement=False),
+    db.Column('name',       db.String(200)),
+    db.Column('applied_at', db.DateTime))
+
+def migration(version, name):
+    def deco(fn):
+        MIGRATIONS.append((version, name, fn)); return fn
+    return deco
+
+def add_columns_if_missing(conn, table):
+    have = {c['name'] for c in db.inspect(conn).get_columns(table.name)}
+    for col in table.columns:
+        if col.name in have: continue
+        ddl = col.type.compile(conn.dialect)
+        if col.server_default is not None: ddl += f" DEFAULT {col.server_default.arg}"
+        conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {ddl}'))
+
+def create_index(conn, name, table, *cols):
+    cols = ', '.join(f'"{c}"' for c in cols)
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({cols})'))
+
+def baseline_schema():
+    """Tables as they stood when migrations were introduced – a frozen copy, not the models."""
+    m = MetaData()
+    db.Table('user', m,
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('username', db.String(150), nullable=False, unique=True),
+        db.Column('password', db.String(300), nullable=False),
+        db.Column('bio', db.String(250)),
+        db.Column('avatar', db.String(300)),
+        db.Column('coins', db.Integer),
+        db.Column('is_verified', db.Boolean),
+        db.Column('verification_status', db.String(20)),
+        db.Column('badge_key', db.String(20)),
+        db.Column('is_admin', db.Boolean),
+        db.Column('is_super_admin', db.Boolean),
+        db.Column('perm_ban_user', db.Boolean),
+        db.Column('perm_delete_video', db.Boolean),
+        db.Column('perm_verify_user', db.Boolean),
+        db.Column('created_at', db.DateTime),
+        db.Column('follower_count', db.Integer, nullable=False, server_default='0'),
+        db.Column('following_count', db.Integer, nullable=False, server_default='0'),
+        db.Column('video_count', db.Integer, nullable=False, server_default='0'))
+    db.Table('admin_log', m,
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('admin_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('action_type', db.String(30)),
+        db.Column('description', db.String(300)),
+        db.Column('timestamp', db.DateTime))
+    db.Table('conversation', m,
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('user_a_id', db.Integer, db.ForeignKey('user.id'), nullable=False),
+        db.Column('user_b_id', db.Integer, db.ForeignKey('user.id'), nullable=False),
+        db.Column('last_message_id', db.Integer),
+        db.Column('last_sender_id', db.Integer),
+        db.Column('last_preview', db.String(120)),
+        db.Column('last_at', db.DateTime),
+        db.Column('unread_a', db.Integer, nullable=False, server_default='0'),
+        db.Column('unread_b', db.Integer, nullable=False, server_default='0'),
+        db.Index('ix_conversation_a_recent', 'user_a_id', 'last_at'),
+        db.Index('ix_conversation_b_recent', 'user_b_id', 'last_at'))
+    db.Table('followers', m,
+        db.Column('follower_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('followed_id', db.Integer, db.ForeignKey('user.id')),
+        db.Index('ix_followers_pair', 'follower_id', 'followed_id'))
+    db.Table('message', m,
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('sender_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('recipient_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('body', db.String(1000)),
+        db.Column('timestamp', db.DateTime),
+        db.Column('is_read', db.Boolean),
+        db.Column('delivered', db.Boolean, nullable=False, server_default='1'),
+        db.Index('ix_message_pair_time', 'sender_id', 'recipient_id', 'timestamp'),
+        db.Index('ix_message_undelivered', 'recipient_id', 'delivered', 'id'),
+        db.Index('ix_message_unread', 'recipient_id', 'sender_id', 'is_read'))
+    db.Table('notification', m,
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('recipient_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('sender_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('type', db.String(20)),
+        db.Column('post_id', db.Integer),
+        db.Column('amount', db.Integer),
+        db.Column('is_read', db.Boolean),
+        db.Column('timestamp', db.DateTime),
+        db.Column('actor_count', db.Integer, nullable=False, server_default='1'),
+        db.Column('actor_sample', db.String(100)),
+        db.Index('ix_notification_group', 'recipient_id', 'type', 'post_id'),
+        db.Index('ix_notification_inbox', 'recipient_id', 'is_read', 'timestamp'))
+    db.Table('upload_session', m,
+        db.Column('id', db.String(32), primary_key=True),
+        db.Column('user_id', db.Integer, db.ForeignKey('user.id'), nullable=False),
+        db.Column('ext', db.String(8), nullable=False),
+        db.Column('size', db.BigInteger, nullable=False),
+        db.Column('received', db.BigInteger, nullable=False, server_default='0'),
+        db.Column('created_at', db.DateTime))
+    db.Table('video', m,
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('filename', db.String(500), nullable=False),
+        db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('caption', db.String(500)),
+        db.Column('category', db.String(50)),
+        db.Column('views', db.Integer),
+        db.Column('created_at', db.DateTime),
+        db.Column('moderation_status', db.String(20)),
+        db.Column('like_count', db.Integer, nullable=False, server_default='0'),
+        db.Column('comment_count', db.Integer, nullable=False, server_default='0'),
+        db.Column('poster', db.String(300)),
+        db.Column('preview', db.String(300)),
+        db.Column('content_hash', db.String(64)),
+        db.Column('hls', db.String(300)),
+        db.Column('processing', db.String(20)),
+        db.Column('trend_score', db.Float, nullable=False, server_default='0'),
+        db.Index('ix_video_content_hash', 'content_hash'),
+        db.Index('ix_video_feed', 'moderation_status', 'category', 'created_at', 'id'),
+        db.Index('ix_video_feed_all', 'moderation_status', 'created_at', 'id'),
+        db.Index('ix_video_trending', 'moderation_status', 'category', 'trend_score', 'id'),
+        db.Index('ix_video_trending_all', 'moderation_status', 'trend_score', 'id'),
+        db.Index('ix_video_user_recent', 'user_id', 'moderation_status', 'created_at', 'id'))
+    db.Table('bookmarks', m,
+        db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('video_id', db.Integer, db.ForeignKey('video.id', ondelete='CASCADE')),
+        db.Index('ix_bookmarks_user_video', 'user_id', 'video_id'))
+    db.Table('comment', m,
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('text', db.String(500), nullable=False),
+        db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('video_id', db.Integer, db.ForeignKey('video.id', ondelete='CASCADE')),
+        db.Column('parent_id', db.Integer, db.ForeignKey('comment.id', ondelete='CASCADE')),
+        db.Column('is_liked_by_creator', db.Boolean),
+        db.Column('created_at', db.DateTime),
+        db.Column('like_count', db.Integer, nullable=False, server_default='0'),
+        db.Column('reply_count', db.Integer, nullable=False, server_default='0'),
+        db.Index('ix_comment_replies', 'parent_id', 'created_at', 'id'),
+        db.Index('ix_comment_thread', 'video_id', 'parent_id', 'created_at', 'id'))
+    db.Table('likes', m,
+        db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('video_id', db.Integer, db.ForeignKey('video.id', ondelete='CASCADE')),
+        db.Index('ix_likes_user_video', 'user_id', 'video_id'))
+    db.Table('report', m,
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('reporter_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('video_id', db.Integer, db.ForeignKey('video.id', ondelete='CASCADE')),
+        db.Column('reason', db.String(200)),
+        db.Column('timestamp', db.DateTime))
+    db.Table('transcode_job', m,
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('video_id', db.Integer, db.ForeignKey('video.id', ondelete='CASCADE'), nullable=False),
+        db.Column('state', db.String(10), nullable=False),
+        db.Column('attempts', db.Integer, nullable=False),
+        db.Column('run_after', db.DateTime),
+        db.Column('created_at', db.DateTime),
+        db.Column('started_at', db.DateTime),
+        db.Column('finished_at', db.DateTime),
+        db.Column('worker', db.String(64)),
+        db.Column('last_error', db.String(500)),
+        db.Index('ix_transcode_job_claim', 'state', 'run_after', 'id'))
+    db.Table('comment_likes', m,
+        db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
+        db.Column('comment_id', db.Integer, db.ForeignKey('comment.id', ondelete='CASCADE')),
+        db.Index('ix_comment_likes_user', 'user_id', 'comment_id'))
+    return m
+
+@migration(1, 'baseline: tables, late-added columns and indexes')
+def _m0001(conn):
+    """Adopts databases made by create_all() + the old upgrade_schema() as well as empty ones."""
+    m = baseline_schema()
+    m.create_all(conn)
+    for table in m.sorted_tables:
+        add_columns_if_missing(conn, table)
+        for idx in table.indexes: idx.create(conn, checkfirst=True)
+
+@migration(2, 'indexes for reverse lookups: followers, per-video likes/bookmarks, reports, logs')
+def _m0002(conn):
+    create_index(conn, 'ix_followers_followed', 'followers', 'followed_id', 'follower_id')
+    create_index(conn, 'ix_likes_video', 'likes', 'video_id')
+    create_index(conn, 'ix_bookmarks_video', 'bookmarks', 'video_id')
+    create_index(conn, 'ix_comment_likes_comment', 'comment_likes', 'comment_id')
+    create_index(conn, 'ix_transcode_job_video', 'transcode_job', 'video_id', 'state')
+    create_index(conn, 'ix_report_video', 'report', 'video_id', 'reporter_id')
+    create_index(conn, 'ix_report_time', 'report', 'timestamp')
+    create_index(conn, 'ix_admin_log_time', 'admin_log', 'timestamp')
+    create_index(conn, 'ix_upload_session_created_at', 'upload_session', 'created_at')
+
+@migration(3, 'search index (FTS5 on SQLite)')
+def _m0003(conn):
+    search_index.setup(conn)
+
+@migration(4, 'admin dashboard snapshot table, pending-verification index')
+def _m0004(conn):
+    db.Table('admin_stat', MetaData(),
+        db.Column('key', db.String(40), primary_key=True),
+        db.Column('value', db.Integer, nullable=False),
+        db.Column('updated_at', db.DateTime)).create(conn, checkfirst=True)
+    create_index(conn, 'ix_user_verification', 'user', 'verification_status', 'id')
+
+@migration(5, 'tombstone-then-purge deletion: user.deleted_at, purge_job, lookup indexes')
+def _m0005(conn):
+    add_columns_if_missing(conn, db.Table('user', MetaData(), db.Column('deleted_at', db.DateTime)))
+    db.Table('purge_job', MetaData(),
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('kind', db.String(10), nullable=False),
+        db.Column('target_id', db.Integer, nullable=False),
+        db.Column('label', db.String(200)),
+        db.Column('admin_id', db.Integer),
+        db.Column('state', db.String(10), nullable=False),
+        db.Column('attempts', db.Integer, nullable=False),
+        db.Column('run_after', db.DateTime),
+        db.Column('step', db.String(30)),
+        db.Column('removed', db.Integer, nullable=False),
+        db.Column('created_at', db.DateTime),
+        db.Column('heartbeat_at', db.DateTime),
+        db.Column('finished_at', db.DateTime),
+        db.Column('worker', db.String(64)),
+        db.Column('last_error', db.String(500))).create(conn, checkfirst=True)
+    create_index(conn, 'ix_purge_job_claim', 'purge_job', 'state', 'id')
+    create_index(conn, 'ix_comment_user', 'comment', 'user_id', 'id')
+    create_index(conn, 'ix_notification_sender', 'notification', 'sender_id')
+    create_index(conn, 'ix_notification_post', 'notification', 'post_id')
+    create_index(conn, 'ix_report_reporter', 'report', 'reporter_id')
+
+@migration(6, 'notification.actor_sample keeps every actor of a round (up to NOTIF_ACTOR_CAP)')
+def _m0006(conn):
+    if conn.dialect.name != 'sqlite':      # SQLite doesn't enforce VARCHAR lengths
+        conn.execute(text('ALTER TABLE notification ALTER COLUMN actor_sample TYPE TEXT'))
+
+def applied_migrations(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    return dict(conn.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at)).all())
+
+def migrate():
+    """Apply pending steps in order; safe to race from several workers (the version row is the lock)."""
+    with db.engine.begin() as conn: applied = applied_migrations(conn)
+    done = []
+    for version, name, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied: continue
+        with db.engine.connect() as conn:
+            tx = conn.begin()
+            try:
+                conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+            except IntegrityError:    # another worker got there first
+                tx.rollback(); continue
+            fn(conn); tx.commit()
+        done.append(f'{version:04d} {name}')
+    return done
+
+# ─────────────────────────── RUN ───────────────────────────
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help='Sadece uygulanmış/bekleyen adımları listele.')
+def migrate_cmd(status):
+    """Bring the database schema up to date (replaces create_all)."""
+    if status:
+        with db.engine.begin() as conn: applied = applied_migrations(conn)
+        for version, name, _ in sorted(MIGRATIONS, key=lambda m: m[0]):
+            print(f"{version:04d} {'✓ ' + str(applied[version])[:19] if version in applied else 'bekliyor':<22} {name}")
+        return
+    done = migrate()
+    print('\n'.join(done) if done else 'Şema güncel.')
+
+@app.cli.command('copy-db')
+@click.argument('source', required=False)
+@click.option('--batch', default=5000, show_default=True, help='Tek INSERT grubundaki satır.')
+@click.option('--force', is_flag=True, help='Hedefte veri varsa önce sil.')
+def copy_db_cmd(source, batch, force):
+    """Copy an existing database (default: instance/vetrico.db) into DATABASE_URL, e.g. PostgreSQL."""
+    src = create_engine(source or 'sqlite:///' + os.path.join(app.instance_path, 'vetrico.db'))
+    if src.url.render_as_string(hide_password=False) == db.engine.url.render_as_string(hide_password=False):
+        print('Kaynak ve hedef aynı veritabanı.'); return
+    migrate()
+    tables = db.metadata.sorted_tables
+    src_meta = MetaData(); src_meta.reflect(src, only=lambda name, _: name in db.metadata.tables)
+    with db.engine.begin() as dst:
+        busy = [t.name for t in tables if dst.execute(select(func.count()).select_from(t)).scalar()]
+        if busy and not force: print(f"Hedef boş değil ({', '.join(busy)}); --force ile silinip kopyalanır."); return
+        for t in reversed(tables): dst.execute(t.delete())
+        for t in tables:
+            s = src_meta.tables.get(t.name)
+            if s is None: continue
+            cols = [c.name for c in t.columns if c.name in s.c]
+            # columns the old schema lacks take their server default (e.g. message.delivered = 1)
+            fill = {c.name: cast(literal(str(c.server_default.arg), String()), c.type) for c in t.columns
+                    if c.name not in s.c and c.server_default is not None}
+            ins, n = t.insert().values(fill) if fill else t.insert(), 0
+            with src.connect() as sc:
+                rows = sc.execution_options(yield_per=batch).execute(select(*(s.c[c] for c in cols)))
+                for part in rows.mappings().partitions(batch):
+                    dst.execute(ins, [dict(r) for r in part]); n += len(part)
+            print(f'{t.name:<20} {n}')
+        if dst.dialect.name == 'postgresql':   # explicit ids were inserted – move the sequences past them
+            for t in tables:
+                if 'id' in t.c and isinstance(t.c.id.type, db.Integer):
+                    dst.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{t.name}\"', 'id'), "
+                                     f'COALESCE(MAX(id), 0) + 1, false) FROM "{t.name}"'))
+    reconcile_counters(); n = rebuild_conversations(); recompute_trending(full=True)
+    print(f'Sayaçlar, {n} sohbet, trend puanları ve arama dizini ({search_index.rebuild()} video) yeniden kuruldu.')
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_cmd():
+    """Recompute like/comment/follower/video counters from the source tables."""
+    reconcile_counters(); print('Sayaçlar yeniden hesaplandı.')
+
+@app.cli.command('backfill-conversations')
+def backfill_conversations_cmd():
+    """Build the /messages inbox summaries from the existing Message table."""
+    print(f'{rebuild_conversations()} sohbet oluşturuldu.')
+
+@app.cli.command('compact-notifications')
+def compact_notifications_cmd():
+    """Run the notification retention pass now."""
+    groups, pruned = compact_notifications()
+    print(f'{groups} grup birleştirildi, {pruned} eski bildirim silindi.')
+
+@app.cli.command('transcode')
+@click.argument('video_ids', nargs=-1, type=int)
+@click.option('--missing', is_flag=True, help='HLS çıktısı olmayan tüm videolar.')
+@click.option('--failed', is_flag=True, help='Başarısız işleri yeniden kuyruğa al.')
+def transcode_cmd(video_ids, missing, failed):
+    """Queue HLS encodes for existing videos (ids, --missing, --failed)."""
+    q = Video.query
+    if video_ids:  q = q.filter(Video.id.in_(video_ids))
+    elif missing:  q = q.filter(Video.hls.is_(None))
+    elif failed:   q = q.filter(Video.transcode_jobs.any(TranscodeJob.state == 'failed'))
+    else: print('Video id, --missing veya --failed verin.'); return
+    busy = select(TranscodeJob.video_id).where(TranscodeJob.state.in_(('queued', 'running')))
+    n = 0
+    for v in q.filter(Video.id.not_in(busy)).order_by(Video.id).yield_per(200):
+        enqueue_transcode(v); n += 1
+    db.session.commit(); print(f'{n} video kuyruğa alındı.')
+
+@app.cli.command('transcode-worker')
+@click.option('--once', is_flag=True, help='Kuyruk boşalınca çık.')
+def transcode_worker_cmd(once):
+    """Run a dedicated transcode worker process (start several for parallel encodes)."""
+    transcode_loop(f'{os.getpid()}:cli', once=once)
+
+@app.cli.command('purge-worker')
+@click.option('--once', is_flag=True, help='Kuyruk boşalınca çık.')
+def purge_worker_cmd(once):
+    """Run queued user/video deletions in this process."""
+    purge_loop(f'{os.getpid()}:cli', once=once)
+
+@app.cli.command('recompute-trending')
+@click.option('--full', is_flag=True, help='Sadece son günler değil, tüm katalog.')
+def recompute_trending_cmd(full):
+    """Rescore videos for the Trending tab now."""
+    t = time.perf_counter(); n = recompute_trending(full=full)
+    print(f'{n} video puanı güncellendi ({time.perf_counter() - t:.1f} sn).')
+
+@app.cli.command('rebuild-search')
+def rebuild_search_cmd():
+    """Re-create the search index from the video and user tables."""
+    print(f'{search_index.rebuild()} video dizinlendi ({type(search_index).__name__}).')
+
+@app.cli.command('backfill-thumbnails')
+def backfill_thumbnails_cmd():
+    """Generate missing posters/previews for videos already in static/uploads."""
+    if not FFMPEG_BIN: print('ffmpeg bulunamadı (FFMPEG_BIN).'); return
+    done = 0
+    for v in Video.query.filter(Video.poster.is_(None)).order_by(Video.id).yield_per(100):
+        if make_thumbnails(v): done += 1; db.session.commit()
+    print(f'{done} video için küçük resim oluşturuldu.')
 
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        migrate()
     
     # Render için Port ayarı
     port = int(os.environ.get('PORT', 5000))
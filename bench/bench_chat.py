@@ -0,0 +1,82 @@
+"""Chat ingestion: one commit per message (the old send_message body) vs. chat_writer's group commit.
+
+    python bench/bench_chat.py --senders 200 --messages 20000
+
+--senders greenlets push --messages in total to random recipients through each path against a
+throwaway SQLite file (same journal settings as the app); the instance DB is never touched.
+Reports messages/second and p50/p99 time-to-ack.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP  = tempfile.mkdtemp(prefix='vetrico-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP, 'bench.db')}"
+os.environ['TRANSCODE_WORKERS'] = '0'
+sys.path.insert(0, ROOT)
+
+import gevent  # noqa: E402
+from app import (app, db, metrics, User, Message, Conversation, OutgoingMessage,  # noqa: E402
+                 chat_writer, touch_conversation)
+
+
+def seed(users):
+    db.drop_all(); db.create_all()
+    db.session.execute(User.__table__.insert(), [{'id': i, 'username': f'u{i}', 'password': '!'}
+                                                 for i in range(1, users + 1)])
+    db.session.commit()
+
+
+def sync_send(sender, rid, body):
+    """What on_send_message did before the pipeline: validate nothing, commit per message."""
+    with app.app_context():
+        msg = Message(sender_id=sender, recipient_id=rid, body=body)
+        db.session.add(msg); db.session.flush()
+        touch_conversation(msg); db.session.commit()
+
+
+def batched_send(sender, rid, body):
+    msg = chat_writer.submit(OutgoingMessage(sender, rid, body))
+    msg.done.wait(30)
+    assert msg.ack and 'id' in msg.ack, msg.ack
+
+
+def run(send, senders, total, users):
+    rnd, lat = random.Random(7), []
+    per = total // senders
+
+    def sender(uid):
+        for k in range(per):
+            rid = rnd.randint(1, users - 1); rid += rid >= uid
+            t = time.perf_counter(); send(uid, rid, f'msg {k} from {uid}'); lat.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    gevent.joinall([gevent.spawn(sender, 1 + i % users) for i in range(senders)])
+    return per * senders, time.perf_counter() - t, sorted(lat)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--senders', type=int, default=200)
+    ap.add_argument('--messages', type=int, default=20000)
+    ap.add_argument('--users', type=int, default=1000)
+    args = ap.parse_args()
+    print(f"{'path':>10} {'msgs':>7} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'commits':>8}")
+    for name, send in (('per-msg', sync_send), ('batched', batched_send)):
+        with app.app_context(): seed(args.users)
+        before = metrics.snapshot()['counters'].get('chat.batches', 0)
+        n, dt, lat = run(send, args.senders, args.messages, args.users)
+        commits = n if send is sync_send else metrics.snapshot()['counters']['chat.batches'] - before
+        with app.app_context():
+            assert db.session.query(Message).count() == n
+            assert db.session.query(db.func.sum(Conversation.unread_a + Conversation.unread_b)).scalar() == n
+        print(f'{name:>10} {n:>7} {n / dt:>9.0f} {lat[len(lat) // 2] * 1000:>8.1f} '
+              f'{lat[int(len(lat) * .99)] * 1000:>8.1f} {commits:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Feed latency while a login storm is running: hashing in the request greenlet vs. the hash pool.
+
+    python bench/bench_login.py --storm 100 --logins 400
+
+--storm greenlets POST --logins correct passwords to /login while one probe greenlet polls
+/api/feed every 20 ms, against gevent's WSGI server on a throwaway SQLite file (instance DB
+untouched). Runs with HASH_WORKERS=0 (the old inline pbkdf2/scrypt) and with the pool; reports
+logins/second and the probe's p50/p99/max latency. Attempt throttling is switched off.
+"""
+import argparse
+import http.client
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP  = tempfile.mkdtemp(prefix='vetrico-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP, 'bench.db')}"
+os.environ['TRANSCODE_WORKERS'] = '0'
+sys.path.insert(0, ROOT)
+
+import gevent  # noqa: E402
+from gevent.pywsgi import WSGIServer  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+import app as A  # noqa: E402
+from app import app, db, hash_pool, User, Video  # noqa: E402
+
+
+def seed(users):
+    db.drop_all(); db.create_all()
+    pw = generate_password_hash('secret', A.PASSWORD_METHOD)
+    db.session.execute(User.__table__.insert(), [{'id': i, 'username': f'u{i}', 'password': pw}
+                                                 for i in range(1, users + 1)])
+    db.session.execute(Video.__table__.insert(), [{'user_id': 1 + i % users, 'filename': f'/static/uploads/v{i}.mp4',
+                                                   'caption': f'video {i}'} for i in range(500)])
+    db.session.commit()
+
+
+def request(port, method, path, body=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    conn.request(method, path, body, {'Content-Type': 'application/x-www-form-urlencoded'} if body else {})
+    r = conn.getresponse(); r.read(); conn.close()
+    return r.status
+
+
+def run(port, storm, logins, users):
+    per, lat, done, codes = logins // storm, [], [False], {}
+
+    def stormer(k):
+        for j in range(per):
+            s = request(port, 'POST', '/login', f'username=u{1 + (k * per + j) % users}&password=secret')
+            codes[s] = codes.get(s, 0) + 1
+
+    def probe():
+        while not done[0]:
+            t = time.perf_counter(); request(port, 'GET', '/api/feed'); lat.append(time.perf_counter() - t)
+            gevent.sleep(0.02)
+
+    p = gevent.spawn(probe)
+    t = time.perf_counter()
+    gevent.joinall([gevent.spawn(stormer, k) for k in range(storm)])
+    dt = time.perf_counter() - t
+    done[0] = True; p.join()
+    lat.sort()
+    return per * storm / dt, lat, codes
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--storm', type=int, default=100)
+    ap.add_argument('--logins', type=int, default=400)
+    ap.add_argument('--users', type=int, default=1000)
+    ap.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    args = ap.parse_args()
+    A.LOGIN_IP_LIMIT = A.LOGIN_USER_LIMIT = 0
+    hash_pool.queue, hash_pool.timeout = args.storm, 60
+    with app.app_context(): seed(args.users)
+    server = WSGIServer(('127.0.0.1', 0), app, log=None); server.start()
+    print(f"method {A.PASSWORD_METHOD}, {args.storm} concurrent logins, probe GET /api/feed every 20 ms")
+    print(f"{'hashing':>10} {'logins/s':>9} {'probes':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}  status")
+    for label, workers in (('inline', 0), (f'pool({args.workers})', args.workers)):
+        hash_pool.workers = workers
+        rate, lat, codes = run(server.server_port, args.storm, args.logins, args.users)
+        print(f"{label:>10} {rate:>9.1f} {len(lat):>7} {lat[len(lat) // 2] * 1000:>8.1f} "
+              f"{lat[int(len(lat) * .99)] * 1000:>8.1f} {lat[-1] * 1000:>8.1f}  {codes}")
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Anonymous page traffic with and without the page micro-cache.
+
+    python bench/bench_pages.py --clients 200 --requests 5000
+
+Serves the app with gevent's WSGI server on a throwaway SQLite file (instance DB untouched) and
+fires --requests logged-out GETs from --clients greenlets: a herd on one viral /watch/<id>, then a
+mix of /, /watch/<id>, /profile/<name> and /search. Runs once with PAGE_CACHE_TTL=0 and once with
+the cache on; reports requests/second, p50/p99 latency and how many times a page was rendered.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP  = tempfile.mkdtemp(prefix='vetrico-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP, 'bench.db')}"
+os.environ['TRANSCODE_WORKERS'] = '0'
+sys.path.insert(0, ROOT)
+
+import gevent  # noqa: E402
+import urllib.request  # noqa: E402
+from gevent.pywsgi import WSGIServer  # noqa: E402
+import app as A  # noqa: E402
+from app import app, db, metrics, page_cache, User, Video  # noqa: E402
+
+
+def seed(users, videos):
+    db.drop_all(); db.create_all()
+    db.session.execute(User.__table__.insert(), [{'id': i, 'username': f'u{i}', 'password': '!'}
+                                                 for i in range(1, users + 1)])
+    db.session.execute(Video.__table__.insert(), [
+        {'id': i, 'user_id': 1 + i % users, 'filename': f'/static/uploads/v{i}.mp4',
+         'caption': f'video {i} #tag{i % 50}', 'category': 'Genel'} for i in range(1, videos + 1)])
+    db.session.commit()
+
+
+def mixed_urls(users, videos, rnd):
+    pick = rnd.random()
+    if pick < .3:  return '/'
+    if pick < .8:  return f'/watch/{rnd.randint(1, min(videos, 50))}'
+    if pick < .95: return f'/profile/u{rnd.randint(1, min(users, 50))}'
+    return f'/search?q=tag{rnd.randint(0, 9)}'
+
+
+def run(port, clients, total, next_url):
+    lat, errors = [], 0
+    per = total // clients
+
+    def client():
+        nonlocal errors
+        for _ in range(per):
+            t = time.perf_counter()
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{next_url()}', timeout=60) as r: r.read()
+            except Exception:
+                errors += 1
+            lat.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    gevent.joinall([gevent.spawn(client) for _ in range(clients)])
+    return per * clients, time.perf_counter() - t, sorted(lat), errors
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--clients', type=int, default=200)
+    ap.add_argument('--requests', type=int, default=5000)
+    ap.add_argument('--users', type=int, default=500)
+    ap.add_argument('--videos', type=int, default=5000)
+    args = ap.parse_args()
+    with app.app_context(): seed(args.users, args.videos)
+    server = WSGIServer(('127.0.0.1', 0), app, log=None); server.start()
+    rnd = random.Random(7)
+    scenarios = (('viral', lambda: '/watch/1'), ('mixed', lambda: mixed_urls(args.users, args.videos, rnd)))
+    print(f"{'scenario':>8} {'cache':>6} {'reqs':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'renders':>8} {'errors':>6}")
+    for name, next_url in scenarios:
+        for ttl in (0, 10):
+            A.PAGE_CACHE_TTL = ttl; page_cache.clear()
+            c0 = metrics.snapshot()['counters']
+            n, dt, lat, errors = run(server.server_port, args.clients, args.requests, next_url)
+            c1 = metrics.snapshot()['counters']
+            renders = n if not ttl else c1.get('page_cache.miss', 0) - c0.get('page_cache.miss', 0)
+            print(f"{name:>8} {'on' if ttl else 'off':>6} {n:>6} {n / dt:>8.0f} {lat[len(lat) // 2] * 1000:>8.1f} "
+                  f"{lat[int(len(lat) * .99)] * 1000:>8.1f} {renders:>8} {errors:>6}")
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
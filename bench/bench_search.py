@@ -0,0 +1,79 @@
+"""Search: the old ilike('%q%') scan vs. the FTS5 index behind run_search().
+
+    python bench/bench_search.py --videos 1000000
+
+Seeds a throwaway SQLite database with synthetic captions (bulk Core inserts, the ORM
+events are bypassed and the index is built once with rebuild()); the instance DB is never touched.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP  = tempfile.mkdtemp(prefix='vetrico-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP, 'bench.db')}"
+sys.path.insert(0, ROOT)
+
+from app import app, db, User, Video, search_index  # noqa: E402
+
+WORDS = ('kedi köpek futbol maç gol müzik şarkı konser oyun yayın tatil deniz yemek tarif '
+         'komik dans spor haber teknoloji telefon araba yol kamp dağ kar yağmur sabah akşam '
+         'okul sınav arkadaş aile doğum günü düğün parti vlog günlük challenge trend ').split()
+RARE  = ['zeytinyağlı', 'karadeniz', 'fenerbahçe', 'galatasaray', 'beşiktaş']
+CATS  = ['Genel', 'Eğlence', 'Oyun', 'Spor', 'Müzik', 'Teknoloji', 'Haber']
+QUERIES = ['kedi', 'zeytinyağlı', 'futbol maç', 'karad', 'xyzzy']
+
+
+def seed(n, users=1000):
+    rnd = random.Random(42)
+    db.drop_all(); db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'username': f'user{i}', 'password': 'x'} for i in range(1, users + 1)])
+    rows = []
+    for i in range(n):
+        words = rnd.choices(WORDS, k=rnd.randint(3, 10))
+        if rnd.random() < 0.001: words.append(rnd.choice(RARE))
+        rows.append({'filename': 'x.mp4', 'user_id': rnd.randint(1, users), 'caption': ' '.join(words),
+                     'category': rnd.choice(CATS), 'moderation_status': 'approved'})
+        if len(rows) >= 20000:
+            db.session.execute(Video.__table__.insert(), rows); rows = []
+    if rows: db.session.execute(Video.__table__.insert(), rows)
+    db.session.commit()
+    t = time.perf_counter(); search_index.rebuild()
+    return time.perf_counter() - t
+
+
+def like_scan(q):
+    return Video.query.filter(Video.caption.ilike(f'%{q}%'),
+                              Video.moderation_status == 'approved').limit(20).all()
+
+
+def timeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        t = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--videos', type=int, default=1_000_000)
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args()
+    with app.app_context():
+        t = time.perf_counter(); build = seed(args.videos)
+        print(f'{args.videos} videos seeded in {time.perf_counter() - t:.1f}s '
+              f'({type(search_index).__name__}, index build {build:.1f}s)')
+        print(f"{'query':>14} {'LIKE ms':>9} {'FTS page ms':>12} {'FTS hits/page':>14}")
+        for q in QUERIES:
+            like = timeit(lambda: like_scan(q), args.repeat)
+            fts  = timeit(lambda: search_index.video_ids(q, 20), args.repeat)
+            print(f'{q:>14} {like:>9.1f} {fts:>12.1f} {len(search_index.video_ids(q, 20)):>14}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Stories rail: old "load every followed video, dedupe in Python" vs. query_stories().
+
+    python bench/bench_stories.py --creators 300 --history 5,50,500
+
+Builds a throwaway SQLite database per history size; the real instance DB is never touched.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP  = tempfile.mkdtemp(prefix='vetrico-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP, 'bench.db')}"
+sys.path.insert(0, ROOT)
+
+from app import app, db, User, Video, followers, query_stories  # noqa: E402
+
+
+def legacy_stories(uid):
+    followed_ids = [r[0] for r in db.session.execute(
+        db.select(followers.c.followed_id).where(followers.c.follower_id == uid))]
+    stories, seen = [], set()
+    for v in Video.query.filter(Video.user_id.in_(followed_ids),
+                                Video.moderation_status == 'approved'
+                                ).order_by(Video.created_at.desc()).all():
+        if v.user_id not in seen:
+            stories.append(v); seen.add(v.user_id)
+    return stories
+
+
+def seed(creators, history):
+    db.drop_all(); db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'username': f'u{i}', 'password': 'x'} for i in range(1, creators + 2)])
+    db.session.execute(followers.insert(), [
+        {'follower_id': 1, 'followed_id': i} for i in range(2, creators + 2)])
+    t0, rows = datetime(2024, 1, 1), []
+    for uid in range(2, creators + 2):
+        for k in range(history):
+            rows.append({'filename': 'x.mp4', 'user_id': uid, 'moderation_status': 'approved',
+                         'created_at': t0 + timedelta(minutes=k * creators + uid)})
+            if len(rows) >= 20000:
+                db.session.execute(Video.__table__.insert(), rows); rows = []
+    if rows: db.session.execute(Video.__table__.insert(), rows)
+    db.session.commit()
+
+
+def timeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        t = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--creators', type=int, default=300)
+    ap.add_argument('--history', default='5,50,500', help='videos per creator, comma separated')
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args()
+    print(f"{'videos/creator':>15} {'total videos':>13} {'legacy ms':>10} {'query ms':>9}")
+    with app.app_context():
+        for h in map(int, args.history.split(',')):
+            seed(args.creators, h)
+            assert [v.id for v in legacy_stories(1)][:20] == [v.id for v in query_stories(1)]
+            legacy = timeit(lambda: legacy_stories(1), args.repeat)
+            new    = timeit(lambda: query_stories(1), args.repeat)
+            print(f'{h:>15} {h * args.creators:>13} {legacy:>10.1f} {new:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Socket.IO fan-out and presence under several workers.
+
+    pip install "python-socketio[asyncio_client]" redis aiohttp
+    python bench/load_sockets.py --workers 4 --clients 2000
+
+Starts a Redis-compatible message queue (bench/mini_redis.py in a thread unless --mq
+points at a real one), --workers app processes sharing it and a throwaway SQLite DB, then
+opens --clients websocket clients round-robin over the workers and checks:
+
+  connect    how fast the sockets come up, how many fail
+  presence   /api/online asked on *every* worker agrees with who is really connected
+  delivery   each sender messages a user connected to a different worker; lost / latency
+  expiry     one worker is SIGKILLed; its users must leave presence within PRESENCE_TTL
+
+Sessions are minted with the workers' SECRET_KEY, so no password hashing is involved.
+Raise `ulimit -n` for more than ~500 clients per worker.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import socketio
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+
+ROOT   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP    = tempfile.mkdtemp(prefix='vetrico-load-')
+SECRET = 'load-test'
+TTL    = 6
+
+SEED = """
+from app import app, db, User
+with app.app_context():
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [{'id': i, 'username': f'load{i}', 'password': '!'}
+                                                 for i in range(1, %d + 1)])
+    db.session.commit()
+"""
+SERVE = "import sys, app as A; A.socketio.run(A.app, host='127.0.0.1', port=int(sys.argv[1]), log_output=False)"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0)); return s.getsockname()[1]
+
+
+def start_mini_redis():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import mini_redis
+    return mini_redis.start_in_thread(port=free_port())
+
+
+def session_cookie(uid, _ser=[]):
+    if not _ser:
+        app = Flask('load'); app.secret_key = SECRET
+        _ser.append(SecureCookieSessionInterface().get_signing_serializer(app))
+    return f"session={_ser[0].dumps({'_user_id': str(uid), '_fresh': True})}"
+
+
+def spawn_workers(n, mq, users):
+    env = dict(os.environ, PYTHONPATH=ROOT, SECRET_KEY=SECRET, SOCKETIO_MESSAGE_QUEUE=mq,
+               PRESENCE_TTL=str(TTL), TRANSCODE_WORKERS='0', PYTHONWARNINGS='ignore',
+               DATABASE_URL=f"sqlite:///{os.path.join(TMP, 'load.db')}")
+    subprocess.run([sys.executable, '-c', SEED % users], env=env, cwd=TMP, check=True)
+    procs = []
+    for _ in range(n):
+        port = free_port()
+        procs.append((port, subprocess.Popen([sys.executable, '-c', SERVE, str(port)], env=env, cwd=TMP,
+                                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)))
+    for port, _ in procs:
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close(); break
+            except OSError:
+                time.sleep(0.1)
+    return procs
+
+
+async def open_client(uid, port, inbox):
+    c = socketio.AsyncClient(reconnection=False)
+
+    @c.on('receive_message')
+    async def _(d):
+        inbox[d['body']] = time.perf_counter()
+
+    await c.connect(f'http://127.0.0.1:{port}', headers={'Cookie': session_cookie(uid)},
+                    transports=['websocket'], wait_timeout=30)
+    return c
+
+
+async def online_seen(http, port, uids):
+    seen = set()
+    for k in range(0, len(uids), 200):
+        ids = ','.join(map(str, uids[k:k + 200]))
+        async with http.get(f'http://127.0.0.1:{port}/api/online?ids={ids}',
+                            headers={'Cookie': session_cookie(1)}) as r:
+            seen |= set((await r.json())['online'])
+    return seen
+
+
+def pct(xs, p):
+    xs = sorted(xs); return xs[min(len(xs) - 1, int(len(xs) * p))] if xs else float('nan')
+
+
+async def run(args, procs):
+    ports = [p for p, _ in procs]
+    where = {uid: ports[(uid - 1) % len(ports)] for uid in range(1, args.clients + 1)}
+    inbox, clients, failed = {}, {}, 0
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def connect(uid):
+        nonlocal failed
+        async with gate:
+            try:
+                clients[uid] = await open_client(uid, where[uid], inbox)
+            except Exception:
+                failed += 1
+
+    t = time.perf_counter()
+    await asyncio.gather(*(connect(uid) for uid in where))
+    dt = time.perf_counter() - t
+    print(f'connect   {len(clients)} up, {failed} failed in {dt:.1f}s ({len(clients) / dt:.0f}/s)')
+
+    async with aiohttp.ClientSession() as http:
+        await asyncio.sleep(1)
+        up = sorted(clients)
+        for port in ports:
+            seen = await online_seen(http, port, up)
+            print(f'presence  worker :{port} sees {len(seen)}/{len(up)} online')
+
+        # every sender talks to the next user, which always lives on another worker
+        senders = up[:args.messages]
+        sent = {}
+        t = time.perf_counter()
+        for uid in senders:
+            to = uid % args.clients + 1
+            body = f'm{uid}->{to}'
+            sent[body] = time.perf_counter()
+            await clients[uid].emit('send_message', {'recipient_id': to, 'body': body})
+        deadline = time.perf_counter() + 10
+        while len(inbox) < len(sent) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        lat = [(inbox[b] - s) * 1000 for b, s in sent.items() if b in inbox]
+        print(f'delivery  {len(lat)}/{len(sent)} delivered across workers in {time.perf_counter() - t:.1f}s, '
+              f'p50 {pct(lat, .5):.1f} ms, p99 {pct(lat, .99):.1f} ms')
+
+        port, proc = procs[-1]
+        victims = [u for u in up if where[u] == port]
+        proc.send_signal(signal.SIGKILL)
+        t = time.perf_counter()
+        while time.perf_counter() - t < TTL * 3:
+            left = await online_seen(http, ports[0], victims)
+            if not left: break
+            await asyncio.sleep(0.5)
+        print(f'expiry    worker :{port} killed, {len(victims) - len(left)}/{len(victims)} of its users '
+              f'dropped out after {time.perf_counter() - t:.1f}s (PRESENCE_TTL={TTL})')
+
+    await asyncio.gather(*(c.disconnect() for u, c in clients.items() if where[u] != port),
+                         return_exceptions=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--workers', type=int, default=4)
+    ap.add_argument('--clients', type=int, default=2000)
+    ap.add_argument('--messages', type=int, default=500)
+    ap.add_argument('--concurrency', type=int, default=200, help='simultaneous connect attempts')
+    ap.add_argument('--mq', help='redis://… message queue; default: bench/mini_redis.py stand-in')
+    args = ap.parse_args()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    mq = args.mq or start_mini_redis()
+    print(f'{args.workers} workers, {args.clients} clients, queue {mq}')
+    procs = spawn_workers(args.workers, mq, args.clients)
+    try:
+        asyncio.run(run(args, procs))
+    finally:
+        for _, p in procs:
+            p.kill()
+
+
+if __name__ == '__main__':
+    main()
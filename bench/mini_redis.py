@@ -0,0 +1,144 @@
+"""Tiny Redis-compatible server for local multi-worker testing – not for production.
+
+    python bench/mini_redis.py --port 6379
+    SOCKETIO_MESSAGE_QUEUE=redis://127.0.0.1:6379/0 gunicorn -k geventwebsocket... -w 4 app:app
+
+Speaks just enough RESP for Socket.IO's RedisManager (PUBLISH / SUBSCRIBE) and
+RedisPresence (ZADD, ZREM, ZCARD, ZCOUNT, ZREMRANGEBYSCORE, EXPIRE, MULTI/EXEC), over
+RESP2 or RESP3 (HELLO).
+Single asyncio loop, so commands never interleave; state lives in memory only.
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+
+class MiniRedis:
+    def __init__(self):
+        self.zsets, self.expires, self.channels = {}, {}, {}    # channels: {name: set(writer)}
+        self.resp3 = set()                                      # writers that said HELLO 3
+
+    def _zset(self, key):
+        if key in self.expires and self.expires[key] <= time.time():
+            self.zsets.pop(key, None); self.expires.pop(key, None)
+        return self.zsets.get(key, {})
+
+    @staticmethod
+    def _score(s, lo=True):
+        s = s.decode()
+        if s in ('-inf', '+inf', 'inf'): return float(s)
+        return float(s[1:]) + (1e-12 if lo else -1e-12) if s.startswith('(') else float(s)
+
+    def call(self, cmd, args, writer):
+        c = cmd.upper()
+        if c == b'PING':     return 'PONG'
+        if c in (b'CLIENT', b'SELECT'): return 'OK'
+        if c == b'HELLO':
+            proto = int(args[0]) if args else 2
+            if proto == 3: self.resp3.add(writer)
+            else: self.resp3.discard(writer)
+            return {b'server': b'redis', b'version': b'7.2.0', b'proto': proto, b'mode': b'standalone'}
+        if c == b'PUBLISH':
+            subs = self.channels.get(args[0], set())
+            for w in list(subs):
+                w.write(encode(Push([b'message', args[0], args[1]]) if w in self.resp3 else
+                               [b'message', args[0], args[1]]))
+            return len(subs)
+        if c == b'ZADD':
+            z = self.zsets.setdefault(args[0], self._zset(args[0]))
+            new = 0
+            for i in range(1, len(args), 2):
+                new += args[i + 1] not in z; z[args[i + 1]] = float(args[i])
+            return new
+        if c == b'ZREM':
+            z = self._zset(args[0]); return sum(z.pop(m, None) is not None for m in args[1:])
+        if c == b'ZCARD':
+            return len(self._zset(args[0]))
+        if c in (b'ZCOUNT', b'ZREMRANGEBYSCORE'):
+            z, lo, hi = self._zset(args[0]), self._score(args[1]), self._score(args[2], False)
+            hit = [m for m, s in z.items() if lo <= s <= hi]
+            if c == b'ZREMRANGEBYSCORE':
+                for m in hit: del z[m]
+            return len(hit)
+        if c == b'EXPIRE':
+            if args[0] not in self.zsets: return 0
+            self.expires[args[0]] = time.time() + int(args[1]); return 1
+        if c == b'DEL':
+            return sum(self.zsets.pop(k, None) is not None for k in args)
+        return Exception(f'unknown command {cmd.decode()}')
+
+    async def handle(self, reader, writer):
+        mine, queued = set(), None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                n, parts = int(line[1:]), []
+                for _ in range(n):
+                    size = int((await reader.readline())[1:])
+                    parts.append((await reader.readexactly(size + 2))[:-2])
+                cmd, args = parts[0].upper(), parts[1:]
+                if cmd in (b'SUBSCRIBE', b'UNSUBSCRIBE'):
+                    for ch in args:
+                        if cmd == b'SUBSCRIBE':
+                            self.channels.setdefault(ch, set()).add(writer); mine.add(ch)
+                        else:
+                            self.channels.get(ch, set()).discard(writer); mine.discard(ch)
+                        reply = [cmd.lower(), ch, len(mine)]
+                        writer.write(encode(Push(reply) if writer in self.resp3 else reply))
+                elif cmd == b'PING' and mine and writer not in self.resp3:
+                    writer.write(encode([b'pong', b'']))
+                elif cmd == b'MULTI':
+                    queued = []; writer.write(encode('OK'))
+                elif cmd == b'EXEC':
+                    writer.write(encode([self.call(c, a, writer) for c, a in queued or []])); queued = None
+                elif queued is not None:
+                    queued.append((cmd, args)); writer.write(encode('QUEUED'))
+                else:
+                    writer.write(encode(self.call(cmd, args, writer)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for ch in mine: self.channels.get(ch, set()).discard(writer)
+            self.resp3.discard(writer)
+            writer.close()
+
+
+class Push(list):
+    pass
+
+
+def encode(v):
+    if isinstance(v, Push):      return b'>%d\r\n' % len(v) + b''.join(encode(x) for x in v)
+    if isinstance(v, dict):      return b'%%%d\r\n' % len(v) + b''.join(encode(k) + encode(x) for k, x in v.items())
+    if isinstance(v, Exception): return f'-ERR {v}\r\n'.encode()
+    if isinstance(v, str):       return f'+{v}\r\n'.encode()
+    if isinstance(v, int):       return f':{v}\r\n'.encode()
+    if isinstance(v, bytes):     return b'$%d\r\n%s\r\n' % (len(v), v)
+    return b'*%d\r\n' % len(v) + b''.join(encode(x) for x in v)
+
+
+async def serve(host, port, ready=None):
+    server = await asyncio.start_server(MiniRedis().handle, host, port, limit=1 << 24)
+    if ready: ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def start_in_thread(host='127.0.0.1', port=6379):
+    """Run in a daemon thread (for harnesses); returns the redis:// URL."""
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(serve(host, port, ready)), daemon=True).start()
+    ready.wait(5)
+    return f'redis://{host}:{port}/0'
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=6379)
+    a = ap.parse_args()
+    print(f'mini-redis on redis://{a.host}:{a.port}/0')
+    asyncio.run(serve(a.host, a.port))
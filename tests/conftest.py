@@ -0,0 +1,64 @@
+"""Shared fixtures: the app on a throwaway SQLite file (instance DB untouched), schema built by migrate()."""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP  = tempfile.mkdtemp(prefix='vetrico-test-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP, 'test.db')}"
+os.environ['TRANSCODE_WORKERS'] = '0'
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+from flask import g  # noqa: E402
+from flask.testing import FlaskClient  # noqa: E402
+from app import app as flask_app, db, migrate, User, Video  # noqa: E402
+
+
+class Client(FlaskClient):
+    def open(self, *args, **kwargs):
+        g.pop('_login_user', None)   # requests share the test's app context; don't reuse the last client's user
+        return super().open(*args, **kwargs)
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True        # no background workers
+    flask_app.test_client_class = Client
+    with flask_app.app_context():
+        migrate()
+        yield flask_app
+
+
+@pytest.fixture(autouse=True)
+def clean(app):
+    yield
+    db.session.rollback()
+    for table in reversed(db.metadata.sorted_tables): db.session.execute(table.delete())
+    db.session.commit(); db.session.remove()
+
+
+def make_user(name, **kw):
+    u = User(username=name, password='!', **kw)
+    db.session.add(u); db.session.commit()
+    return u
+
+
+def make_video(user, n=1, t0=None, **kw):
+    """n approved videos one second apart (oldest first); pass created_at/trend_score in kw to force ties."""
+    t0 = t0 or datetime(2024, 1, 1)
+    vids = [Video(user_id=user.id, filename=f'v{user.id}_{i}.mp4', moderation_status='approved',
+                  **{'created_at': t0 + timedelta(seconds=i), **kw}) for i in range(n)]
+    db.session.add_all(vids); db.session.commit()
+    return vids
+
+
+@pytest.fixture
+def login(app):
+    """login(user) → a test client with that user's session."""
+    def as_user(user):
+        c = app.test_client()
+        with c.session_transaction() as s: s['_user_id'], s['_fresh'] = str(user.id), True
+        return c
+    return as_user
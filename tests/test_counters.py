@@ -0,0 +1,61 @@
+from conftest import make_user, make_video
+from app import db, purge_loop, reconcile_counters, tombstone_user, tombstone_video, User, Video, Comment
+
+
+def counters():
+    return {
+        'video':   sorted(db.session.execute(db.select(Video.id, Video.like_count, Video.comment_count)).all()),
+        'comment': sorted(db.session.execute(db.select(Comment.id, Comment.like_count, Comment.reply_count)).all()),
+        'user':    sorted(db.session.execute(db.select(User.id, User.follower_count, User.following_count,
+                                                       User.video_count)).all()),
+    }
+
+
+def assert_reconciled():
+    db.session.expire_all()
+    before = counters()
+    reconcile_counters()
+    assert counters() == before
+
+
+def activity(login):
+    a, b, c = make_user('a'), make_user('b'), make_user('c')
+    v, w = make_video(a, 2)
+    a.video_count = 2; db.session.commit()
+    cb, cc = login(b), login(c)
+    for client in (cb, cc): assert client.post(f'/api/like/{v.id}').json['action'] == 'liked'
+    assert cc.post(f'/api/like/{v.id}').json['action'] == 'unliked'
+    cc.post(f'/api/like/{w.id}')
+    for client in (cb, cc): assert client.post(f'/api/follow/{a.id}').json['action'] == 'followed'
+    cc.post(f'/api/follow/{a.id}'); cb.post(f'/api/follow/{c.id}')
+    login(a).post(f'/api/follow/{b.id}')
+    cb.post(f'/api/comment/{v.id}', json={'text': 'ilk'})
+    top = Comment.query.one()
+    cc.post(f'/api/comment/{v.id}', json={'text': 'yanıt', 'parent_id': top.id})
+    cc.post(f'/api/comment/{w.id}', json={'text': 'diğer'})
+    for client in (cb, cc, login(a)): client.post(f'/api/like_comment/{top.id}')
+    cb.post(f'/api/like_comment/{top.id}')
+    return a, b, c, v, w
+
+
+def test_counters_after_likes_follows_comments(login):
+    a, b, c, v, w = activity(login)
+    assert_reconciled()
+    db.session.expire_all()
+    assert (v.like_count, v.comment_count, a.follower_count, b.following_count) == (1, 2, 1, 2)
+
+
+def test_counters_after_user_purge(login):
+    a, b, c, v, w = activity(login)
+    tombstone_user(db.session.get(User, c.id)); db.session.commit()
+    purge_loop('test', once=True)
+    assert db.session.get(User, c.id) is None
+    assert_reconciled()
+
+
+def test_counters_after_video_purge(login):
+    a, b, c, v, w = activity(login)
+    tombstone_video(db.session.get(Video, v.id)); db.session.commit()
+    purge_loop('test', once=True)
+    assert db.session.get(Video, v.id) is None
+    assert_reconciled()
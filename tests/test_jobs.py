@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import make_user, make_video
+from app import db, metrics, socketio, claim_job, retry_job, BackgroundLoop, PurgeJob, TranscodeJob
+
+
+@pytest.fixture
+def video():
+    return make_video(make_user('a'))[0]
+
+
+def test_claim_job_takes_due_jobs_once(video):
+    now = datetime.utcnow()
+    db.session.add_all([TranscodeJob(video_id=video.id, state='queued', run_after=now + timedelta(hours=1)),
+                        TranscodeJob(video_id=video.id, state='queued', run_after=now)])
+    db.session.commit()
+    job = claim_job(TranscodeJob, 'w1', 'started_at', 60)
+    assert (job.state, job.worker, job.attempts) == ('running', 'w1', 1)
+    assert claim_job(TranscodeJob, 'w2', 'started_at', 60) is None
+
+
+@pytest.mark.parametrize('model, alive, extra', [(TranscodeJob, 'started_at', {'video_id': 1}),
+                                                 (PurgeJob, 'heartbeat_at', {'kind': 'video', 'target_id': 1})])
+def test_claim_job_retakes_only_stale_running_jobs(video, model, alive, extra):
+    now = datetime.utcnow()
+    db.session.add_all([model(state='running', attempts=1, worker='dead', **{alive: now - timedelta(seconds=120)}, **extra),
+                        model(state='running', attempts=1, worker='busy', **{alive: now}, **extra)])
+    db.session.commit()
+    job = claim_job(model, 'w', alive, 60)
+    assert (job.worker, job.attempts) == ('w', 2)
+    assert claim_job(model, 'w', alive, 60) is None
+
+
+def test_retry_job_requeues_then_fails(video):
+    job = TranscodeJob(video_id=video.id, state='running', attempts=1)
+    db.session.add(job); db.session.commit()
+    retry_job(TranscodeJob, job.id, 2, 60, RuntimeError('kırıldı'))
+    job = db.session.get(TranscodeJob, job.id)
+    assert (job.state, job.last_error) == ('queued', 'kırıldı') and job.run_after > datetime.utcnow()
+    job.attempts = 2; db.session.commit()
+    retry_job(TranscodeJob, job.id, 2, 60, RuntimeError('yine'))
+    assert db.session.get(TranscodeJob, job.id).state == 'failed'
+
+
+def test_background_loop_survives_a_failing_tick():
+    class Flaky(BackgroundLoop):
+        ERRORS, ERROR_BACKOFF = 'test.loop_errors', 0
+        def __init__(self):
+            super().__init__(); self.ticks = 0
+        def tick(self):
+            self.ticks += 1
+            socketio.sleep(0.01 if self.ticks < 5 else 3600)     # then idle for the rest of the session
+            if self.ticks == 1: raise RuntimeError('ilk tur')
+
+    before = metrics.snapshot()['counters'].get('test.loop_errors', 0)
+    loop = Flaky(); loop._ensure_started(); loop._ensure_started()
+    socketio.sleep(0.1)
+    assert loop.ticks > 2
+    assert metrics.snapshot()['counters']['test.loop_errors'] == before + 1
@@ -0,0 +1,112 @@
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import make_user, make_video
+from app import db, chat_page, decode_cursor, encode_cursor, feed_page, Message, Video
+
+
+def b64(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+# ─── cursors ───
+@pytest.mark.parametrize('sort', ['new', 'trending'])
+def test_cursor_round_trip(sort):
+    v = Video(id=42, created_at=datetime(2024, 5, 6, 7, 8, 9, 123456), trend_score=3.25)
+    key = v.created_at if sort == 'new' else v.trend_score
+    assert decode_cursor(encode_cursor(v, sort), sort) == (key, 42)
+
+
+@pytest.mark.parametrize('token', [
+    '', 'not-a-cursor', '%%%', b64(b'2024-01-01T00:00:00'), b64(b'2024-01-01T00:00:00|x'),
+    b64(b'2024-01-01T00:00:00|1|2'), b64(b'yesterday|1'), b64(b'\xff\xfe|1'),
+])
+def test_cursor_rejects_tampered_input(token):
+    assert decode_cursor(token) is None
+
+
+def test_cursor_of_one_sort_is_rejected_by_the_other():
+    v = Video(id=1, created_at=datetime(2024, 1, 1), trend_score=1.0)
+    assert decode_cursor(encode_cursor(v, 'new'), 'trending') is None
+
+
+def test_feed_api_answers_400_to_bad_cursor(app):
+    assert app.test_client().get('/api/feed?cursor=bozuk').status_code == 400
+
+
+# ─── feed ───
+def walk(limit, **kw):
+    seen, cursor = [], None
+    while True:
+        page, token = feed_page(cursor=cursor, limit=limit, **kw)
+        seen += [v.id for v in page]
+        if not token: return seen
+        cursor = decode_cursor(token, kw.get('sort', 'new'))
+
+
+@pytest.mark.parametrize('limit', [1, 4, 7, 40])
+def test_feed_pages_have_no_duplicates_or_gaps(limit):
+    a, b = make_user('a'), make_user('b')
+    tie = datetime(2024, 3, 1)
+    videos = make_video(a, 10) + make_video(b, 8, created_at=tie) + make_video(a, 5, created_at=tie)
+    db.session.add(Video(user_id=b.id, filename='bekleyen.mp4', moderation_status='pending')); db.session.commit()
+    expected = [v.id for v in sorted(videos, key=lambda v: (v.created_at, v.id), reverse=True)]
+    assert walk(limit) == expected
+
+
+def test_trending_pages_have_no_duplicates_or_gaps():
+    a = make_user('a')
+    videos = make_video(a, 6, trend_score=2.0) + make_video(a, 6, trend_score=0.5) + make_video(a, 3, trend_score=9.0)
+    expected = [v.id for v in sorted(videos, key=lambda v: (v.trend_score, v.id), reverse=True)]
+    assert walk(4, sort='trending') == expected
+
+
+def test_feed_stays_stable_when_videos_arrive_between_pages():
+    a = make_user('a')
+    videos = make_video(a, 9)
+    page, token = feed_page(limit=4)
+    make_video(a, 3, t0=datetime(2030, 1, 1))          # newer uploads land above the cursor
+    rest, cursor = [], decode_cursor(token)
+    while cursor:
+        more, token = feed_page(cursor=cursor, limit=4)
+        rest += more; cursor = decode_cursor(token) if token else None
+    assert [v.id for v in page + rest] == [v.id for v in reversed(videos)]
+
+
+def test_feed_filters_category():
+    a = make_user('a')
+    music = make_video(a, 3, category='Müzik')
+    make_video(a, 3, category='Oyun')
+    assert walk(2, category='Müzik') == [v.id for v in reversed(music)]
+
+
+# ─── chat ───
+def test_chat_page_ordering():
+    a, b, c = make_user('a'), make_user('b'), make_user('c')
+    t0, msgs = datetime(2024, 1, 1), []
+    for i in range(23):
+        s, r = (a, b) if i % 3 else (b, a)
+        msgs.append(Message(sender_id=s.id, recipient_id=r.id, body=str(i), timestamp=t0 + timedelta(seconds=i // 2)))
+        db.session.add(Message(sender_id=a.id, recipient_id=c.id, body='başka', timestamp=t0 + timedelta(seconds=i)))
+    db.session.add_all(msgs); db.session.commit()
+    expected = [m.id for m in sorted(msgs, key=lambda m: (m.timestamp, m.id))]
+
+    page, more = chat_page(a.id, b.id, limit=5)
+    assert [m.id for m in page] == expected[-5:] and more
+    pages, before = [], None
+    while True:
+        page, more = chat_page(b.id, a.id, before_id=before, limit=5)
+        pages = [m.id for m in page] + pages
+        if not more: break
+        before = page[0].id
+    assert pages == expected
+
+
+def test_chat_page_ignores_cursor_from_another_pair():
+    a, b, c = make_user('a'), make_user('b'), make_user('c')
+    other = Message(sender_id=a.id, recipient_id=c.id, body='x', timestamp=datetime(2024, 1, 1))
+    db.session.add_all([other, Message(sender_id=a.id, recipient_id=b.id, body='y', timestamp=datetime(2024, 1, 1))])
+    db.session.commit()
+    assert chat_page(a.id, b.id, before_id=other.id) == ([], False)
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pytest
+
+import app as A
+from conftest import make_user, make_video
+from app import (db, purge_loop, tombstone_user, tombstone_video, bookmarks, comment_likes, followers, likes,
+                 Comment, Conversation, Message, Notification, PurgeJob, Report, TranscodeJob, UploadSession, User, Video)
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(A, 'PURGE_BATCH', 2)      # every step needs several batches
+
+
+def leftovers(uids=(), vids=()):
+    """Rows in any table that still point at one of the given users or videos."""
+    found = []
+    for table in db.metadata.sorted_tables:
+        for col in table.columns:
+            for fk in col.foreign_keys:
+                ids = uids if fk.column.table.name == 'user' else vids if fk.column.table.name == 'video' else ()
+                if ids and db.session.execute(db.select(db.func.count()).select_from(table)
+                                              .where(col.in_(ids))).scalar():
+                    found.append(f'{table.name}.{col.name}')
+    if vids and Notification.query.filter(Notification.post_id.in_(vids),
+                                          Notification.type.in_(A.VIDEO_NOTIFS)).count():
+        found.append('notification.post_id')
+    return found
+
+
+def populate(victim, others):
+    mine = make_video(victim, 3)
+    theirs = make_video(others[0], 2)
+    now = datetime.utcnow()
+    for o in others:
+        for v in mine + theirs:
+            db.session.execute(likes.insert().values(user_id=o.id, video_id=v.id))
+            db.session.execute(bookmarks.insert().values(user_id=o.id, video_id=v.id))
+        db.session.execute(followers.insert().values(follower_id=o.id, followed_id=victim.id))
+        db.session.execute(followers.insert().values(follower_id=victim.id, followed_id=o.id))
+    for v in theirs:
+        db.session.execute(likes.insert().values(user_id=victim.id, video_id=v.id))
+    for v in mine + theirs:
+        top = Comment(text='x', user_id=others[0].id, video_id=v.id)
+        db.session.add(top); db.session.flush()
+        for u in [victim] + others:
+            reply = Comment(text='y', user_id=u.id, video_id=v.id, parent_id=top.id)
+            db.session.add(reply); db.session.flush()
+            db.session.execute(comment_likes.insert().values(user_id=victim.id, comment_id=reply.id))
+        db.session.add(Report(reporter_id=victim.id, video_id=v.id, reason='r'))
+        db.session.add(TranscodeJob(video_id=v.id, state='done'))
+        db.session.add(Notification(recipient_id=v.user_id, sender_id=others[-1].id, type='like', post_id=v.id))
+    for o in others:
+        db.session.add_all([Message(sender_id=victim.id, recipient_id=o.id, body='m', timestamp=now),
+                            Message(sender_id=o.id, recipient_id=victim.id, body='m', timestamp=now),
+                            Conversation(user_a_id=min(o.id, victim.id), user_b_id=max(o.id, victim.id)),
+                            Notification(recipient_id=o.id, sender_id=victim.id, type='follow')])
+    db.session.add(UploadSession(id='u' * 32, user_id=victim.id, ext='mp4', size=10, created_at=now))
+    db.session.commit()
+    return [v.id for v in mine], [v.id for v in theirs]
+
+
+def test_user_purge_leaves_no_dependent_rows():
+    victim, others = make_user('gidici'), [make_user('b'), make_user('c')]
+    mine, theirs = populate(victim, others)
+    uid = victim.id
+    tombstone_user(victim); db.session.commit()
+    purge_loop('test', once=True)
+    assert db.session.get(User, uid) is None
+    assert Video.query.filter(Video.id.in_(mine)).count() == 0
+    assert leftovers([uid], mine) == []
+    assert PurgeJob.query.one().state == 'done'
+    assert Video.query.filter(Video.id.in_(theirs)).count() == 2     # bystanders keep their own rows
+    assert Comment.query.filter(Comment.video_id.in_(theirs)).count() == len(theirs) * (1 + len(others))
+
+
+def test_video_purge_leaves_no_dependent_rows():
+    owner, others = make_user('sahip'), [make_user('b'), make_user('c')]
+    mine, theirs = populate(owner, others)
+    oid = owner.id
+    tombstone_video(db.session.get(Video, mine[0])); db.session.commit()
+    purge_loop('test', once=True)
+    assert leftovers(vids=mine[:1]) == []
+    assert Video.query.filter(Video.id.in_(mine[1:])).count() == 2
+    assert db.session.get(User, oid).deleted_at is None